@@ -23,6 +23,10 @@ It will record all moves and the end state of the game. Check
 the documentation pdf for more details.
 * "-switch" or "-s" will invert the order of agents playing. Use
 this argument to quickly test your agent as Blue instead of Red.
+* "port=n" serves the game on port n instead of 1234. port=0 picks
+a free port, so several games can run at once. Agents read the port
+from the HEX_PORT environment variable, or get it in their command
+through "{port}".
 """
 import shlex
 import subprocess
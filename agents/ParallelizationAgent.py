@@ -4,17 +4,38 @@
 # -----------------------------------------------------------
 
 import socket
+from os import environ
 
 from gamestate import GameState
 from RootThreadingAgent import RootThreadingAgent
-from utils import extract_last_move_from_board
+from tree_parallel import TreeParallelEngine
+from utils import extract_last_move_from_board, Ponderer
+from time_manager import TimeManager
+from search_profile import SearchProfile
 
 import argparse
 
 parser = argparse.ArgumentParser(description='Parallelization Agent')
 parser.add_argument('--processes', '-p', type=int, default=1, dest = 'processes',
                     help='Number f processes to use')
+parser.add_argument('--tree', action='store_true', dest='tree',
+                    help='Share one tree between threads instead of one tree per process')
+parser.add_argument('--ponder', action='store_true', dest='ponder',
+                    help='Keep searching while the opponent thinks')
+parser.add_argument('--profile', dest='profile', default=None,
+                    help='Append one JSON line with the phase times of each search to this file')
 args = parser.parse_args()
+profile = SearchProfile(open(args.profile, "a")) if args.profile else None
+
+
+def make_engine(state):
+    """
+    Return the parallel engine selected on the command line.
+    """
+    if args.tree:
+        return TreeParallelEngine(state, threads=args.processes, profile=profile)
+    return RootThreadingAgent(state, processes=args.processes, profile=profile)
+
 
 class MCTSAgent():
     """
@@ -25,12 +46,14 @@ class MCTSAgent():
     ----------
     host : str
         host to connect with other agents
-    port : str
-        port used for the socket
-    time_limit : int
-        maximum number of seconds allowed per move
+    port : int
+        port used for the socket, read from HEX_PORT
+    clock : TimeManager
+        budgets the search time of each move from the clock left
     agent: Agent
         Agent engine object used to compute moves
+    ponderer: Ponderer
+        searches on the opponent's clock, None when pondering is off
 
 
     Methods
@@ -57,11 +80,11 @@ class MCTSAgent():
     """
 
     host = "127.0.0.1"
-    port = 1234
-    time_limit = 4
+    # the referee passes the port of the game, 1234 when it runs alone
+    port = int(environ.get("HEX_PORT", 1234))
     agent = None
 
-    def __init__(self, board_size=11):
+    def __init__(self, board_size=11, ponder=False):
         """
         Constructs all the necessary attributes for the Agent object.
 
@@ -83,7 +106,9 @@ class MCTSAgent():
         self.board_size = board_size
         self.colour = ""
         self.turn_count = 0
-        self.agent = RootThreadingAgent(GameState(board_size), processes=args.processes)
+        self.agent = make_engine(GameState(board_size))
+        self.ponderer = Ponderer() if ponder else None
+        self.clock = TimeManager()
 
     def run(self):
         """
@@ -91,7 +116,13 @@ class MCTSAgent():
         """
 
         while True:
+            # keep searching until the opponent replies
+            if self.ponderer is not None:
+                self.ponderer.start(self.agent)
             data = self.s.recv(1024)
+            self.clock.start_turn()
+            if self.ponderer is not None:
+                self.ponderer.stop()
             if not data:
                 break
 
@@ -125,7 +156,7 @@ class MCTSAgent():
                     self.colour = self.opp_colour()
                     if s[3] == self.colour:
                         last_move = extract_last_move_from_board(s[2])
-                        self.agent = RootThreadingAgent(GameState(11), processes=args.processes)
+                        self.agent = make_engine(GameState(11))
                         self.agent.move((last_move[0], last_move[1]))
                         self.make_move()
 
@@ -157,7 +188,7 @@ class MCTSAgent():
         Perform a search for a limited amount of time
         Get the best move and send it
         """
-        self.agent.search(self.time_limit)
+        self.agent.search(self.clock.budget(self.agent.root_state), stop_early=True)
 
 
         move = self.agent.best_move()
@@ -183,12 +214,13 @@ class MCTSAgent():
             if self.test_swap(action):
                 self.s.sendall(bytes("SWAP\n", "utf-8"))
                 # self.colour = self.opp_colour()
-                self.agent = RootThreadingAgent(GameState(11), processes=args.processes)
+                self.agent = make_engine(GameState(11))
                 self.agent.move((action[0], action[1]))
             else:
                 self.choose_move()
         else:
             self.choose_move()
+        self.clock.end_turn()
         self.turn_count += 1
 
     def opp_colour(self):
@@ -204,5 +236,5 @@ class MCTSAgent():
             return "None"
 
 if (__name__ == "__main__"):
-    agent = MCTSAgent()
+    agent = MCTSAgent(ponder=args.ponder)
     agent.run()
@@ -1,28 +1,118 @@
 # keep this line for cython directives
 import multiprocessing as mlp
+from array import array
+from threading import Lock, Thread
+from time import sleep
+
+from gamestate import GameState
+from meta import GameMeta
+from rave_mcts import RaveMCTSEngine
+from search_profile import SearchProfile
 
 class RootThread(mlp.Process):
   """
   Implementation of Root parallelization in MCTS agent
 
+  A long lived worker process that owns one engine for the whole game.
+  The parent only sends commands through a pipe and the worker only sends
+  back the visit counts of the root children, so no tree ever leaves the
+  process that built it.
+
+  Commands are (name, argument) tuples:
+    ("search", (time_budget, stop_early, iterations, node_limit))
+                           -> (visits, statistics, profile)
+    ("move", move)         -> nothing
+    ("set", (board, turn)) -> nothing
+    ("stop", None)         -> nothing, the worker exits
+
+  A search ends early when the parent sets the shared interrupt event,
+  which is how the parent stops a ponder. The event is only forwarded to
+  the engine while a search runs, so an interrupt meant for a search that
+  already ended never reaches the next one.
+
+  Each worker seeds its engine with its own seed, derived by the parent
+  from the seed of the agent, so workers search independent streams.
+
+  With profile set the engine profiles every search and the profile is sent
+  back with the visits, otherwise None is sent in its place.
+
   """
-  def __init__(self, agent, time, q1, q2):
-    mlp.Process.__init__(self)
-    self.agent = agent
-    self.agent_q = q1
-    self.moves_q = q2
-    self.time = time
+  def __init__(self, board_size, conn, interrupt, seed=None, profile=False):
+    mlp.Process.__init__(self, daemon=True)
+    self.board_size = board_size
+    self.conn = conn
+    self.interrupt = interrupt
+    self.seed = seed
+    self.profile = profile
+    # guards searching and the interrupted flag of the engine against the
+    # thread forwarding the event
+    self.lock = Lock()
+    self.searching = False
 
   def run(self):
-    self.agent.search(self.time)
-    moves = {}
-    for child in self.agent.root.children.values():
-      moves[child.move] = child.counter_visits
-    self.agent_q.put(self.agent)
-    self.moves_q.put(moves)
-
-  def get_result(self):
-    return self.agent_q.get()
-
-  def get_moves(self):
-    return self.moves_q.get()
\ No newline at end of file
+    agent = RaveMCTSEngine(GameState(self.board_size), seed=self.seed,
+                           profile=SearchProfile() if self.profile else None)
+    Thread(target=forward_interrupt, args=(self, agent), daemon=True).start()
+    while True:
+      command, argument = self.conn.recv()
+      if command == "search":
+        # an interrupt sent before the command arrived ends it at once
+        with self.lock:
+          self.searching = True
+          agent.interrupted = self.interrupt.is_set()
+        agent.search(*argument)
+        with self.lock:
+          self.searching = False
+        self.conn.send((root_visits(agent, self.board_size), agent.statistics(), agent.profile))
+      elif command == "move":
+        agent.move(argument)
+      elif command == "set":
+        agent.set_gamestate(state_from_board(*argument))
+      elif command == "stop":
+        break
+    self.conn.close()
+
+
+def forward_interrupt(worker, agent):
+  """
+  Interrupt the search of the engine while the parent holds the event set,
+  runs in a thread of the worker for its whole life. The event is checked
+  again under the lock of the worker, so a search started after the parent
+  cleared it is left running.
+
+  """
+  while True:
+    worker.interrupt.wait()
+    with worker.lock:
+      if worker.searching and worker.interrupt.is_set():
+        agent.interrupted = True
+    sleep(0.01)
+
+
+def root_visits(agent, board_size):
+  """
+  Return the visit counts of the root children of an engine as a flat
+  array indexed by row * board_size + column, zero for moves not in the tree.
+
+  """
+  visits = array('i', bytes(4 * board_size * board_size))
+  for index, count in agent.pool.child_visits(agent.root).items():
+    visits[index] = count
+  return visits
+
+
+def state_from_board(board, turn):
+  """
+  Rebuild a GameState from its board array and the player to move, the
+  representation sent to workers instead of pickling states.
+
+  """
+  state = GameState(len(board))
+  for x, row in enumerate(board):
+    for y, cell in enumerate(row):
+      if cell == GameMeta.PLAYERS["red"]:
+        state.place_red((x, y))
+      elif cell == GameMeta.PLAYERS["blue"]:
+        state.place_blue((x, y))
+  state.to_play = turn
+  return state
@@ -1,89 +1,132 @@
 # keep this line for cython directives
-from rave_mcts import *
+from copy import deepcopy
+from os import urandom
+from fastrand cimport derive_seed
+from gamestate import GameState
+from meta import GameMeta
 from RootThread import RootThread
 import multiprocessing as mlp
-import random
+from random import Random
 
 class RootThreadingAgent:
   """
   Implementation of root parallelization in MCTS.
   different agents use different cores to search
-  and then according to moves available in current 
-  state of all agents, the best move (the move 
+  and then according to moves available in current
+  state of all agents, the best move (the move
   with the most number of playouts) is chosen.
 
+  The agents live in a pool of worker processes started once and kept for
+  the whole game. Each move only sends the played moves and the search
+  budget to the workers, which answer with the visit counts of their root
+  children.
+
+  Setting interrupted ends the running search of every worker early.
+
+  Worker i seeds its engine with derive_seed(seed, 1 + i) and ties between
+  moves are broken from derive_seed(seed, 0), so the same seed and
+  iteration budget always give the same move.
+
+  Passing a SearchProfile makes every worker profile its searches, the
+  profiles of the workers are merged into it after each search.
+
   """
-  
-  def __init__(self, state=GameState(11), processes=8):
-    self.agents = []
+
+  def __init__(self, state=GameState(11), processes=8, seed=None, profile=None):
+    self.root_state = deepcopy(state)
     self.threads = processes
+    self.seed = seed if seed is not None else int.from_bytes(urandom(8), "little")
+    self.random = Random(derive_seed(self.seed, 0))
+    self.profile = profile
     self.workers = []
+    self.connections = []
     self.results = []
+    self.interrupt = mlp.Event()
     for i in range(self.threads):
-      self.agents.append(RaveMCTSEngine(state))
+      parent_conn, child_conn = mlp.Pipe()
+      w = RootThread(state.size, child_conn, self.interrupt, derive_seed(self.seed, 1 + i),
+                     profile is not None)
+      w.start()
+      child_conn.close()
+      self.workers.append(w)
+      self.connections.append(parent_conn)
+
+    # workers start from an empty board, only send them a started game
+    if state.get_rb_played() != (0, 0):
+      self.set_gamestate(state)
 
     self.current_stats = None
 
-  def search(self, time_budget):
+  @property
+  def interrupted(self):
     """
-    Search and update the search tree for a 
-    specified amount of time in secounds.
+    Whether the searches of the workers are asked to end early.
 
     """
-    for agent in self.agents:
-      w = RootThread(agent, time_budget, mlp.Queue(), mlp.Queue())
-      self.workers.append(w)
-
-    for w in self.workers:
-      w.start()
+    return self.interrupt.is_set()
 
-    self.results = [w.get_moves() for w in self.workers]
-    self.agents = [w.get_result() for w in self.workers]
+  @interrupted.setter
+  def interrupted(self, value):
+    if value:
+      self.interrupt.set()
+    else:
+      self.interrupt.clear()
 
-    for w in self.workers:
-      w.join()
+  def search(self, time_budget=GameMeta.INF, stop_early=False, iterations=0, node_limit=0):
+    """
+    Search and update the search tree for a
+    specified amount of time in secounds. The iterations and node_limit
+    counts, zero for no limit, apply to each worker. With stop_early each
+    worker also stops once the rest of its budget can not change its most
+    visited move.
 
-    del self.workers[:]
+    """
+    for conn in self.connections:
+      conn.send(("search", (time_budget, stop_early, iterations, node_limit)))
+
+    replies = [conn.recv() for conn in self.connections]
+    self.results = [visits for visits, _, _ in replies]
+    # rollouts and nodes of all the workers over the longest search
+    self.current_stats = (sum(stats[0] for _, stats, _ in replies),
+                          sum(stats[1] for _, stats, _ in replies),
+                          max(stats[2] for _, stats, _ in replies))
+    if self.profile is not None:
+      self.profile.clear()
+      for _, _, profile in replies:
+        self.profile.merge(profile)
+      self.profile.report({"engine": type(self).__name__,
+                           "ply": self.root_state.red_played + self.root_state.blue_played,
+                           "rollouts": self.current_stats[0], "nodes": self.current_stats[1],
+                           "seconds": self.current_stats[2]})
 
   def best_move(self):
     """
     Return the best move according to the current tree.
 
     """
-    
-    if (self.agents[0].root_state.winner != GameMeta.PLAYERS["none"]):
+
+    if (self.root_state.winner() != GameMeta.PLAYERS["none"]):
       return GameMeta.GAME_OVER
 
-    res = {}
-    moves = list(self.results[0].keys())
-    for move in moves:
-      for item in self.results:
-        if move in list(res.keys()):
-          res[move] += item[move]
-        else:
-          res[move] = item[move]
-
-    largest_key = []
-    largest_value = 0
-    for key, value in res.items():
-      if value > largest_value:
-        largest_value = value
-        largest_key = [key]
-      elif value == largest_value:
-        largest_key.append(key)
-    bestchild = random.choice(largest_key)
+    size = self.root_state.size
+    res = [sum(visits) for visits in zip(*self.results)]
+
+    largest_value = max(res)
+    largest_key = [(i // size, i % size) for i, value in enumerate(res) if value == largest_value]
+    bestchild = self.random.choice(largest_key)
     del self.results[:]
     return bestchild
 
   def move(self, move):
     """
-    Make the passed move and update the tree approriately. It is 
+    Make the passed move and update the tree approriately. It is
     designed to let the player choose an action manually (which might
     not be the best action).
 
     """
-    for agent in self.agents:
-      agent.move(move)
+    self.root_state.play(move)
+    for conn in self.connections:
+      conn.send(("move", move))
 
   def set_gamestate(self, state):
     """
@@ -92,13 +135,35 @@ class RootThreadingAgent:
     state.
 
     """
-    for agent in self.agents:
-      agent.set_gamestate(state)
+    self.root_state = deepcopy(state)
+    for conn in self.connections:
+      conn.send(("set", (state.board.tolist(), state.turn())))
 
   def statistics(self):
     """
-    Return the statistics of the tree.
+    Return the rollouts and tree nodes of all the workers and the time of
+    the longest search.
 
     """
-    return self.agents[0].statistics()
+    return self.current_stats
+
+  def close(self):
+    """
+    Stop the worker processes.
+
+    """
+    for conn in self.connections:
+      try:
+        conn.send(("stop", None))
+        conn.close()
+      except OSError:
+        pass
+    for w in self.workers:
+      w.join(1)
+      if w.is_alive():
+        w.terminate()
+    del self.workers[:]
+    del self.connections[:]
 
+  def __del__(self):
+    self.close()
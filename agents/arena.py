@@ -0,0 +1,243 @@
+# -----------------------------------------------------------
+# Group 4 - In-process matches between search engines
+# -----------------------------------------------------------
+"""
+Play engines against each other inside one process. The referee of src
+starts two agent processes per game, imports the extensions in each of them
+and sends the whole board over a socket every turn; an Arena hands moves
+from one engine object to the other directly and keeps the referee rules:
+a clock of GameMeta.MAXIMUM_TIME seconds per player for the whole game,
+the pie rule on the second turn and a loss for an illegal move or a
+timeout.
+
+Build the extensions first (python3 setup.py build_ext --inplace) and run
+from this directory:
+
+    python3 arena.py first=rave second=qrave [games=10] [size=11]
+                     [move_time=0.5 | iterations=2000] [seed=1]
+                     [out=results.json]
+
+The engines swap colours every game and each game builds them afresh with
+seeds drawn from seed, so a run with iterations is reproducible.
+"""
+import json
+from random import Random
+from sys import argv, stderr
+from time import monotonic
+
+from benchmark import ENGINES
+from gamestate import GameState
+from meta import GameMeta
+from time_manager import TimeManager
+
+# how a game ended, the names EndState gives the referee endings
+WIN = "WIN"
+BAD_MOVE = "BAD_MOVE"
+TIMEOUT = "TIMEOUT"
+
+
+class Arena:
+    """
+    Referee for engine objects, anything with search(time_budget, ...),
+    best_move() and move(move). Both engines follow every move of the game,
+    their own included, so their roots always match the board.
+
+    A turn is charged to the player from the moment its engine is told the
+    opponent's move to the moment it has followed its own, and a player whose
+    clock runs out loses like a referee timeout. A move off the board, on an
+    occupied cell or an exception raised by the engine loses like an illegal
+    message. On the second turn swap(state), when passed, decides whether
+    the second player takes over the first stone; the players then trade
+    colours and the first player moves again, with the same board.
+    ...
+
+    Attributes
+    ----------
+    board_size : int
+        side of the board
+    time_limit : float
+        seconds each player has for the whole game
+    move_time : float
+        seconds searched for each move, None to budget every move from the
+        clock left like the agents do
+    iterations : int
+        simulations searched for each move, 0 for no limit
+
+    Methods
+    -------
+    play(first: object, second: object, swap: function):
+        Play one game and return how it ended.
+    """
+
+    def __init__(self, board_size=11, time_limit=GameMeta.MAXIMUM_TIME, move_time=None, iterations=0):
+        """
+        Parameters:
+                board_size (int): side of the board
+                time_limit (float): seconds each player has for the game
+                move_time (float): seconds searched for each move, the
+                                   clock left is budgeted if omitted
+                iterations (int): simulations searched for each move, 0
+                                  for no limit
+        """
+        self.board_size = board_size
+        self.time_limit = time_limit
+        self.move_time = move_time
+        self.iterations = iterations
+
+    def _budget(self, clock, state):
+        """
+        Return the seconds to search for the next move of a player.
+        """
+        if self.iterations:
+            return GameMeta.INF
+        if self.move_time is not None:
+            return self.move_time
+        return clock.budget(state)
+
+    def _legal(self, state, move):
+        """
+        Return whether move is a free cell of the board of state.
+        """
+        if not (isinstance(move, tuple) and len(move) == 2):
+            return False
+        x, y = move
+        if not (0 <= x < self.board_size and 0 <= y < self.board_size):
+            return False
+        return state.board[x, y] == GameMeta.PLAYERS['none']
+
+    def play(self, first, second, swap=None):
+        """
+        Play one game, first moving first as red. Both engines must start
+        from an empty board of board_size.
+
+        Parameters:
+                first (object): engine of the first player
+                second (object): engine of the second player
+                swap (function): called with the state after the first
+                                 move, True makes the second player swap
+
+        Returns:
+                dict: winner, 1 or 2 for the first or second player,
+                      winner_colour, "R" or "B", end, one of WIN, BAD_MOVE
+                      and TIMEOUT, turns, swapped and the seconds used by
+                      each player
+        """
+        state = GameState(self.board_size)
+        engines = [first, second]
+        clocks = [TimeManager(self.time_limit), TimeManager(self.time_limit)]
+        # index in engines of the player of each colour
+        colours = {GameMeta.PLAYERS['red']: 0, GameMeta.PLAYERS['blue']: 1}
+        swapped = False
+        last_move = None
+        turn = 1
+        end = WIN
+
+        while state.winner() == GameMeta.PLAYERS['none']:
+            player = colours[state.turn()]
+            engine, clock = engines[player], clocks[player]
+            clock.start_turn()
+            move = None
+            played = False
+            try:
+                # tell the engine the move of the opponent, at most once
+                if last_move is not None:
+                    engine.move(last_move)
+                    last_move = None
+
+                if turn == 2 and swap is not None and swap(state):
+                    # the second player takes over the red stone and the
+                    # first player, whose engine already has it, answers
+                    # it as blue
+                    clock.end_turn()
+                    colours = {GameMeta.PLAYERS['red']: 1, GameMeta.PLAYERS['blue']: 0}
+                    swapped = True
+                    turn += 1
+                    if clock.remaining() <= 0:
+                        end = TIMEOUT
+                        break
+                    continue
+
+                if self.iterations:
+                    engine.search(self._budget(clock, state), iterations=self.iterations)
+                else:
+                    engine.search(self._budget(clock, state), stop_early=True)
+                move = engine.best_move()
+                # the engine follows its own move on its clock, tree reuse
+                # included
+                if self._legal(state, move):
+                    state.play(move)
+                    engine.move(move)
+                    played = True
+            except Exception as e:
+                print(f"Engine {player + 1} raised: {e!r}", file=stderr)
+            clock.end_turn()
+
+            if clock.remaining() <= 0:
+                end = TIMEOUT
+                break
+            if not played:
+                end = BAD_MOVE
+                break
+
+            last_move = move
+            turn += 1
+
+        if end == WIN:
+            winner = colours[state.winner()]
+        else:
+            # the player whose turn it was lost
+            winner = 1 - player
+        return {
+            "winner": winner + 1,
+            "winner_colour": "R" if colours[GameMeta.PLAYERS['red']] == winner else "B",
+            "end": end,
+            "turns": turn - 1,
+            "swapped": swapped,
+            "seconds": [clocks[0].used, clocks[1].used],
+        }
+
+
+def main():
+    options = dict(argument.split("=", 1) for argument in argv[1:] if "=" in argument)
+    names = [options.get("first", "rave"), options.get("second", "qrave")]
+    for name in names:
+        if name not in ENGINES:
+            print(f"ERROR: Unknown engine {name}, expected one of {', '.join(ENGINES)}.", file=stderr)
+            return
+    games = int(options.get("games", 10))
+    size = int(options.get("size", 11))
+    move_time = float(options["move_time"]) if "move_time" in options else None
+    iterations = int(options.get("iterations", 0))
+    random = Random(int(options.get("seed", 1)))
+
+    arena = Arena(size, move_time=move_time, iterations=iterations)
+    results = []
+    wins = [0, 0]
+    for game in range(games):
+        # alternate who moves first, engine i is always names[i]
+        order = [0, 1] if game % 2 == 0 else [1, 0]
+        engines = [ENGINES[names[i]](GameState(size), random.getrandbits(64)) for i in range(2)]
+        start = monotonic()
+        result = arena.play(engines[order[0]], engines[order[1]])
+        for engine in engines:
+            if hasattr(engine, "close"):
+                engine.close()
+        winner = order[result["winner"] - 1]
+        wins[winner] += 1
+        result.update({"first": names[order[0]], "second": names[order[1]],
+                       "winner_engine": names[winner], "wall_s": monotonic() - start})
+        results.append(result)
+        print(f"game {game + 1:4}: {names[winner]} ({result['winner_colour']}) won by {result['end']} "
+              f"in {result['turns']} turns, {wins[0]}-{wins[1]}", file=stderr)
+
+    report = {"engines": names, "size": size, "move_time": move_time, "iterations": iterations,
+              "wins": wins, "games": results}
+    if "out" in options:
+        with open(options["out"], "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
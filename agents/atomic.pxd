@@ -0,0 +1,33 @@
+# keep this line for cython directives
+
+# thin wrappers over the gcc/clang __atomic builtins used to share a search
+# tree between threads that run without the gil
+cdef extern from *:
+    """
+    static inline int atomic_load_int(int * p) {
+        return __atomic_load_n(p, __ATOMIC_ACQUIRE);
+    }
+    static inline void atomic_store_int(int * p, int value) {
+        __atomic_store_n(p, value, __ATOMIC_RELEASE);
+    }
+    static inline int atomic_add_int(int * p, int value) {
+        return __atomic_fetch_add(p, value, __ATOMIC_RELAXED);
+    }
+    static inline int atomic_cas_int(int * p, int expected, int desired) {
+        return __atomic_compare_exchange_n(p, &expected, desired, 0,
+                                           __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE);
+    }
+    static inline void atomic_add_double(double * p, double value) {
+        double expected, desired;
+        __atomic_load(p, &expected, __ATOMIC_RELAXED);
+        do {
+            desired = expected + value;
+        } while (!__atomic_compare_exchange(p, &expected, &desired, 1,
+                                            __ATOMIC_RELAXED, __ATOMIC_RELAXED));
+    }
+    """
+    int atomic_load_int(int * p) nogil
+    void atomic_store_int(int * p, int value) nogil
+    int atomic_add_int(int * p, int value) nogil
+    bint atomic_cas_int(int * p, int expected, int desired) nogil
+    void atomic_add_double(double * p, double value) nogil
@@ -0,0 +1,163 @@
+# keep this line for cython directives
+
+import numpy as np
+
+from meta import GameMeta
+
+
+class BatchRollout:
+    """
+    Rollout policy that simulates many random games from one state with a
+    handful of NumPy calls instead of one Python loop per game.
+
+    Every playout is a uniformly random fill of the empty cells, which ends
+    with the same winner as random play stopped at the first connection. The
+    fills of a batch are drawn as one array of random fill orders and all
+    winners are decided together by propagating reachability from the red
+    top edge through the red stones of every board at once.
+    ...
+
+    Attributes
+    ----------
+    size : int
+        side of the board
+    rng : numpy.random.Generator
+        source of the fill orders
+
+    Methods
+    -------
+    run(state: GameState, n: int):
+        Simulate n games from the passed state and return their winners.
+    stones(colour: int):
+        Boolean (n, size * size) array of the cells owned by the colour at the
+        end of each game of the last batch.
+    stones_played():
+        Red and blue stones on each board when the game was decided.
+    """
+
+    def __init__(self, size: int = 11, seed=None):
+        """
+        Parameters:
+                size (int): side of the board
+                seed (int): seed of the random generator, drawn from the
+                            operating system if omitted
+        """
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self._ranks = None
+        self._red = None
+        self._blue = None
+        self._winners = None
+        self._first = GameMeta.PLAYERS['red']
+        self._start = (0, 0)
+
+        # (destination, source) slices of a board for each neighbor direction
+        self._shifts = []
+        for dx, dy in GameMeta.NEIGHBOR_PATTERNS:
+            dst = (slice(None),
+                   slice(max(0, -dx), size - max(0, dx)),
+                   slice(max(0, -dy), size - max(0, dy)))
+            src = (slice(None),
+                   slice(max(0, dx), size - max(0, -dx)),
+                   slice(max(0, dy), size - max(0, -dy)))
+            self._shifts.append((dst, src))
+
+    def run(self, state, n: int):
+        """
+        Simulate n random games from the passed state.
+
+        Returns:
+            numpy.ndarray: winner of every game
+        """
+        red, blue = GameMeta.PLAYERS['red'], GameMeta.PLAYERS['blue']
+        board = state.board.ravel()
+        empty = np.flatnonzero(board == GameMeta.PLAYERS['none'])
+
+        # rank of each empty cell in the fill order of every game, the player
+        # to move gets the cells of even rank
+        orders = self.rng.random((n, empty.size)).argsort(axis=1)
+        ranks = np.full((n, board.size), -1, dtype=np.int32)
+        np.put_along_axis(ranks, empty[orders], np.arange(empty.size, dtype=np.int32), axis=1)
+        first = ranks % 2 == 0
+        filled = ranks >= 0
+
+        self._first = state.turn()
+        if self._first == red:
+            self._red = (board == red) | (filled & first)
+            self._blue = (board == blue) | (filled & ~first)
+        else:
+            self._red = (board == red) | (filled & ~first)
+            self._blue = (board == blue) | (filled & first)
+        self._ranks = ranks
+        self._start = state.get_rb_played()
+
+        # a filled board has exactly one winner, red if its top edge reaches
+        # the bottom one through red stones
+        reached = self._propagate(self._red.reshape(n, self.size, self.size))
+        self._winners = np.where(reached[:, -1, :].any(axis=1), red, blue)
+        return self._winners
+
+    def _propagate(self, owned):
+        """
+        Return the cells of every board connected to the first row through
+        owned cells.
+        """
+        reached = np.zeros_like(owned)
+        reached[:, 0, :] = owned[:, 0, :]
+        while True:
+            grown = reached.copy()
+            for dst, src in self._shifts:
+                grown[dst] |= reached[src]
+            grown &= owned
+            if np.array_equal(grown, reached):
+                return reached
+            reached = grown
+
+    def stones(self, colour: int):
+        """
+        Return a boolean (n, size * size) array of the cells owned by the
+        passed colour at the end of each game of the last batch.
+        """
+        return self._red if colour == GameMeta.PLAYERS['red'] else self._blue
+
+    def stones_played(self):
+        """
+        Return an (n, 2) array with the number of red and blue stones on each
+        board at the moment its game was decided, as games stopped at the
+        first connection.
+
+        The decisive stone of a game is the latest one on the winner's chain
+        that was completed first, so it is found by propagating the smallest
+        possible "latest rank" along every chain from the start edge.
+        """
+        n = self._ranks.shape[0]
+        red = GameMeta.PLAYERS['red']
+        red_wins = self._winners == red
+        big = np.iinfo(np.int32).max
+
+        # rank of each winner stone, stones placed before the playout count as
+        # rank -1, everything else can not be crossed; blue boards are
+        # transposed so both colours connect the first and last row
+        owned = np.where(red_wins[:, None], self._red, self._blue)
+        cost = np.where(owned, self._ranks, big).reshape(n, self.size, self.size)
+        cost[~red_wins] = cost[~red_wins].transpose(0, 2, 1)
+
+        latest = np.full_like(cost, big)
+        latest[:, 0, :] = cost[:, 0, :]
+        while True:
+            best = latest.copy()
+            for dst, src in self._shifts:
+                np.minimum(best[dst], latest[src], out=best[dst])
+            np.maximum(best, cost, out=best)
+            if np.array_equal(best, latest):
+                break
+            latest = best
+
+        played = latest[:, -1, :].min(axis=1) + 1
+        first_count = (played + 1) // 2
+        second_count = played // 2
+        if self._first == red:
+            counts = (first_count, second_count)
+        else:
+            counts = (second_count, first_count)
+        return np.stack((self._start[0] + counts[0], self._start[1] + counts[1]), axis=1)
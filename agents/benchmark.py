@@ -0,0 +1,187 @@
+# -----------------------------------------------------------
+# Group 4 - Benchmark of the search engines
+# -----------------------------------------------------------
+"""
+Run every engine over a fixed set of positions at several board sizes and
+report its throughput and memory use as JSON.
+
+Build the extensions first (python3 setup.py build_ext --inplace) and run
+from this directory:
+
+    python3 benchmark.py [sizes=5,7,11] [time=1] [engines=rave,qrave]
+                         [seed=1] [out=results.json] [baseline=old.json]
+
+Each case runs in a fresh process so its peak RSS only covers one engine.
+The results go to out, or to standard output when out is omitted, and
+with baseline every rate is also printed as a ratio of the stored run.
+"""
+import json
+import multiprocessing as mlp
+import platform
+import resource
+from os import cpu_count
+from random import Random
+from sys import argv, stderr
+from time import monotonic, strftime
+
+from gamestate import GameState
+from meta import GameMeta
+from lgrm_mcts import LGRMCTSEngine
+from naive_mcts import NaiveMCTSEngine
+from quality_rave import QRAVEEngine
+from rave_mcts import RaveMCTSEngine
+from RootThreadingAgent import RootThreadingAgent
+from tree_parallel import TreeParallelEngine
+
+ENGINES = {
+    "naive": lambda state, seed: NaiveMCTSEngine(state, seed=seed),
+    "rave": lambda state, seed: RaveMCTSEngine(state, seed=seed),
+    "qrave": lambda state, seed: QRAVEEngine(state, seed=seed),
+    "lgrm": lambda state, seed: LGRMCTSEngine(state, seed=seed),
+    "tree": lambda state, seed: TreeParallelEngine(state, seed=seed),
+    "root": lambda state, seed: RootThreadingAgent(state, processes=cpu_count(), seed=seed),
+}
+
+# measurements compared against a baseline, the last two are better lower
+RATES = ("rollouts_per_s", "nodes_per_s", "bytes_per_node", "first_move_s")
+
+
+def positions(size):
+    """
+    Return the fixed positions benchmarked at the passed board size as
+    (name, GameState) pairs: the empty board and a middle game with a
+    quarter of the cells filled by a seeded random game.
+    """
+    empty = GameState(size)
+    middle = GameState(size)
+    random = Random(size)
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    random.shuffle(cells)
+    for cell in cells[:size * size // 4]:
+        middle.play(cell)
+        if middle.winner() != GameMeta.PLAYERS["none"]:
+            middle = GameState(size)
+            break
+    return [("empty", empty), ("middle", middle)]
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process and of the largest
+    of its finished children in bytes.
+    """
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if platform.system() == "Darwin" else 1024
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def run_case(name, state, time_budget, seed, conn):
+    """
+    Build a fresh engine on the passed state, search it for time_budget
+    seconds and send the measurements of the case through conn.
+    """
+    baseline, _ = peak_rss()
+    start = monotonic()
+    engine = ENGINES[name](state, seed)
+    setup = monotonic() - start
+    engine.search(time_budget)
+    engine.best_move()
+    first_move = monotonic() - start
+    rollouts, nodes, run_time = engine.statistics()
+    workers = len(engine.workers) if name == "root" else 0
+    if workers:
+        engine.close()
+    own, children = peak_rss()
+    # the trees of root parallelization live in forked workers, each of
+    # them starting from the memory of this process
+    tree_memory = (children - baseline) * workers if workers else own - baseline
+    conn.send({
+        "rollouts": rollouts,
+        "nodes": nodes,
+        "seconds": run_time,
+        "rollouts_per_s": rollouts / run_time,
+        "nodes_per_s": nodes / run_time,
+        "peak_rss": own + children * workers,
+        "bytes_per_node": max(tree_memory, 0) / max(nodes, 1),
+        "setup_s": setup,
+        "first_move_s": first_move,
+    })
+    conn.close()
+
+
+def benchmark(engines, sizes, time_budget, seed):
+    """
+    Run every engine on every position of every size and return the list
+    of results, one dictionary per case.
+    """
+    results = []
+    for size in sizes:
+        for position, state in positions(size):
+            for name in engines:
+                parent_conn, child_conn = mlp.Pipe()
+                case = mlp.Process(target=run_case, args=(name, state, time_budget, seed, child_conn))
+                case.start()
+                child_conn.close()
+                result = {"engine": name, "size": size, "position": position}
+                result.update(parent_conn.recv())
+                case.join()
+                results.append(result)
+                print(f"{name:6} {size:3} {position:7} {result['rollouts_per_s']:12.0f} rollouts/s "
+                      f"{result['nodes_per_s']:12.0f} nodes/s {result['bytes_per_node']:8.0f} B/node",
+                      file=stderr)
+    return results
+
+
+def compare(results, baseline):
+    """
+    Print every rate of the passed results as a ratio of the same case in
+    a stored run, cases missing from the baseline are skipped.
+    """
+    def key(case):
+        return case["engine"], case["size"], case["position"]
+
+    old = {key(case): case for case in baseline["results"]}
+    print("engine   size position  " + "  ".join(f"{rate:>15}" for rate in RATES), file=stderr)
+    for case in results:
+        if key(case) not in old:
+            continue
+        ratios = (case[rate] / old[key(case)][rate] if old[key(case)][rate] else float("nan")
+                  for rate in RATES)
+        print(f"{case['engine']:6} {case['size']:6} {case['position']:8}  "
+              + "  ".join(f"{ratio:15.2f}" for ratio in ratios), file=stderr)
+
+
+def main():
+    options = dict(argument.split("=", 1) for argument in argv[1:] if "=" in argument)
+    engines = options.get("engines", ",".join(ENGINES)).split(",")
+    sizes = [int(size) for size in options.get("sizes", "5,7,11").split(",")]
+    time_budget = float(options.get("time", 1))
+    seed = int(options.get("seed", 1))
+    for name in engines:
+        if name not in ENGINES:
+            print(f"ERROR: Unknown engine {name}, expected one of {', '.join(ENGINES)}.", file=stderr)
+            return
+
+    report = {
+        "date": strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": cpu_count(),
+        "python": platform.python_version(),
+        "time": time_budget,
+        "seed": seed,
+        "results": benchmark(engines, sizes, time_budget, seed),
+    }
+    if "baseline" in options:
+        with open(options["baseline"]) as f:
+            compare(report["results"], json.load(f))
+    if "out" in options:
+        with open(options["out"], "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
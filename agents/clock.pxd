@@ -0,0 +1,35 @@
+# keep this line for cython directives
+
+from posix.time cimport clock_gettime, timespec, CLOCK_MONOTONIC
+
+# simulations run between two reads of the clock by a search loop
+cdef enum:
+    CLOCK_CHECK = 64
+
+
+cdef inline double monotonic() noexcept nogil:
+    """
+    Return the seconds of a clock that never goes backwards, read without
+    the gil and without a Python call.
+    """
+    cdef timespec ts
+    clock_gettime(CLOCK_MONOTONIC, &ts)
+    return ts.tv_sec + ts.tv_nsec * 1e-9
+
+
+cdef inline bint tick(int count, double deadline) noexcept:
+    """
+    Return whether a search loop running its count-th simulation is past
+    the deadline, the clock is only read every CLOCK_CHECK simulations.
+    Those checks also release the gil for a moment: compiled code never
+    hands the interpreter to other threads on its own, so this gives a
+    thread waiting for it, like an agent reading its socket while a search
+    ponders, a chance to run.
+    """
+    if count % CLOCK_CHECK != 0:
+        return False
+    if monotonic() >= deadline:
+        return True
+    with nogil:
+        pass
+    return False
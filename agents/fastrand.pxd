@@ -0,0 +1,64 @@
+# keep this line for cython directives
+
+from libc.stdint cimport uint32_t, uint64_t
+
+
+# state of a xorshift128+ pseudo random generator
+ctypedef struct Rng:
+    uint64_t s0
+    uint64_t s1
+
+
+cdef inline uint64_t splitmix64(uint64_t * x) noexcept nogil:
+    """
+    Advance a splitmix64 sequence, used to expand a seed into generator state.
+    """
+    cdef uint64_t z
+    x[0] += <uint64_t> 0x9E3779B97F4A7C15
+    z = x[0]
+    z = (z ^ (z >> 30)) * <uint64_t> 0xBF58476D1CE4E5B9
+    z = (z ^ (z >> 27)) * <uint64_t> 0x94D049BB133111EB
+    return z ^ (z >> 31)
+
+
+cdef inline void rng_seed(Rng * rng, uint64_t seed) noexcept nogil:
+    """
+    Seed the generator, equal seeds give equal sequences.
+    """
+    rng.s0 = splitmix64(&seed)
+    rng.s1 = splitmix64(&seed)
+
+
+cdef inline uint64_t derive_seed(uint64_t seed, uint64_t stream) noexcept nogil:
+    """
+    Return the seed of an independent stream derived from a base seed, so the
+    parts of an engine and its workers draw different numbers from one seed.
+    """
+    cdef uint64_t x = seed ^ (stream * <uint64_t> 0xD1B54A32D192ED03)
+    return splitmix64(&x)
+
+
+cdef inline uint64_t rng_next(Rng * rng) noexcept nogil:
+    """
+    Return the next 64 random bits.
+    """
+    cdef uint64_t s1 = rng.s0
+    cdef uint64_t s0 = rng.s1
+    rng.s0 = s0
+    s1 ^= s1 << 23
+    rng.s1 = s1 ^ s0 ^ (s1 >> 17) ^ (s0 >> 26)
+    return rng.s1 + s0
+
+
+cdef inline uint32_t rng_below(Rng * rng, uint32_t n) noexcept nogil:
+    """
+    Return a random integer in [0, n) by multiplying instead of dividing.
+    """
+    return <uint32_t> (((rng_next(rng) >> 32) * n) >> 32)
+
+
+cdef inline double rng_uniform(Rng * rng) noexcept nogil:
+    """
+    Return a random double in [0, 1).
+    """
+    return (rng_next(rng) >> 11) * (1.0 / 9007199254740992.0)
@@ -1,5 +1,23 @@
 # keep this line for cython directives
 
+from libc.stdint cimport uint64_t
+from unionfind cimport UnionFind
+from geometry cimport Geometry, NEIGHBOR_COUNT
+
+# largest supported board side, the matching number of cells and the number of
+# 64 bit words needed to store one bit per cell
+cdef enum:
+    MAX_SIZE = 19
+    MAX_CELLS = 361
+    BB_WORDS = 6
+
+ctypedef struct MoveRecord:
+    int index       # cell index of the stone
+    int colour      # colour of the stone
+    int to_play     # player to move before the stone was placed
+    int uf_mark     # union find history length before the stone was placed
+
+
 cdef class GameState:
     """
     Stores information representing the current state of a game of hex, namely
@@ -11,21 +29,38 @@ cdef class GameState:
     # move value of -1 indicates the game has ended so no move is possible
     # GAME_OVER = -1
 
-    # represent edges in the union find structure for detecting the connection
-    # for player 1 Edge1 is high and EDGE2 is low
-    # for player 2 Edge1 is left and EDGE2 is right
+    # edges are virtual nodes of the union find structures
+    # player 1 connects EDGE_TOP with EDGE_BOTTOM
+    # player 2 connects EDGE_LEFT with EDGE_RIGHT
 
     # neighbor_patterns = ((-1, 0), (0, -1), (-1, 1), (0, 1), (1, 0), (1, -1))
     cdef public:
         int size
         int to_play
-        object board
         int red_played
         int blue_played
-        object red_groups
-        object blue_groups
+        UnionFind red_groups
+        UnionFind blue_groups
+
+    cdef:
+        int n_cells
+        uint64_t red_bits[BB_WORDS]
+        uint64_t blue_bits[BB_WORDS]
+        uint64_t cell_bits[BB_WORDS]
+        MoveRecord history[MAX_CELLS]
+        int n_moves
+        Geometry geometry
+        # neighbor table of the geometry, read by every placed stone
+        const int * neighbor_table
 
     cpdef void play(self, tuple cell)
+    cpdef void play_index(self, int index)
+    cpdef void undo(self)
+    cpdef void copy_from(self, GameState other)
+    cdef void empty_mask(self, uint64_t * out) noexcept nogil
+    cdef int colour_at(self, int index) noexcept nogil
+    cdef void _place(self, int index, int colour)
+    cdef GameState _copy(self)
 
     cpdef void place_red(self, tuple cell)
     cpdef void place_blue(self, tuple cell)
@@ -33,4 +68,4 @@ cdef class GameState:
     cpdef int winner(self)
     cpdef list neighbors(self, tuple cell)
     cpdef list moves(self)
-    cpdef tuple get_rb_played(self)
\ No newline at end of file
+    cpdef tuple get_rb_played(self)
@@ -1,16 +1,31 @@
-
 # keep this line for cython directives
 
 from numpy import zeros, int_
-from unionfind cimport UnionFind
+cimport cython
+from libc.stdint cimport uint64_t
+from libc.string cimport memcpy, memset
+from unionfind cimport UnionFind, EDGE_TOP, EDGE_BOTTOM, EDGE_LEFT, EDGE_RIGHT
+from geometry cimport geometry, ON_TOP, ON_BOTTOM, ON_LEFT, ON_RIGHT
 from meta import GameMeta
-from copy import deepcopy
+
+
+# player constants resolved once so placing stones needs no lookups
+cdef int NONE = GameMeta.PLAYERS['none']
+cdef int RED = GameMeta.PLAYERS['red']
+cdef int BLUE = GameMeta.PLAYERS['blue']
+
+cdef inline bint test_bit(const uint64_t * bits, int index) noexcept nogil:
+    return (bits[index >> 6] >> (index & 63)) & 1
 
 
 cdef class GameState:
     """
     Stores information representing the current state of a game of hex, namely
     the board and the current turn. Also provides functions for playing game.
+
+    Stones are kept in one bitboard per colour, cells are addressed by the
+    integer index row * size + column and every placed stone is logged so it
+    can be taken back with undo().
     """
     # dictionary associating numbers with players
     # PLAYERS = {"none": 0, "red": 1, "blue": 2}
@@ -18,54 +33,209 @@ cdef class GameState:
     # move value of -1 indicates the game has ended so no move is possible
     # GAME_OVER = -1
 
-    # represent edges in the union find structure for detecting the connection
-    # for player 1 Edge1 is high and EDGE2 is low
-    # for player 2 Edge1 is left and EDGE2 is right
+    # edges are virtual nodes of the union find structures
+    # player 1 connects EDGE_TOP with EDGE_BOTTOM
+    # player 2 connects EDGE_LEFT with EDGE_RIGHT
 
     # neighbor_patterns = ((-1, 0), (0, -1), (-1, 1), (0, 1), (1, 0), (1, -1))
 
-    def __init__(self, size):
+    def __cinit__(self, int size):
         """
         Initialize the game board and give red first turn.
         Also create our union find structures for win checking.
         Args:
             size (int): The board size
         """
+        cdef int i
+
+        if not 0 < size <= MAX_SIZE:
+            raise ValueError(f"Board size must be between 1 and {MAX_SIZE}")
+
         self.size = size
-        self.to_play = GameMeta.PLAYERS['red']
-        self.board = zeros((size, size))
-        self.board = int_(self.board)
+        self.n_cells = size * size
+        self.to_play = RED
         self.red_played = 0
         self.blue_played = 0
-        self.red_groups = UnionFind()
-        self.blue_groups = UnionFind()
+        self.n_moves = 0
+        self.red_groups = UnionFind(size)
+        self.blue_groups = UnionFind(size)
+
+        memset(self.red_bits, 0, sizeof(self.red_bits))
+        memset(self.blue_bits, 0, sizeof(self.blue_bits))
+        memset(self.cell_bits, 0, sizeof(self.cell_bits))
+        for i in range(self.n_cells):
+            self.cell_bits[i >> 6] |= (<uint64_t> 1) << (i & 63)
+
+        self.geometry = geometry(size)
+        self.neighbor_table = self.geometry.neighbor_table
 
     def __deepcopy__(self, memo):
         """
         Deep copy of the game state.
         """
-        new_state = GameState(self.size)
-        new_state.to_play = self.to_play
-        new_state.board = self.board.copy()
-        new_state.red_played = self.red_played
-        new_state.blue_played = self.blue_played
-        new_state.red_groups = deepcopy(self.red_groups)
-        new_state.blue_groups = deepcopy(self.blue_groups)
+        return self._copy()
 
+    cdef GameState _copy(self):
+        cdef GameState new_state = GameState.__new__(GameState, self.size)
+        new_state.copy_from(self)
         return new_state
 
+    cpdef void copy_from(self, GameState other):
+        """
+        Overwrite this state with another state of the same board size using
+        raw memory copies, so a preallocated state can be reset from the root
+        of a search without allocating.
+        Args:
+            other (GameState): state to copy
+        """
+        if other.size != self.size:
+            raise ValueError("Cannot copy a state of a different board size")
+        self.to_play = other.to_play
+        self.red_played = other.red_played
+        self.blue_played = other.blue_played
+        self.n_moves = other.n_moves
+        memcpy(self.red_bits, other.red_bits, sizeof(self.red_bits))
+        memcpy(self.blue_bits, other.blue_bits, sizeof(self.blue_bits))
+        memcpy(self.history, other.history, other.n_moves * sizeof(MoveRecord))
+        self.red_groups._copy_from(other.red_groups)
+        self.blue_groups._copy_from(other.blue_groups)
+
+    @property
+    def board(self):
+        """
+        Board as a size x size array holding the player number of each cell.
+        """
+        board = zeros((self.size, self.size), dtype=int_)
+        cdef long[:, ::1] view = board
+        cdef int i
+        for i in range(self.n_cells):
+            view[i // self.size, i % self.size] = self.colour_at(i)
+        return board
+
     cpdef void play(self, tuple cell):
         """
         Play a stone of the player that owns the current turn in input cell.
         Args:
             cell (tuple): row and column of the cell
         """
-        if self.to_play == GameMeta.PLAYERS['red']:
-            self.place_red(cell)
-            self.to_play = GameMeta.PLAYERS['blue']
-        elif self.to_play == GameMeta.PLAYERS['blue']:
-            self.place_blue(cell)
-            self.to_play = GameMeta.PLAYERS['red']
+        cdef int x = cell[0]
+        cdef int y = cell[1]
+        if not (0 <= x < self.size and 0 <= y < self.size):
+            raise IndexError("Cell out of the board")
+        self.play_index(x * self.size + y)
+
+    cpdef void play_index(self, int index):
+        """
+        Play a stone of the player that owns the current turn in the cell
+        with the passed integer index.
+        Args:
+            index (int): row * size + column of the cell
+        """
+        if self.to_play == RED:
+            self._place(index, RED)
+            self.to_play = BLUE
+        elif self.to_play == BLUE:
+            self._place(index, BLUE)
+            self.to_play = RED
+
+    cpdef void undo(self):
+        """
+        Take back the last placed stone and give the turn back to the player
+        who had it before the stone was placed.
+        """
+        cdef MoveRecord * record
+        if self.n_moves == 0:
+            raise ValueError("No move to undo")
+
+        self.n_moves -= 1
+        record = &self.history[self.n_moves]
+        if record.colour == RED:
+            self.red_bits[record.index >> 6] &= ~((<uint64_t> 1) << (record.index & 63))
+            self.red_played -= 1
+            self.red_groups._rollback(record.uf_mark)
+        else:
+            self.blue_bits[record.index >> 6] &= ~((<uint64_t> 1) << (record.index & 63))
+            self.blue_played -= 1
+            self.blue_groups._rollback(record.uf_mark)
+        self.to_play = record.to_play
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void empty_mask(self, uint64_t * out) noexcept nogil:
+        """
+        Write the bitboard of the empty cells to out (BB_WORDS words).
+        """
+        cdef int w
+        for w in range(BB_WORDS):
+            out[w] = self.cell_bits[w] & ~(self.red_bits[w] | self.blue_bits[w])
+
+    cdef int colour_at(self, int index) noexcept nogil:
+        """
+        Return the player number of the stone in the cell, none if empty.
+        """
+        if test_bit(self.red_bits, index):
+            return RED
+        if test_bit(self.blue_bits, index):
+            return BLUE
+        return NONE
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _place(self, int index, int colour):
+        """
+        Place a stone of the passed colour, log it and join it with the
+        neighboring groups and edges of the same colour.
+        """
+        cdef:
+            int k, n
+            unsigned char edges
+            uint64_t * bits
+            UnionFind groups
+            MoveRecord * record
+
+        if not 0 <= index < self.n_cells:
+            raise IndexError("Cell out of the board")
+        if self.colour_at(index) != NONE:
+            raise ValueError("Cell occupied")
+
+        if colour == RED:
+            bits = self.red_bits
+            groups = self.red_groups
+            self.red_played += 1
+        else:
+            bits = self.blue_bits
+            groups = self.blue_groups
+            self.blue_played += 1
+
+        record = &self.history[self.n_moves]
+        record.index = index
+        record.colour = colour
+        record.to_play = self.to_play
+        record.uf_mark = groups._mark()
+        self.n_moves += 1
+        bits[index >> 6] |= (<uint64_t> 1) << (index & 63)
+
+        # if the placed cell touches an edge of its colour connect it
+        # appropriately, red owns top and bottom, blue left and right
+        edges = self.geometry.edge_table[index]
+        if colour == RED:
+            if edges & ON_TOP:
+                groups._join(groups.edge(EDGE_TOP), index)
+            if edges & ON_BOTTOM:
+                groups._join(groups.edge(EDGE_BOTTOM), index)
+        else:
+            if edges & ON_LEFT:
+                groups._join(groups.edge(EDGE_LEFT), index)
+            if edges & ON_RIGHT:
+                groups._join(groups.edge(EDGE_RIGHT), index)
+
+        # join any groups connected by the new stone
+        for k in range(NEIGHBOR_COUNT):
+            n = self.neighbor_table[index * NEIGHBOR_COUNT + k]
+            if n < 0:
+                break
+            if test_bit(bits, n):
+                groups._join(n, index)
 
     cpdef void place_red(self, tuple cell):
         """
@@ -73,20 +243,7 @@ cdef class GameState:
         Args:
             cell (tuple): row and column of the cell
         """
-        if self.board[cell[0], cell[1]] == GameMeta.PLAYERS['none']:
-            self.board[cell[0], cell[1]] = GameMeta.PLAYERS['red']
-            self.red_played += 1
-        else:
-            raise ValueError("Cell occupied")
-        # if the placed cell touches a red edge connect it appropriately
-        if cell[0] == 0:
-            self.red_groups.join(GameMeta.EDGE1, cell)
-        if cell[0] == self.size - 1:
-            self.red_groups.join(GameMeta.EDGE2, cell)
-        # join any groups connected by the new red stone
-        for n in self.neighbors(cell):
-            if self.board[n[0], n[1]] == GameMeta.PLAYERS['red']:
-                self.red_groups.join(n, cell)
+        self._place(self.geometry.index(cell[0], cell[1]), RED)
 
     cpdef void place_blue(self, tuple cell):
         """
@@ -94,21 +251,8 @@ cdef class GameState:
         Args:
             cell (tuple): row and column of the cell
         """
-        if self.board[cell[0], cell[1]] == GameMeta.PLAYERS['none']:
-            self.board[cell[0], cell[1]] = GameMeta.PLAYERS['blue']
-            self.blue_played += 1
-        else:
-            raise ValueError("Cell occupied")
-        # if the placed cell touches a blue edge connect it appropriately
-        if cell[1] == 0:
-            self.blue_groups.join(GameMeta.EDGE1, cell)
-        if cell[1] == self.size - 1:
-            self.blue_groups.join(GameMeta.EDGE2, cell)
-        # join any groups connected by the new blue stone
-        for n in self.neighbors(cell):
-            if self.board[n[0], n[1]] == GameMeta.PLAYERS['blue']:
-                self.blue_groups.join(n, cell)
-             
+        self._place(self.geometry.index(cell[0], cell[1]), BLUE)
+
     cpdef int turn(self):
         """
         Return the player with the next move.
@@ -120,12 +264,14 @@ cdef class GameState:
         Return a number corresponding to the winning player,
         or none if the game is not over.
         """
-        if self.red_groups.connected(GameMeta.EDGE1, GameMeta.EDGE2):
-            return GameMeta.PLAYERS['red']
-        elif self.blue_groups.connected(GameMeta.EDGE1, GameMeta.EDGE2):
-            return GameMeta.PLAYERS['blue']
+        if self.red_groups._connected(self.red_groups.edge(EDGE_TOP),
+                                      self.red_groups.edge(EDGE_BOTTOM)):
+            return RED
+        elif self.blue_groups._connected(self.blue_groups.edge(EDGE_LEFT),
+                                         self.blue_groups.edge(EDGE_RIGHT)):
+            return BLUE
         else:
-            return GameMeta.PLAYERS['none']
+            return NONE
 
     cpdef list neighbors(self, tuple cell):
         """
@@ -133,21 +279,26 @@ cdef class GameState:
         Args:
             cell tuple):
         """
-        x = cell[0]
-        y = cell[1]
-        return [(n[0] + x, n[1] + y) for n in GameMeta.NEIGHBOR_PATTERNS
-                if (0 <= n[0] + x < self.size and 0 <= n[1] + y < self.size)]
+        cdef int k, n
+        cdef int index = self.geometry.index(cell[0], cell[1])
+        result = []
+        for k in range(NEIGHBOR_COUNT):
+            n = self.neighbor_table[index * NEIGHBOR_COUNT + k]
+            if n < 0:
+                break
+            result.append((self.geometry.row_table[n], self.geometry.column_table[n]))
+        return result
 
     cpdef list moves(self):
         """
         Get a list of all moves possible on the current board.
         """
         moves = []
-        #cdef int x, y
+        cdef int x, y
 
         for y in range(self.size):
             for x in range(self.size):
-                if self.board[x, y] == GameMeta.PLAYERS['none']:
+                if self.colour_at(x * self.size + y) == NONE:
                     moves.append((x, y))
 
         return moves
@@ -156,4 +307,4 @@ cdef class GameState:
         """
         Returns (list): list of red and blue played
         """
-        return (self.red_played, self.blue_played)
\ No newline at end of file
+        return (self.red_played, self.blue_played)
@@ -0,0 +1,42 @@
+# keep this line for cython directives
+
+from unionfind cimport EDGE_TOP, EDGE_BOTTOM, EDGE_LEFT, EDGE_RIGHT
+
+# neighbors stored per cell, missing neighbors of border cells are padded
+# with NO_NEIGHBOR after the real ones
+cdef enum:
+    NEIGHBOR_COUNT = 6
+    NO_NEIGHBOR = -1
+
+# flags of the edge table, one bit per board edge a cell lies on
+cdef enum:
+    ON_TOP = 1 << EDGE_TOP
+    ON_BOTTOM = 1 << EDGE_BOTTOM
+    ON_LEFT = 1 << EDGE_LEFT
+    ON_RIGHT = 1 << EDGE_RIGHT
+
+
+cdef class Geometry:
+    """
+    Neighbor, edge and coordinate tables of one board size, built once and
+    shared by every state, rollout and table of that size.
+    """
+    cdef readonly:
+        int size
+        int n_cells
+        object neighbors
+        object edges
+        object rows
+        object columns
+
+    cdef:
+        const int * neighbor_table
+        const unsigned char * edge_table
+        const int * row_table
+        const int * column_table
+
+    cpdef int index(self, int row, int column) except -1
+    cpdef tuple coordinates(self, int index)
+
+
+cpdef Geometry geometry(int size)
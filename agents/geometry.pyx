@@ -0,0 +1,107 @@
+# keep this line for cython directives
+
+from array import array
+from meta import GameMeta
+
+# geometries already built, one per board size
+_geometries = {}
+
+
+cdef class Geometry:
+    """
+    Precomputed geometry of a board size. Cells are addressed by the index
+    row * size + column, and every table is a flat array indexed by it so
+    the hot loops of the engines read them through plain pointers.
+    Geometries are shared, get them through geometry(size) instead of
+    building new ones.
+    ...
+
+    Attributes
+    ----------
+    size : int
+        side of the board
+    n_cells : int
+        number of cells of the board
+    neighbors : array
+        NEIGHBOR_COUNT entries per cell, the indices of its neighbors in the
+        order of GameMeta.NEIGHBOR_PATTERNS followed by NO_NEIGHBOR padding
+    edges : array
+        one byte per cell with the flags ON_TOP, ON_BOTTOM, ON_LEFT and
+        ON_RIGHT of the edges the cell lies on
+    rows : array
+        row of each cell
+    columns : array
+        column of each cell
+
+    Methods
+    -------
+    index(row: int, column: int):
+        Index of the cell at the passed coordinates.
+    coordinates(index: int):
+        Row and column of the cell at the passed index.
+    """
+
+    def __init__(self, int size):
+        """
+        Parameters:
+                size (int): side of the board
+        """
+        cdef int[::1] neighbors, rows, columns
+        cdef unsigned char[::1] edges
+        cdef int x, y, k, i
+
+        self.size = size
+        self.n_cells = size * size
+        self.neighbors = array('i', [NO_NEIGHBOR]) * (self.n_cells * NEIGHBOR_COUNT)
+        self.edges = array('B', [0]) * self.n_cells
+        self.rows = array('i', [0]) * self.n_cells
+        self.columns = array('i', [0]) * self.n_cells
+        neighbors = self.neighbors
+        edges = self.edges
+        rows = self.rows
+        columns = self.columns
+
+        for x in range(size):
+            for y in range(size):
+                i = x * size + y
+                rows[i] = x
+                columns[i] = y
+                k = 0
+                for dx, dy in GameMeta.NEIGHBOR_PATTERNS:
+                    if 0 <= x + dx < size and 0 <= y + dy < size:
+                        neighbors[i * NEIGHBOR_COUNT + k] = (x + dx) * size + y + dy
+                        k += 1
+                edges[i] = ((ON_TOP if x == 0 else 0) | (ON_BOTTOM if x == size - 1 else 0)
+                            | (ON_LEFT if y == 0 else 0) | (ON_RIGHT if y == size - 1 else 0))
+
+        self.neighbor_table = &neighbors[0]
+        self.edge_table = &edges[0]
+        self.row_table = &rows[0]
+        self.column_table = &columns[0]
+
+    cpdef int index(self, int row, int column) except -1:
+        """
+        Return the index of the cell at the passed coordinates.
+        """
+        if not (0 <= row < self.size and 0 <= column < self.size):
+            raise IndexError("Cell out of the board")
+        return row * self.size + column
+
+    cpdef tuple coordinates(self, int index):
+        """
+        Return the row and column of the cell at the passed index.
+        """
+        if not 0 <= index < self.n_cells:
+            raise IndexError("Cell out of the board")
+        return self.row_table[index], self.column_table[index]
+
+
+cpdef Geometry geometry(int size):
+    """
+    Return the geometry of a board size, building it on first use.
+    """
+    cdef Geometry shared = _geometries.get(size)
+    if shared is None:
+        shared = Geometry(size)
+        _geometries[size] = shared
+    return shared
@@ -1,115 +1,140 @@
 # keep this line for cython directives
 
 from copy import deepcopy
-from math import log, sqrt
-from queue import Queue
-from random import choice, random
-from time import time
-
-from gamestate import GameState
+from os import urandom
+from libc.math cimport INFINITY
+from libc.stdint cimport uint64_t
+
+from clock cimport monotonic, tick
+from fastrand cimport Rng, rng_seed, rng_below, rng_uniform, derive_seed
+from gamestate cimport GameState, BB_WORDS, MAX_CELLS
+from nodepool cimport NodePool, EXPANDED, TERMINAL, NO_NODE, RAVE_LINEAR
+from rollout cimport points_mask
+from transposition cimport TranspositionTable
+from search_profile cimport (SearchProfile, rollout_length, PHASE_SELECT, PHASE_EXPAND,
+                             PHASE_ROLLOUT, PHASE_BACKUP)
 from meta import GameMeta, MCTSMeta
 
 
-class Node:
+cdef class LGRMCTSEngine():
     """
-    A class to represent a node from the Game Tree. It is used for Monte Carlo Tree Search.
-    It contains latest move applied from parent to current node, performance metrics,
-    parent node, children nodes and outcome.
-
+    Implementation of an agent that performs MCTS with RAVE whose simulations
+    follow the Last Good Reply policy: a reply that won a simulation is
+    played again after the same move in later simulations.
+    ...
 
     Attributes
     ----------
-    move : tuple
-        move which lead from parent to current node
-    parent : Node
-        parent node
-    children : dict
-        dictionary of all possible moves from the current node
-    outcome: int
-        if node is a leaf, then outcome is equal to numeric representation
-        of the winner. None otherwise
-    counter_visits: int
-        times this position was visited
-    reward_average: int
-        average reward (wins-losses) from this position
-    rave_counter_visits: int
-        times this move has appeared in a rollout
-    rave_reward_average: int
-        times this move has been critical in a rollout (lead to an outcome)
-
-    Methods
-    -------
-    add_children(children: dict):
-        Add a list of nodes to the children of this node.
+    root_state : GameState
+        object to store the current game situation
+    scratch_state : GameState
+        preallocated state reset from root_state for every simulation
+    pool : NodePool
+        arena holding the nodes of the tree
+    root : int
+        handle of the root of the tree search
+    node_count : int
+        the number of nodes in a tree
+    run_time: float
+        time taken for each run
+    num_rollouts: int
+        the number of rollouts for each search
+    carried_visits: int
+        visits of the subtree kept by the last move, 0 when the tree
+        was thrown away
+    interrupted: bool
+        set from another thread to end the running search early
+    seed: int
+        base seed of every random stream of the engine, the same seed and
+        iteration budget always grow the same tree
+    explore: float
+        specifies how much the value should favor nodes
+        that have yet to be thoroughly explored versus nodes
+        that seem to have a high win rate
+    rave_const: float
+        visits after which a node is valued by UCT alone
+    blue_reply, red_reply: dict
+        last good reply of each colour to each move of the other
+    rollout_policy: object
+        policy used to simulate games instead of Last Good Reply
+    profile: SearchProfile
+        phase times and depth and length distributions of the last search,
+        None when profiling is off
+    transpositions: TranspositionTable
+        statistics shared between the nodes of one position, None to treat
+        every move order as a distinct position
     """
 
-    def __init__(self, move: tuple = None, parent: object = None):
+    cdef public:
+        GameState root_state
+        GameState scratch_state
+        NodePool pool
+        int root
+        int node_count
+        double run_time
+        int num_rollouts
+        int carried_visits
+        bint interrupted
+        object seed
+        double explore
+        double rave_const
+        dict blue_reply
+        dict red_reply
+        object rollout_policy
+        SearchProfile profile
+        TranspositionTable transpositions
+
+    cdef:
+        Rng rng
+        # keys of the positions on the path of the running simulation, the
+        # root first
+        uint64_t root_key
+        uint64_t path_keys[MAX_CELLS + 1]
+        int path_length
+
+    def __init__(self, state: GameState = GameState(11), explore=MCTSMeta.EXPLORATION,
+                 rave_const=MCTSMeta.RAVE_CONST, *, rollout_policy=None, max_nodes=1 << 21, seed=None,
+                 profile=None, transpositions=None):
         """
-        Initialize a new node with optional move and parent and initially empty
-        children list and rollout statistics and unspecified outcome.
-
         Parameters:
-                move (tuple): the move that generated the current node
-                parent (Node): parent node
-        """
-        self.move = move
-        self.parent = parent
-        self.children = {}
-        self.outcome = GameMeta.PLAYERS['none']
-
-        # performance metrics
-        self.counter_visits = 0  # times this position was visited
-        self.reward_average = 0  # average reward (wins-losses) from this position
-        self.rave_counter_visits = 0  # times this move has appeared in a rollout
-        self.rave_reward_average = 0  # times this move has been critical in a rollout
-
-    def add_children(self, children) -> None:
+                state (GameState): state to search from
+                explore (float): exploration constant of UCT
+                rave_const (float): visits after which AMAF is ignored
+                rollout_policy (object): object whose run(state) returns the
+                                winner of a simulated game and points(colour)
+                                the cells of a colour at its end, such as a
+                                RandomFillRollout; simulations follow the Last
+                                Good Reply policy if omitted
+                max_nodes (int): capacity of the node pool, reaching it
+                                 prunes the tree
+                seed (int): base seed of every random stream of the engine,
+                            drawn from the operating system if omitted
+                profile (SearchProfile): profile filled by every search,
+                            None for no profiling
+                transpositions (TranspositionTable): table sharing the
+                            statistics of transposed positions, None to
+                            search without one
         """
-        Add a list of nodes to the children of this node.
-        """
-        for child in children:
-            self.children[child.move] = child
-
-    @property
-    def value(self, explore: float = MCTSMeta.EXPLORATION, rave_const: float = MCTSMeta.RAVE_CONST) -> float:
-        '''
-        Calculate the evaluation formula applied to the Game Tree
-
-            Parameters:
-                    explore (float): how much the value should favor nodes 
-                                    that have yet to be thoroughly explored 
-                                    versus nodes that seem to have a high win rate
-
-                    rave_const (float): constant to quantify how to balance between UCT and AMAF
-
-            Returns:
-                    (float): node score
-        '''
-
-        # unless explore is set to zero, maximally favor unexplored nodes
-        if self.counter_visits == 0:
-            return 0 if explore == 0 else GameMeta.INF
-        else:
-            # rave valuation:
-            alpha = max(0, (rave_const - self.counter_visits) / rave_const)
-            UCT = self.reward_average / self.counter_visits + explore * sqrt(
-                2 * log(self.parent.counter_visits) / self.counter_visits)
-            AMAF = self.rave_reward_average / self.rave_counter_visits if self.rave_counter_visits != 0 else 0
-            return (1 - alpha) * UCT + alpha * AMAF
-
-
-class LGRMCTSEngine():
-
-    def __init__(self, state: GameState = GameState(11)):
         self.root_state = deepcopy(state)
-        self.root = Node()
+        self.scratch_state = deepcopy(state)
+        self.pool = NodePool(max_nodes)
+        self.root = self.pool.new_root()
         self.run_time = 0
         self.node_count = 0
         self.num_rollouts = 0
+        self.carried_visits = 0
+        self.interrupted = False
+        self.explore = explore
+        self.rave_const = rave_const
         self.blue_reply = {}
         self.red_reply = {}
+        self.rollout_policy = rollout_policy
+        self.seed = seed if seed is not None else int.from_bytes(urandom(8), "little")
+        rng_seed(&self.rng, derive_seed(self.seed, 0))
+        self.profile = profile
+        self.transpositions = transpositions
 
-    def set_gamestate(self, state: GameState) -> None:
+    cpdef void set_gamestate(self, object state):
         """
         Set the root_state of the tree to the passed gamestate, this clears all
         the information stored in the tree since none of it applies to the new
@@ -117,16 +142,24 @@ class LGRMCTSEngine():
         to use in the Last Good Reply policy.
         """
         self.root_state = deepcopy(state)
-        self.root = Node()
+        self.scratch_state = deepcopy(state)
+        self.pool.clear()
+        self.root = self.pool.new_root()
+        self.carried_visits = 0
         self.red_reply = {}
         self.blue_reply = {}
 
-    def roll_out(self, state: GameState) -> tuple:
+    cpdef tuple roll_out(self, GameState state):
         """
         Simulate a random game except that we play all known critical
         cells first, return the winning player and record critical cells at the end.
 
         """
+        if self.rollout_policy is not None:
+            outcome = self.rollout_policy.run(state)
+            return (outcome, self.rollout_policy.points(GameMeta.PLAYERS["blue"]),
+                    self.rollout_policy.points(GameMeta.PLAYERS["red"]))
+
         moves = state.moves()
         first = state.turn()
         if first == GameMeta.PLAYERS["blue"]:
@@ -141,10 +174,10 @@ class LGRMCTSEngine():
         while state.winner() == GameMeta.PLAYERS["none"]:
             if last_move in current_reply:
                 move = current_reply[last_move]
-                if move not in moves or random() > MCTSMeta.RANDOMNESS:
-                    move = choice(moves)
+                if move not in moves or rng_uniform(&self.rng) > MCTSMeta.RANDOMNESS:
+                    move = moves[rng_below(&self.rng, len(moves))]
             else:
-                move = choice(moves)
+                move = moves[rng_below(&self.rng, len(moves))]
             if state.turn() == GameMeta.PLAYERS["blue"]:
                 blue_moves.append(move)
             else:
@@ -157,11 +190,12 @@ class LGRMCTSEngine():
         blue_rave_pts = []
         red_rave_pts = []
 
+        board = state.board
         for x in range(state.size):
             for y in range(state.size):
-                if state.board[(x, y)] == GameMeta.PLAYERS["blue"]:
+                if board[(x, y)] == GameMeta.PLAYERS["blue"]:
                     blue_rave_pts.append((x, y))
-                elif state.board[(x, y)] == GameMeta.PLAYERS["red"]:
+                elif board[(x, y)] == GameMeta.PLAYERS["red"]:
                     red_rave_pts.append((x, y))
 
         # This part of the algorithm probably deals with adjusting
@@ -187,7 +221,7 @@ class LGRMCTSEngine():
 
         return state.winner(), blue_rave_pts, red_rave_pts
 
-    def move(self, move: tuple) -> None:
+    cpdef void move(self, tuple move):
         """
         Make the passed move and update the tree appropriately. It is
         designed to let the player choose an action manually (which might
@@ -195,85 +229,160 @@ class LGRMCTSEngine():
         Args:
             move:
         """
-        if move in self.root.children:
-            child = self.root.children[move]
-            child.parent = None
-            self.root = child
-            self.root_state.play(child.move)
+        cdef int child = self.pool._child(self.root, move[0] * self.root_state.size + move[1])
+        self.root_state.play(move)
+        if child != NO_NODE:
+            # keep the subtree of the move and free the rest of the pool at once
+            self.root = self.pool.compact(child)
+            self.carried_visits = self.pool.visits[self.root]
             return
 
         # if for whatever reason the move is not in the children of
         # the root just throw out the tree and start over
-        self.root_state.play(move)
-        self.root = Node()
+        self.pool.clear()
+        self.root = self.pool.new_root()
+        self.carried_visits = 0
 
-    def best_move(self) -> tuple:
+    cpdef best_move(self):
         """
         Return the best move according to the current tree.
         Returns:
             best move in terms of the most simulations number unless the game is over
         """
+        cdef int bestchild
+
         if self.root_state.winner() != GameMeta.PLAYERS['none']:
             return GameMeta.GAME_OVER
 
         # choose the move of the most simulated node breaking ties randomly
-        max_value = max(self.root.children.values(), key=lambda n: n.counter_visits).counter_visits
-        max_nodes = [n for n in self.root.children.values() if n.counter_visits == max_value]
-        bestchild = choice(max_nodes)
-        return bestchild.move
-
-    def search(self, time_budget: int) -> None:
+        bestchild = self.pool._most_visited(self.root, &self.rng)
+        if bestchild == NO_NODE:
+            raise IndexError("No move has been searched from the root")
+        return (self.pool.move[bestchild] // self.root_state.size,
+                self.pool.move[bestchild] % self.root_state.size)
+
+    cpdef void search(self, double time_budget=INFINITY, bint stop_early=False,
+                      int iterations=0, int node_limit=0):
         """
-        Search and update the search tree for a specified amount of time in seconds.
+        Search and update the search tree until the first limit is reached:
+        time_budget seconds, iterations simulations or node_limit nodes in the
+        tree, where a zero count is no limit. The clock is only read every
+        CLOCK_CHECK simulations. With stop_early the search also ends once the
+        rest of the time budget can not change the most visited move.
         """
-        start_time = time()
+        cdef:
+            int node, num_rollouts, next_check, loops, played
+            double start_time, elapsed, deadline
+            SearchProfile profile = self.profile
+            int root_played = self.root_state.red_played + self.root_state.blue_played
+
+        if profile is not None:
+            profile.clear()
+        if self.transpositions is not None:
+            self.transpositions.new_generation()
+            self.root_key = self.transpositions._hash(self.root_state)
+        start_time = monotonic()
+        deadline = start_time + time_budget
         num_rollouts = 0
-
-        # do until we exceed our time budget
-        while time() - start_time < time_budget:
+        loops = 0
+        next_check = MCTSMeta.DECIDED_CHECK
+
+        # do until we reach the first limit
+        while not self.interrupted:
+            if iterations and num_rollouts >= iterations:
+                break
+            if node_limit and self.pool.n_nodes >= node_limit:
+                break
+            if tick(loops, deadline):
+                break
+            loops += 1
+            if stop_early and num_rollouts >= next_check:
+                next_check = num_rollouts + MCTSMeta.DECIDED_CHECK
+                elapsed = monotonic() - start_time
+                if elapsed > 0 and self.pool._decided(
+                        self.root, num_rollouts / elapsed * (time_budget - elapsed)):
+                    break
+            if profile is not None:
+                profile._start()
             node, state = self.select_node()
             turn = state.turn()
+            played = state.red_played + state.blue_played
             outcome, blue_rave_pts, red_rave_pts = self.roll_out(state)
+            if profile is not None:
+                profile._lap(PHASE_ROLLOUT)
+                profile._record(played - root_played, rollout_length(
+                    played, state.red_played + state.blue_played, state.size * state.size))
             self.backup(node, turn, outcome, blue_rave_pts, red_rave_pts)
+            if self.transpositions is not None:
+                self.transpositions._share(self.pool, node, self.path_keys, self.path_length)
             num_rollouts += 1
-        run_time = time() - start_time
-        node_count = self.tree_size()
+            if profile is not None:
+                profile._lap(PHASE_BACKUP)
+        run_time = monotonic() - start_time
+        # the pool only ever holds the tree of the root
+        node_count = self.pool.n_nodes
         self.run_time = run_time
         self.node_count = node_count
         self.num_rollouts = num_rollouts
+        if profile is not None:
+            profile.report({"engine": type(self).__name__, "ply": root_played, "rollouts": num_rollouts,
+                            "nodes": node_count, "seconds": run_time})
 
-    def select_node(self) -> tuple:
+    cpdef tuple select_node(self):
         """
         Select a node in the tree to preform a single simulation from.
         """
+        cdef int node
+        cdef GameState state
+        cdef TranspositionTable table = self.transpositions
+
+        # make room first so the leaf reached below can always be expanded
+        if self.pool.n_nodes + self.root_state.n_cells > self.pool.capacity:
+            self.root = self.pool.prune(self.root)
+
         node = self.root
-        state = deepcopy(self.root_state)
+        # reuse the preallocated scratch state instead of copying the root
+        state = self.scratch_state
+        state.copy_from(self.root_state)
+        if table is not None:
+            self.path_keys[0] = self.root_key
+            self.path_length = 1
 
         # stop if we reach a leaf node
-        while len(node.children) != 0:
-            max_value = max(node.children.values(),
-                            key=lambda n:
-                            n.value).value
+        while self.pool.status[node] == EXPANDED:
             # descend to the maximum value node, break ties at random
-            max_nodes = [n for n in node.children.values() if
-                         n.value == max_value]
-            node = choice(max_nodes)
-            state.play(node.move)
+            node = self.pool._select(node, self.explore, self.rave_const, RAVE_LINEAR, &self.rng)
+            if table is not None:
+                self.path_length = table._extend(self.path_keys, self.path_length,
+                                                 state.to_play, self.pool.move[node])
+            state.play_index(self.pool.move[node])
 
             # if some child node has not been explored select it before expanding
             # other children
-            if node.counter_visits == 0:
+            if self.pool.visits[node] == 0:
+                # guide it with what other move orders learnt of its position
+                if table is not None:
+                    table._seed(self.pool, node, self.path_keys[self.path_length - 1])
+                if self.profile is not None:
+                    self.profile._lap(PHASE_SELECT)
                 return node, state
 
+        if self.profile is not None:
+            self.profile._lap(PHASE_SELECT)
         # if we reach a leaf node generate its children and return one of them
         # if the node is terminal, just return the terminal node
         if self.expand(node, state):
-            node = choice(list(node.children.values()))
-            state.play(node.move)
+            node = self.pool.first_child[node] + rng_below(&self.rng, self.pool.n_children[node])
+            if table is not None:
+                self.path_length = table._extend(self.path_keys, self.path_length,
+                                                 state.to_play, self.pool.move[node])
+                table._seed(self.pool, node, self.path_keys[self.path_length - 1])
+            state.play_index(self.pool.move[node])
+        if self.profile is not None:
+            self.profile._lap(PHASE_EXPAND)
         return node, state
 
-    @staticmethod
-    def expand(parent: Node, state: GameState) -> bool:
+    cdef bint expand(self, int parent, GameState state):
         """
         Generate the children of the passed "parent" node based on the available
         moves in the passed gamestate and add them to the tree.
@@ -281,57 +390,56 @@ class LGRMCTSEngine():
         Returns:
             object:
         """
-        children = []
+        cdef uint64_t empty[BB_WORDS]
+
+        if self.pool.status[parent] == TERMINAL:
+            return False
         if state.winner() != GameMeta.PLAYERS["none"]:
             # game is over at this node so nothing to expand
+            self.pool.status[parent] = TERMINAL
             return False
 
-        for move in state.moves():
-            children.append(Node(move, parent))
+        state.empty_mask(empty)
+        return self.pool._expand(parent, empty)
 
-        parent.add_children(children)
-        return True
-
-    def backup(self, node: Node, turn: int, outcome: int, blue_rave_pts: list, red_rave_pts: list) -> None:
+    cpdef void backup(self, int node, int turn, int outcome, list blue_rave_pts, list red_rave_pts):
         """
         Update the node statistics on the path from the passed node to root to reflect
         the outcome of a randomly simulated playout.
         """
+        cdef:
+            double reward
+            uint64_t red_bits[BB_WORDS]
+            uint64_t blue_bits[BB_WORDS]
+
+        # turn the cells of each colour into bitboards once so every ancestor
+        # takes its AMAF update as one masked add over its children
+        points_mask(red_rave_pts, self.root_state.size, red_bits)
+        points_mask(blue_rave_pts, self.root_state.size, blue_bits)
+
         # note that reward is calculated for player who just played
         # at the node and not the next player to play
         reward = -1 if outcome == turn else 1
 
-        while node is not None:
+        while node != NO_NODE:
             if turn == GameMeta.PLAYERS["red"]:
-                for point in red_rave_pts:
-                    if point in node.children:
-                        node.children[point].rave_reward_average += -reward
-                        node.children[point].rave_counter_visits += 1
+                self.pool._amaf_update(node, red_bits, -reward)
             else:
-                for point in blue_rave_pts:
-                    if point in node.children:
-                        node.children[point].rave_reward_average += -reward
-                        node.children[point].rave_counter_visits += 1
+                self.pool._amaf_update(node, blue_bits, -reward)
 
-            node.counter_visits += 1
-            node.reward_average += reward
+            self.pool.visits[node] += 1
+            self.pool.reward[node] += reward
             turn = GameMeta.PLAYERS['red'] if turn == GameMeta.PLAYERS['blue'] else GameMeta.PLAYERS['blue']
             reward = -reward
-            node = node.parent
+            node = self.pool.parent[node]
 
-    def statistics(self) -> tuple:
+    cpdef tuple statistics(self):
         return self.num_rollouts, self.node_count, self.run_time
 
-    def tree_size(self) -> int:
+    cpdef int tree_size(self):
         """
-        Count nodes in tree by BFS.
+        Count the nodes reachable from the root with a sweep of the whole
+        pool. Searches take node_count from the size of the pool in constant
+        time, this walk only checks it and must not run during a search.
         """
-        Q = Queue()
-        count = 0
-        Q.put(self.root)
-        while not Q.empty():
-            node = Q.get()
-            count += 1
-            for child in node.children.values():
-                Q.put(child)
-        return count
+        return self.pool._mark(self.root, 0)
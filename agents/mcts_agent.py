@@ -4,10 +4,13 @@
 # -----------------------------------------------------------
 # keep this line for cython directives
 import socket
+from os import environ
 
 from gamestate import GameState
 from rave_mcts import RaveMCTSEngine
-from utils import extract_last_move_from_board
+from utils import extract_last_move_from_board, Ponderer
+from search_profile import SearchProfile
+from time_manager import TimeManager
 
 from sys import argv, platform
 from os.path import realpath, sep
@@ -22,12 +25,16 @@ class MCTSAgent():
     ----------
     host : str
         host to connect with other agents
-    port : str
-        port used for the socket
-    time_limit : int
-        maximum number of seconds allowed per move
+    port : int
+        port used for the socket, read from HEX_PORT
+    clock : TimeManager
+        budgets the search time of each move from the clock left
     agent: Agent
         Agent engine object used to compute moves
+    ponderer: Ponderer
+        searches on the opponent's clock, None when pondering is off
+    profile: SearchProfile
+        profile of the searches of the engine, None when profiling is off
 
 
     Methods
@@ -54,11 +61,11 @@ class MCTSAgent():
     """
 
     host = "127.0.0.1"
-    port = 1234
-    time_limit = 7
+    # the referee passes the port of the game, 1234 when it runs alone
+    port = int(environ.get("HEX_PORT", 1234))
     agent = None
 
-    def __init__(self, explore=1, rave_const=1, board_size=11):
+    def __init__(self, explore=1, rave_const=1, board_size=11, ponder=False, profile=None):
         """
         Constructs all the necessary attributes for the Agent object.
 
@@ -84,7 +91,10 @@ class MCTSAgent():
         self.board_size = board_size
         self.colour = ""
         self.turn_count = 0
-        self.agent = RaveMCTSEngine(GameState(board_size), explore, rave_const)
+        self.profile = profile
+        self.agent = RaveMCTSEngine(GameState(board_size), explore, rave_const, profile=profile)
+        self.ponderer = Ponderer() if ponder else None
+        self.clock = TimeManager()
 
     def run(self):
         """
@@ -92,7 +102,13 @@ class MCTSAgent():
         """
 
         while True:
+            # keep searching until the opponent replies
+            if self.ponderer is not None:
+                self.ponderer.start(self.agent)
             data = self.s.recv(1024)
+            self.clock.start_turn()
+            if self.ponderer is not None:
+                self.ponderer.stop()
             if not data:
                 break
 
@@ -126,7 +142,8 @@ class MCTSAgent():
                     self.colour = self.opp_colour()
                     if s[3] == self.colour:
                         last_move = extract_last_move_from_board(s[2])
-                        self.agent = RaveMCTSEngine(GameState(self.board_size), self.explore, self.rave_const)
+                        self.agent = RaveMCTSEngine(GameState(self.board_size), self.explore, self.rave_const,
+                                                    profile=self.profile)
                         self.agent.move((last_move[0], last_move[1]))
                         self.make_move()
 
@@ -158,11 +175,13 @@ class MCTSAgent():
         Perform a search for a limited amount of time
         Get the best move and send it
         """
-        self.agent.search(self.time_limit)
+        # visits of the tree kept from the previous moves
+        carried_visits = self.agent.carried_visits
+        self.agent.search(self.clock.budget(self.agent.root_state), stop_early=True)
 
         # Performance measures
         num_rollouts, node_count, run_time = self.agent.statistics()
-        print(num_rollouts, node_count, run_time)
+        print(num_rollouts, node_count, run_time, carried_visits)
 
         move = self.agent.best_move()
         print("Best move suggested: ", move)
@@ -183,7 +202,7 @@ class MCTSAgent():
         if self.colour == "B" and self.turn_count == 0:
             if self.test_swap(action):
                 self.s.sendall(bytes("SWAP\n", "utf-8"))
-                self.agent = RaveMCTSEngine(GameState(11), self.explore, self.rave_const)
+                self.agent = RaveMCTSEngine(GameState(11), self.explore, self.rave_const, profile=self.profile)
                 self.agent.move((action[0], action[1]))
             else:
                 self.choose_move()
@@ -196,6 +215,7 @@ class MCTSAgent():
                 self.s.sendall(bytes("1,3\n", "utf-8"))
             else:
                 self.choose_move()
+        self.clock.end_turn()
         self.turn_count += 1
 
     def opp_colour(self):
@@ -215,11 +235,18 @@ if (__name__ == "__main__"):
 
     explore = 1
     rave_const = 1
+    ponder = False
+    profile = None
     for argument in argv:
-        if ("rave_const=" in argument or "r=" in argument):
+        # one JSON line per search is appended to the file
+        if argument.startswith("profile="):
+            profile = SearchProfile(open(argument.split("=", 1)[1], "a"))
+        elif ("rave_const=" in argument or "r=" in argument):
             rave_const = float(argument.rsplit("=", 1)[1])
         elif ("explore=" in argument or "e=" in argument):
             explore = float(argument.rsplit("=", 1)[1])
+        elif argument == "ponder":
+            ponder = True
             
-    agent = MCTSAgent(explore, rave_const)
+    agent = MCTSAgent(explore, rave_const, ponder=ponder, profile=profile)
     agent.run()
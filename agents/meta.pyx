@@ -5,12 +5,14 @@ class MCTSMeta:
     RANDOMNESS = 0.5
     K_CONST = 10
     A_CONST = 0.25
+    # simulations between two checks of whether a search can stop early
+    DECIDED_CHECK = 256
 
 class GameMeta:
     PLAYERS = {'none': 0, 'red': 1, 'blue': 2}
     INF = float('inf')
     GAME_OVER = -1
-    EDGE1 = (12, 1)
-    EDGE2 = (12, 2)
     NEIGHBOR_PATTERNS = ((-1, 0), (1, 0),(0, -1), (0, 1), (-1, 1),(1, -1))
+    # seconds each player has for the whole game, Game.MAXIMUM_TIME of the referee
+    MAXIMUM_TIME = 5 * 60
     
@@ -0,0 +1,187 @@
+# -----------------------------------------------------------
+# Group 4 - Micro benchmark of the game state primitives
+# -----------------------------------------------------------
+"""
+Time the GameState and UnionFind primitives the searches call millions of
+times per move, in nanoseconds per call, for the Cython modules of this
+directory and for the pure Python ones of agents_old.
+
+Build the extensions first (python3 setup.py build_ext --inplace) and run
+from this directory:
+
+    python3 microbenchmark.py [sizes=11] [repeat=5] [impl=cython,python]
+                              [out=results.json]
+
+Both versions define modules named gamestate, unionfind and meta, so each
+one is timed in its own interpreter with its directory first on the path.
+Every primitive is called through Python, so the times include the call
+overhead a Python caller such as the naive engine pays.
+"""
+import json
+import multiprocessing as mlp
+import sys
+from copy import deepcopy
+from os.path import abspath, dirname, join
+from random import Random
+from sys import argv, stderr
+from time import perf_counter_ns
+
+HERE = dirname(abspath(__file__))
+IMPLEMENTATIONS = {
+    "cython": HERE,
+    "python": join(dirname(HERE), "agents_old"),
+}
+
+# states built for the primitives that change them, each of them is used
+# for a single pass over its cells
+STATES = 200
+
+
+def shuffled_cells(size, seed):
+    """
+    Return every cell of a size x size board in a seeded random order.
+    """
+    cells = [(x, y) for x in range(size) for y in range(size)]
+    Random(seed).shuffle(cells)
+    return cells
+
+
+def middle_game(GameState, size):
+    """
+    Return a state with a third of the cells filled by alternate stones.
+    """
+    state = GameState(size)
+    for cell in shuffled_cells(size, 0)[:size * size // 3]:
+        state.play(cell)
+    return state
+
+
+def best_ns(run, calls, repeat):
+    """
+    Return the fastest of repeat runs of run() in nanoseconds per call,
+    run making calls calls and receiving the index of the run.
+    """
+    best = None
+    for i in range(repeat):
+        start = perf_counter_ns()
+        run(i)
+        elapsed = (perf_counter_ns() - start) / calls
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def time_primitives(path, size, repeat):
+    """
+    Import the gamestate and unionfind modules found in path and return a
+    dictionary mapping each primitive to its time in nanoseconds per call.
+    """
+    sys.path.insert(0, path)
+    from gamestate import GameState
+    from unionfind import UnionFind
+
+    cells = shuffled_cells(size, 1)
+    half = cells[:size * size // 2]
+    middle = middle_game(GameState, size)
+    # the pure Python winner is a property
+    winner = type(middle).winner
+    if isinstance(winner, property):
+        winner = winner.fget
+    pairs = [((x, y), (x, y + 1)) for x in range(size) for y in range(size - 1)]
+
+    def fresh_states():
+        return [[GameState(size) for _ in range(STATES)] for _ in range(repeat)]
+
+    def fresh_groups():
+        # the pure Python structure has no board size
+        try:
+            return [[UnionFind(size) for _ in range(STATES)] for _ in range(repeat)]
+        except TypeError:
+            return [[UnionFind() for _ in range(STATES)] for _ in range(repeat)]
+
+    def play(i):
+        for state in states[i]:
+            for cell in half:
+                state.play(cell)
+
+    def place(i):
+        for state in states[i]:
+            for cell in half:
+                state.place_red(cell)
+            for cell in cells[len(half):]:
+                state.place_blue(cell)
+
+    def join_cells(i):
+        for groups in unions[i]:
+            for x, y in pairs:
+                groups.join(x, y)
+
+    def connected(i):
+        for groups in unions[0]:
+            for x, y in pairs:
+                groups.connected(x, y)
+
+    results = {}
+    states = fresh_states()
+    results["play"] = best_ns(play, STATES * len(half), repeat)
+    states = fresh_states()
+    results["place_red/place_blue"] = best_ns(place, STATES * len(cells), repeat)
+    results["winner"] = best_ns(lambda i: [winner(middle) for _ in range(100000)], 100000, repeat)
+    results["moves"] = best_ns(lambda i: [middle.moves() for _ in range(10000)], 10000, repeat)
+    results["neighbors"] = best_ns(
+        lambda i: [middle.neighbors(cell) for _ in range(100) for cell in cells], 100 * len(cells), repeat)
+    results["__deepcopy__"] = best_ns(lambda i: [deepcopy(middle) for _ in range(1000)], 1000, repeat)
+    unions = fresh_groups()
+    results["UnionFind.join"] = best_ns(join_cells, STATES * len(pairs), repeat)
+    results["UnionFind.connected"] = best_ns(connected, STATES * len(pairs), repeat)
+    return results
+
+
+def run_implementation(path, size, repeat, conn):
+    """
+    Time the primitives of one implementation and send them through conn.
+    """
+    conn.send(time_primitives(path, size, repeat))
+    conn.close()
+
+
+def main():
+    options = dict(argument.split("=", 1) for argument in argv[1:] if "=" in argument)
+    sizes = [int(size) for size in options.get("sizes", "11").split(",")]
+    repeat = int(options.get("repeat", 5))
+    names = options.get("impl", ",".join(IMPLEMENTATIONS)).split(",")
+    for name in names:
+        if name not in IMPLEMENTATIONS:
+            print(f"ERROR: Unknown implementation {name}, expected one of {', '.join(IMPLEMENTATIONS)}.",
+                  file=stderr)
+            return
+
+    # a spawned interpreter has not imported either version yet
+    context = mlp.get_context("spawn")
+    report = {}
+    for size in sizes:
+        report[size] = {}
+        for name in names:
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=run_implementation,
+                                      args=(IMPLEMENTATIONS[name], size, repeat, child_conn))
+            process.start()
+            child_conn.close()
+            report[size][name] = parent_conn.recv()
+            process.join()
+
+        print(f"{'size ' + str(size):22}" + "".join(f"{name:>14}" for name in names)
+              + (f"{names[1] + '/' + names[0]:>16}" if len(names) == 2 else ""), file=stderr)
+        for primitive in report[size][names[0]]:
+            times = [report[size][name][primitive] for name in names]
+            print(f"{primitive:22}" + "".join(f"{ns:11.0f} ns" for ns in times)
+                  + (f"{times[1] / times[0]:13.1f}x" if len(times) == 2 else ""), file=stderr)
+
+    if "out" in options:
+        with open(options["out"], "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,16 @@
 
 from copy import deepcopy
 from math import log, sqrt
-from queue import Queue
-from random import choice
-from time import time
+from os import urandom
+from random import Random
 
+from clock cimport monotonic, tick
+from fastrand cimport derive_seed
 from gamestate import GameState
 from meta import GameMeta, MCTSMeta
+from rollout import RandomFillRollout
+from search_profile cimport (SearchProfile, rollout_length, PHASE_SELECT, PHASE_EXPAND,
+                             PHASE_ROLLOUT, PHASE_BACKUP)
 
 
 class Node:
@@ -87,6 +91,35 @@ class Node:
                 2 * log(self.parent.counter_visits) / self.counter_visits)
 
 
+def release(node: Node) -> int:
+    """
+    Free the subtree of the passed node at once and return how many nodes it
+    held. Every child points back to its parent, so a dropped subtree is a
+    reference cycle that is only freed by the cyclic garbage collector,
+    possibly in the middle of a later timed search. Emptying the children
+    dicts breaks the cycles and lets reference counting free each node here.
+    """
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        stack.extend(node.children.values())
+        node.children = {}
+        count += 1
+    return count
+
+
+def decided(node: Node, remaining: float) -> bool:
+    """
+    Return whether the most visited child of the node stays ahead even if
+    the remaining simulations all go to the runner up.
+    """
+    visits = sorted((child.counter_visits for child in node.children.values()), reverse=True)
+    if not visits:
+        return False
+    return visits[0] - (visits[1] if len(visits) > 1 else 0) > remaining
+
+
 class NaiveMCTSEngine:
     """
     Implementation of an agent that performs MCTS. It is used for Monte Carlo Tree Search.
@@ -98,22 +131,41 @@ class NaiveMCTSEngine:
     ----------
     root_state : GameState
         object to store the current game situation
+    scratch_state : GameState
+        preallocated state reset from root_state for every simulation
     root : Node
         root of the tree search
     node_count : int
         the number of nodes in a tree
-    run_time: int
+    n_nodes : int
+        the number of nodes in the tree, kept up to date as it changes
+    run_time: float
         time taken for each run
     num_rollouts: int
         the number of rollouts for each search
+    carried_visits: int
+        visits of the subtree kept by the last move, 0 when the tree
+        was thrown away
+    interrupted: bool
+        set from another thread to end the running search early
+    seed: int
+        base seed of every random stream of the engine, the same seed and
+        iteration budget always grow the same tree
+    random: Random
+        stream breaking ties between equally valued children
     exploration: int
         specifies how much the value should favor nodes 
         that have yet to be thoroughly explored versus nodes
         that seem to have a high win rate
+    rollout_policy: RandomFillRollout
+        policy used to simulate games from the leaves
+    profile: SearchProfile
+        phase times and depth and length distributions of the last search,
+        None when profiling is off
 
     Methods
     -------
-    search(time_budget: int):
+    search(time_budget: float, stop_early: bool, iterations: int, node_limit: int):
         Search and update the search tree for a
         specified amount of time in seconds.
     select_node():
@@ -138,51 +190,103 @@ class NaiveMCTSEngine:
     statistics():
         Getter for performance metrics
     tree_size():
-        Count nodes in tree by BFS.
+        Count nodes reachable from the root with a full walk, a diagnostic
+        never run by search.
     """
 
-    def __init__(self, state=GameState(11)):
+    def __init__(self, state=GameState(11), *, rollout_policy=None, seed=None, profile=None):
         """
         Initialize a new node with optional move and parent and initially empty
         children list and rollout statistics and unspecified outcome.
 
         Parameters:
-                move (tuple): the move that generated the current node
-                parent (Node): parent node
+                state (GameState): state to search from
+                rollout_policy (object): object whose run(state) returns the
+                                winner of a simulated game, a
+                                RandomFillRollout if omitted
+                seed (int): base seed of every random stream of the engine,
+                            drawn from the operating system if omitted
+                profile (SearchProfile): profile filled by every search,
+                            None for no profiling
         """
         self.root_state = deepcopy(state)
+        self.scratch_state = deepcopy(state)
         self.root = Node()
+        self.n_nodes = 1
         self.run_time = 0
         self.node_count = 0
         self.num_rollouts = 0
-
-    def search(self, time_budget: int) -> None:
+        self.carried_visits = 0
+        self.interrupted = False
+        self.seed = seed if seed is not None else int.from_bytes(urandom(8), "little")
+        self.random = Random(derive_seed(self.seed, 0))
+        self.rollout_policy = (rollout_policy if rollout_policy is not None
+                               else RandomFillRollout(derive_seed(self.seed, 1)))
+        self.profile = profile
+
+    def search(self, time_budget: float = GameMeta.INF, stop_early: bool = False,
+               iterations: int = 0, node_limit: int = 0) -> None:
         """
-        Search and update the search tree for a
-        specified amount of time in seconds.
+        Search and update the search tree until the first limit is reached:
+        time_budget seconds, iterations simulations or node_limit nodes in
+        the tree, where a zero count is no limit. The clock is only read
+        every CLOCK_CHECK simulations. With stop_early the search also ends
+        once the rest of the time budget can not change the most visited move.
         """
-        start_time = time()
+        cdef SearchProfile profile = self.profile
+        root_played = self.root_state.red_played + self.root_state.blue_played
+        if profile is not None:
+            profile.clear()
+        start_time = monotonic()
+        deadline = start_time + time_budget
         num_rollouts = 0
-
-        # do until we exceed our time budget
-        while time() - start_time < time_budget:
+        next_check = MCTSMeta.DECIDED_CHECK
+
+        # do until we reach the first limit
+        while not self.interrupted:
+            if iterations and num_rollouts >= iterations:
+                break
+            if node_limit and self.n_nodes >= node_limit:
+                break
+            if tick(num_rollouts, deadline):
+                break
+            if stop_early and num_rollouts >= next_check:
+                next_check = num_rollouts + MCTSMeta.DECIDED_CHECK
+                elapsed = monotonic() - start_time
+                if elapsed > 0 and decided(self.root, num_rollouts / elapsed * (time_budget - elapsed)):
+                    break
+            if profile is not None:
+                profile._start()
             node, state = self.select_node()
             turn = state.turn()
+            played = state.red_played + state.blue_played
             outcome = self.roll_out(state)
+            if profile is not None:
+                profile._lap(PHASE_ROLLOUT)
+                profile._record(played - root_played, rollout_length(
+                    played, state.red_played + state.blue_played, state.size * state.size))
             self.backup(node, turn, outcome)
             num_rollouts += 1
-        run_time = time() - start_time
-        node_count = self.tree_size()
+            if profile is not None:
+                profile._lap(PHASE_BACKUP)
+        run_time = monotonic() - start_time
+        node_count = self.n_nodes
         self.run_time = run_time
         self.counter_visitsode_count = node_count
         self.counter_visitsum_rollouts = num_rollouts
+        if profile is not None:
+            profile.report({"engine": type(self).__name__, "ply": root_played, "rollouts": num_rollouts,
+                            "nodes": node_count, "seconds": run_time})
 
     def select_node(self) -> tuple:
         """
         Select a node in the tree to preform a single simulation from.
         """
+        cdef SearchProfile profile = self.profile
         node = self.root
-        state = deepcopy(self.root_state)
+        # reuse the preallocated scratch state instead of copying the root
+        state = self.scratch_state
+        state.copy_from(self.root_state)
 
         # stop if we find reach a leaf node
         while len(node.children) != 0:
@@ -191,23 +295,28 @@ class NaiveMCTSEngine:
             max_value = max(children, key=lambda n: n.value).value
             max_nodes = [n for n in node.children.values()
                          if n.value == max_value]
-            node = choice(max_nodes)
+            node = self.random.choice(max_nodes)
             state.play(node.move)
 
             # if some child node has not been explored select it before expanding
             # other children
             if node.counter_visits == 0:
+                if profile is not None:
+                    profile._lap(PHASE_SELECT)
                 return node, state
 
+        if profile is not None:
+            profile._lap(PHASE_SELECT)
         # if we reach a leaf node generate its children and return one of them
         # if the node is terminal, just return the terminal node
         if self.expand(node, state):
-            node = choice(list(node.children.values()))
+            node = self.random.choice(list(node.children.values()))
             state.play(node.move)
+        if profile is not None:
+            profile._lap(PHASE_EXPAND)
         return node, state
 
-    @staticmethod
-    def expand(parent: Node, state: GameState) -> bool:
+    def expand(self, parent: Node, state: GameState) -> bool:
         """
         Generate the children of the passed "parent" node based on the available
         moves in the passed gamestate and add them to the tree.
@@ -224,10 +333,10 @@ class NaiveMCTSEngine:
             children.append(Node(move, parent))
 
         parent.add_children(children)
+        self.n_nodes += len(children)
         return True
 
-    @staticmethod
-    def roll_out(state: GameState) -> int:
+    def roll_out(self, state: GameState) -> int:
         """
         Simulate an entirely random game from the passed state and return the winning
         player.
@@ -238,14 +347,7 @@ class NaiveMCTSEngine:
         Returns:
             int: winner of the game
         """
-        moves = state.moves()  # Get a list of all possible moves in current state of the game
-
-        while state.winner() == GameMeta.PLAYERS['none']:
-            move = choice(moves)
-            state.play(move)
-            moves.remove(move)
-
-        return state.winner()
+        return self.rollout_policy.run(state)
 
     @staticmethod
     def backup(node: Node, turn: int, outcome: int) -> None:
@@ -283,7 +385,7 @@ class NaiveMCTSEngine:
         # choose the move of the most simulated node breaking ties randomly
         max_value = max(self.root.children.values(), key=lambda n: n.counter_visits).counter_visits
         max_nodes = [n for n in self.root.children.values() if n.counter_visits == max_value]
-        bestchild = choice(max_nodes)
+        bestchild = self.random.choice(max_nodes)
         return bestchild.move
 
     def move(self, move: tuple) -> tuple:
@@ -295,16 +397,22 @@ class NaiveMCTSEngine:
             move:
         """
         if move in self.root.children:
-            child = self.root.children[move]
+            child = self.root.children.pop(move)
             child.parent = None
+            # free the siblings now rather than during the next search
+            self.n_nodes -= release(self.root)
             self.root = child
             self.root_state.play(child.move)
+            self.carried_visits = child.counter_visits
             return move
 
         # if for whatever reason the move is not in the children of
         # the root just throw out the tree and start over
         self.root_state.play(move)
+        release(self.root)
         self.root = Node()
+        self.n_nodes = 1
+        self.carried_visits = 0
         return move
 
     def set_gamestate(self, state: GameState) -> None:
@@ -315,21 +423,25 @@ class NaiveMCTSEngine:
 
         """
         self.root_state = deepcopy(state)
+        self.scratch_state = deepcopy(state)
+        release(self.root)
         self.root = Node()
+        self.n_nodes = 1
+        self.carried_visits = 0
 
     def statistics(self) -> tuple:
         return self.counter_visitsum_rollouts, self.counter_visitsode_count, self.run_time
 
     def tree_size(self) -> int:
         """
-        Count nodes in tree by BFS.
+        Count the nodes reachable from the root with a walk of the whole
+        tree. Searches take node_count from n_nodes, which expand and move
+        keep up to date, this walk only checks it.
         """
-        Q = Queue()
         count = 0
-        Q.put(self.root)
-        while not Q.empty():
-            node = Q.get()
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
             count += 1
-            for child in node.children.values():
-                Q.put(child)
+            stack.extend(node.children.values())
         return count
@@ -4,6 +4,7 @@
 # -----------------------------------------------------------
 
 import socket
+from os import environ
 
 from gamestate import GameState
 from quality_agent import QRAVEEngine
@@ -19,8 +20,8 @@ class MCTSAgent():
     ----------
     host : str
         host to connect with other agents
-    port : str
-        port used for the socket
+    port : int
+        port used for the socket, read from HEX_PORT
     time_limit : int
         maximum number of seconds allowed per move
     agent: Agent
@@ -51,7 +52,8 @@ class MCTSAgent():
     """
 
     host = "127.0.0.1"
-    port = 1234
+    # the referee passes the port of the game, 1234 when it runs alone
+    port = int(environ.get("HEX_PORT", 1234))
     time_limit = 8
     agent = None
 
@@ -0,0 +1,64 @@
+# keep this line for cython directives
+
+from libc.stdint cimport uint64_t
+from fastrand cimport Rng
+
+# expansion status of a node, children are only read once the status of
+# their parent is EXPANDED
+cdef enum:
+    LEAF = 0
+    EXPANDING = 1
+    EXPANDED = 2
+    TERMINAL = 3
+
+# handle of a missing node
+cdef enum:
+    NO_NODE = -1
+
+# how _select blends the AMAF estimate of a child into its UCT value
+cdef enum:
+    RAVE_NONE = 0       # plain UCT
+    RAVE_MSE = 1        # alpha = rv / (rv + v + 4 * rv * v * rave_const)
+    RAVE_LINEAR = 2     # alpha = max(0, (rave_const - v) / rave_const)
+
+
+cdef class NodePool:
+    """
+    Arena holding the nodes of a search tree in parallel arrays addressed by
+    integer handles. The children of a node are allocated together so they
+    form the contiguous range [first_child, first_child + n_children).
+    """
+    cdef readonly:
+        int capacity
+        int n_nodes
+
+    cdef:
+        int * move
+        int * parent
+        int * first_child
+        int * n_children
+        int * status
+        int * visits
+        double * reward
+        int * rave_visits
+        double * rave_reward
+        int * prior_visits
+        double * prior_reward
+        int * forward
+
+    cdef int _alloc(self, int count) noexcept nogil
+    cdef void _reset(self, int node, int move, int parent) noexcept nogil
+    cdef bint _expand(self, int node, const uint64_t * empty) noexcept nogil
+    cdef int _child(self, int node, int move) noexcept nogil
+    cdef int _select(self, int node, double explore, double rave_const, int schedule, Rng * rng) noexcept nogil
+    cdef int _most_visited(self, int node, Rng * rng) noexcept nogil
+    cdef bint _decided(self, int node, double remaining) noexcept nogil
+    cdef void _amaf_update(self, int node, const uint64_t * owned, double reward) noexcept nogil
+    cdef int _mark(self, int root, int min_visits) noexcept nogil
+    cpdef int new_root(self)
+    cpdef int compact(self, int root, int min_visits=*)
+    cpdef int prune(self, int root)
+    cpdef dict child_visits(self, int node)
+    cpdef dict children(self, int node)
+    cpdef int node_visits(self, int node)
+    cpdef void clear(self)
@@ -0,0 +1,425 @@
+# keep this line for cython directives
+
+cimport cython
+from libc.math cimport sqrt, log, INFINITY
+from libc.stdint cimport uint64_t
+from libc.stdlib cimport malloc, free
+from atomic cimport atomic_load_int, atomic_store_int, atomic_cas_int
+from fastrand cimport Rng, rng_below
+from gamestate cimport BB_WORDS
+
+
+cdef extern from *:
+    int __builtin_ctzll(unsigned long long) nogil
+    int __builtin_popcountll(unsigned long long) nogil
+
+
+cdef class NodePool:
+    """
+    Arena holding the nodes of a search tree in parallel arrays addressed by
+    integer handles, instead of one object and one children dict per node.
+    The children of a node are allocated together when it is expanded so they
+    form the contiguous range [first_child, first_child + n_children) and a
+    selection pass reads them sequentially.
+
+    Nodes are handed out by a bump allocator that can be shared by threads:
+    slots are reserved with a compare and swap on n_nodes and a node is
+    published to other threads by storing EXPANDED in the status of its parent.
+    ...
+
+    Attributes
+    ----------
+    capacity : int
+        maximum number of nodes the arena can hold
+    n_nodes : int
+        number of slots handed out since the last clear
+    move : int *
+        cell index of the move which lead from parent to each node
+    parent : int *
+        handle of the parent of each node, NO_NODE for a root
+    first_child, n_children : int *
+        range of the children of each node
+    status : int *
+        LEAF, EXPANDING, EXPANDED or TERMINAL
+    visits : int *
+        times each position was visited
+    reward : double *
+        sum of the rewards of the player who moved into each node
+    rave_visits : int *
+        times each move has appeared in a rollout played after its parent
+    rave_reward : double *
+        sum of the rewards of those rollouts
+    prior_visits : int *
+        virtual visits a node starts from, learnt elsewhere and only read
+        by the selection, they never count as visits of the node
+    prior_reward : double *
+        sum of the rewards of those virtual visits
+    forward : int *
+        scratch array mapping old handles to new ones during a compaction
+
+    Methods
+    -------
+    new_root():
+        Allocate a fresh node without parent and return its handle.
+    compact(root: int, min_visits: int):
+        Keep the subtree of root and release every other node in one sweep.
+    prune(root: int):
+        Compact with the lowest visit threshold that frees half the arena.
+    child_visits(node: int):
+        Visit count of each child of a node keyed by cell index.
+    children(node: int):
+        Handle of each child of a node keyed by cell index.
+    node_visits(node: int):
+        Visit count of a node.
+    clear():
+        Release every node at once.
+    """
+
+    def __cinit__(self, int capacity=1 << 21):
+        """
+        Parameters:
+                capacity (int): maximum number of nodes, the arrays are reserved
+                                up front but only touched as nodes are used
+        """
+        if capacity < 1:
+            raise ValueError("Capacity must be positive")
+        self.capacity = capacity
+        self.n_nodes = 0
+        self.move = <int *> malloc(capacity * sizeof(int))
+        self.parent = <int *> malloc(capacity * sizeof(int))
+        self.first_child = <int *> malloc(capacity * sizeof(int))
+        self.n_children = <int *> malloc(capacity * sizeof(int))
+        self.status = <int *> malloc(capacity * sizeof(int))
+        self.visits = <int *> malloc(capacity * sizeof(int))
+        self.reward = <double *> malloc(capacity * sizeof(double))
+        self.rave_visits = <int *> malloc(capacity * sizeof(int))
+        self.rave_reward = <double *> malloc(capacity * sizeof(double))
+        self.prior_visits = <int *> malloc(capacity * sizeof(int))
+        self.prior_reward = <double *> malloc(capacity * sizeof(double))
+        self.forward = <int *> malloc(capacity * sizeof(int))
+        if (not self.move or not self.parent or not self.first_child or not self.n_children
+                or not self.status or not self.visits or not self.reward
+                or not self.rave_visits or not self.rave_reward or not self.prior_visits
+                or not self.prior_reward or not self.forward):
+            raise MemoryError()
+
+    def __dealloc__(self):
+        free(self.move)
+        free(self.parent)
+        free(self.first_child)
+        free(self.n_children)
+        free(self.status)
+        free(self.visits)
+        free(self.reward)
+        free(self.rave_visits)
+        free(self.rave_reward)
+        free(self.prior_visits)
+        free(self.prior_reward)
+        free(self.forward)
+
+    cdef int _alloc(self, int count) noexcept nogil:
+        """
+        Reserve count consecutive slots and return the first one, NO_NODE if
+        the arena is full.
+        """
+        cdef int start
+        while True:
+            start = atomic_load_int(&self.n_nodes)
+            if start + count > self.capacity:
+                return NO_NODE
+            if atomic_cas_int(&self.n_nodes, start, start + count):
+                return start
+
+    cdef void _reset(self, int node, int move, int parent) noexcept nogil:
+        self.move[node] = move
+        self.parent[node] = parent
+        self.first_child[node] = NO_NODE
+        self.n_children[node] = 0
+        self.status[node] = LEAF
+        self.visits[node] = 0
+        self.reward[node] = 0
+        self.rave_visits[node] = 0
+        self.rave_reward[node] = 0
+        self.prior_visits[node] = 0
+        self.prior_reward[node] = 0
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef bint _expand(self, int node, const uint64_t * empty) noexcept nogil:
+        """
+        Give the node one child per cell set in the empty bitboard. Only one
+        thread can expand a node, the others get False as they do when the
+        arena is full.
+        """
+        cdef:
+            int w, count = 0, first, child
+            uint64_t word
+
+        if not atomic_cas_int(&self.status[node], LEAF, EXPANDING):
+            return False
+        for w in range(BB_WORDS):
+            count += __builtin_popcountll(empty[w])
+        first = self._alloc(count)
+        if first == NO_NODE:
+            atomic_store_int(&self.status[node], LEAF)
+            return False
+
+        child = first
+        for w in range(BB_WORDS):
+            word = empty[w]
+            while word:
+                self._reset(child, w * 64 + __builtin_ctzll(word), node)
+                child += 1
+                word &= word - 1
+        self.first_child[node] = first
+        self.n_children[node] = count
+        atomic_store_int(&self.status[node], EXPANDED)
+        return True
+
+    cdef int _child(self, int node, int move) noexcept nogil:
+        """
+        Return the child of the node reached by the move, NO_NODE if the node
+        has not been expanded.
+        """
+        cdef int child
+        if atomic_load_int(&self.status[node]) != EXPANDED:
+            return NO_NODE
+        for child in range(self.first_child[node], self.first_child[node] + self.n_children[node]):
+            if self.move[child] == move:
+                return child
+        return NO_NODE
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    @cython.cdivision(True)
+    cdef int _select(self, int node, double explore, double rave_const, int schedule, Rng * rng) noexcept nogil:
+        """
+        Return the child of an expanded node with the highest UCT value
+        blended with its AMAF value by the passed schedule, breaking ties
+        uniformly at random.
+
+        This is the selection of every engine built on the pool: the scores of
+        all children are computed in one pass over their contiguous arrays,
+        the log of the parent visits is taken once and the winner is drawn by
+        reservoir sampling over the ties, so nothing is allocated. Unvisited
+        children score infinity unless explore is zero. The prior visits of a
+        child count as visits of its own in its score, and only there.
+        """
+        cdef:
+            int child, best_child = NO_NODE, ties = 0
+            int first = self.first_child[node]
+            int last = first + self.n_children[node]
+            int v, n, rv
+            double alpha = 0, uct, amaf, score, best = -INFINITY
+            double log_parent = 2 * log(self.visits[node]) if self.visits[node] > 0 else 0
+            double unvisited = INFINITY if explore != 0 else 0
+
+        for child in range(first, last):
+            v = self.visits[child]
+            if v <= 0:
+                score = unvisited
+            else:
+                n = v + self.prior_visits[child]
+                uct = (self.reward[child] + self.prior_reward[child]) / n + explore * sqrt(log_parent / n)
+                rv = self.rave_visits[child]
+                if schedule == RAVE_MSE:
+                    alpha = rv / (rv + n + 4.0 * rv * n * rave_const)
+                elif schedule == RAVE_LINEAR:
+                    alpha = (rave_const - n) / rave_const if n < rave_const else 0
+                amaf = self.rave_reward[child] / rv if rv != 0 else 0
+                score = (1 - alpha) * uct + alpha * amaf
+            if score > best:
+                best = score
+                best_child = child
+                ties = 1
+            elif score == best:
+                ties += 1
+                if rng_below(rng, ties) == 0:
+                    best_child = child
+        return best_child
+
+    cdef int _most_visited(self, int node, Rng * rng) noexcept nogil:
+        """
+        Return the most visited child of the node, breaking ties uniformly at
+        random with the passed generator, NO_NODE if it has no children.
+        """
+        cdef int child, best_child = NO_NODE, best = -1, ties = 0
+        if atomic_load_int(&self.status[node]) != EXPANDED:
+            return NO_NODE
+        for child in range(self.first_child[node], self.first_child[node] + self.n_children[node]):
+            if self.visits[child] > best:
+                best = self.visits[child]
+                best_child = child
+                ties = 1
+            elif self.visits[child] == best:
+                ties += 1
+                if rng_below(rng, ties) == 0:
+                    best_child = child
+        return best_child
+
+    cdef bint _decided(self, int node, double remaining) noexcept nogil:
+        """
+        Return whether the most visited child of the node stays ahead even if
+        the passed number of remaining simulations all go to the runner up,
+        so searching on can not change the move played.
+        """
+        cdef int child, v, best = 0, second = 0
+        if atomic_load_int(&self.status[node]) != EXPANDED:
+            return False
+        for child in range(self.first_child[node], self.first_child[node] + self.n_children[node]):
+            v = self.visits[child]
+            if v > best:
+                second = best
+                best = v
+            elif v > second:
+                second = v
+        return best - second > remaining
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _amaf_update(self, int node, const uint64_t * owned, double reward) noexcept nogil:
+        """
+        Add one AMAF visit and the passed reward to every child of an expanded
+        node whose move is set in the owned bitboard. The children are indexed
+        by their cell so the update is a masked add over their contiguous
+        range, without a branch per child.
+        """
+        cdef:
+            int child, cell
+            int first = self.first_child[node]
+            int last = first + self.n_children[node]
+            int hit
+
+        if self.status[node] != EXPANDED:
+            return
+        for child in range(first, last):
+            cell = self.move[child]
+            hit = (owned[cell >> 6] >> (cell & 63)) & 1
+            self.rave_visits[child] += hit
+            self.rave_reward[child] += hit * reward
+
+    cpdef int new_root(self):
+        """
+        Allocate a fresh node without parent and return its handle.
+        """
+        cdef int node = self._alloc(1)
+        if node == NO_NODE:
+            raise MemoryError("Node pool is full")
+        self._reset(node, NO_NODE, NO_NODE)
+        return node
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int _mark(self, int root, int min_visits) noexcept nogil:
+        """
+        Set forward to 0 for the nodes kept by a compaction and to NO_NODE for
+        the others, return how many are kept. Children are always allocated
+        after their parent so one ascending sweep from the root sees every
+        parent before its children.
+        """
+        cdef int i, c, kept = 0
+        for i in range(root, self.n_nodes):
+            self.forward[i] = NO_NODE
+        self.forward[root] = 0
+        for i in range(root, self.n_nodes):
+            if self.forward[i] == NO_NODE:
+                continue
+            kept += 1
+            if self.status[i] == EXPANDED and (i == root or self.visits[i] >= min_visits):
+                for c in range(self.first_child[i], self.first_child[i] + self.n_children[i]):
+                    self.forward[c] = 0
+        return kept
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cpdef int compact(self, int root, int min_visits=0):
+        """
+        Keep only the subtree of the passed root and release every other node
+        at once. Below the root, nodes visited fewer than min_visits times also
+        lose their children and become leaves again. Kept nodes slide down in
+        allocation order, so every move goes to a lower slot and the arrays can
+        be compacted in place. Must not run while threads search the pool.
+        Returns:
+            int: the new handle of the root, every other handle changes too
+        """
+        cdef int i, j, first, kept = 0
+
+        self._mark(root, min_visits)
+        for i in range(root, self.n_nodes):
+            if self.forward[i] != NO_NODE:
+                self.forward[i] = kept
+                kept += 1
+
+        for i in range(root, self.n_nodes):
+            j = self.forward[i]
+            if j == NO_NODE:
+                continue
+            first = self.first_child[i]
+            self.move[j] = self.move[i]
+            self.parent[j] = NO_NODE if i == root else self.forward[self.parent[i]]
+            self.status[j] = self.status[i]
+            self.n_children[j] = self.n_children[i]
+            self.first_child[j] = NO_NODE
+            if self.status[j] == EXPANDED:
+                if self.forward[first] != NO_NODE:
+                    self.first_child[j] = self.forward[first]
+                else:
+                    self.n_children[j] = 0
+                    self.status[j] = LEAF
+            self.visits[j] = self.visits[i]
+            self.reward[j] = self.reward[i]
+            self.rave_visits[j] = self.rave_visits[i]
+            self.rave_reward[j] = self.rave_reward[i]
+            self.prior_visits[j] = self.prior_visits[i]
+            self.prior_reward[j] = self.prior_reward[i]
+
+        self.n_nodes = kept
+        return 0
+
+    cpdef int prune(self, int root):
+        """
+        Make room in a full arena by compacting the subtree of root with the
+        lowest power of two visit threshold that keeps at most half of the
+        capacity. The root and its children are always kept.
+        Returns:
+            int: the new handle of the root
+        """
+        cdef int min_visits = 1
+        while (self._mark(root, min_visits) > self.capacity // 2
+               and min_visits <= self.visits[root]):
+            min_visits *= 2
+        return self.compact(root, min_visits)
+
+    cpdef dict child_visits(self, int node):
+        """
+        Return the visit count of each child of the node keyed by the cell
+        index of its move, empty if the node is not expanded.
+        """
+        cdef int child
+        if self.status[node] != EXPANDED:
+            return {}
+        return {self.move[child]: self.visits[child]
+                for child in range(self.first_child[node], self.first_child[node] + self.n_children[node])}
+
+    cpdef dict children(self, int node):
+        """
+        Return the handle of each child of the node keyed by the cell index
+        of its move, empty if the node is not expanded.
+        """
+        cdef int child
+        if self.status[node] != EXPANDED:
+            return {}
+        return {self.move[child]: child
+                for child in range(self.first_child[node], self.first_child[node] + self.n_children[node])}
+
+    cpdef int node_visits(self, int node):
+        """
+        Return the number of times the node was visited.
+        """
+        return self.visits[node]
+
+    cpdef void clear(self):
+        """
+        Release every node at once, handles given out before are invalid.
+        """
+        self.n_nodes = 0
@@ -4,11 +4,15 @@
 # -----------------------------------------------------------
 
 import socket
+from os import environ
 
 from gamestate import GameState
 from quality_rave import QRAVEEngine
-from utils import extract_last_move_from_board
+from utils import extract_last_move_from_board, Ponderer
+from time_manager import TimeManager
+from search_profile import SearchProfile
 from random import choice
+from sys import argv
 
 
 class MCTSAgent():
@@ -20,12 +24,16 @@ class MCTSAgent():
     ----------
     host : str
         host to connect with other agents
-    port : str
-        port used for the socket
-    time_limit : int
-        maximum number of seconds allowed per move
+    port : int
+        port used for the socket, read from HEX_PORT
+    clock : TimeManager
+        budgets the search time of each move from the clock left
     agent: Agent
         Agent engine object used to compute moves
+    ponderer: Ponderer
+        searches on the opponent's clock, None when pondering is off
+    profile: SearchProfile
+        profile of the searches of the engine, None when profiling is off
 
 
     Methods
@@ -52,11 +60,11 @@ class MCTSAgent():
     """
 
     host = "127.0.0.1"
-    port = 1234
-    time_limit = 7
+    # the referee passes the port of the game, 1234 when it runs alone
+    port = int(environ.get("HEX_PORT", 1234))
     agent = None
 
-    def __init__(self, board_size=11):
+    def __init__(self, board_size=11, ponder=False, profile=None):
         """
         Constructs all the necessary attributes for the Agent object.
 
@@ -78,7 +86,10 @@ class MCTSAgent():
         self.board_size = board_size
         self.colour = ""
         self.turn_count = 0
-        self.agent = QRAVEEngine(GameState(board_size))
+        self.profile = profile
+        self.agent = QRAVEEngine(GameState(board_size), profile=profile)
+        self.ponderer = Ponderer() if ponder else None
+        self.clock = TimeManager()
 
     def run(self):
         """
@@ -86,7 +97,13 @@ class MCTSAgent():
         """
 
         while True:
+            # keep searching until the opponent replies
+            if self.ponderer is not None:
+                self.ponderer.start(self.agent)
             data = self.s.recv(1024)
+            self.clock.start_turn()
+            if self.ponderer is not None:
+                self.ponderer.stop()
             if not data:
                 break
 
@@ -120,7 +137,7 @@ class MCTSAgent():
                     self.colour = self.opp_colour()
                     if s[3] == self.colour:
                         last_move = extract_last_move_from_board(s[2])
-                        self.agent = QRAVEEngine(GameState(11))
+                        self.agent = QRAVEEngine(GameState(11), profile=self.profile)
                         self.agent.move((last_move[0], last_move[1]))
                         self.make_move()
 
@@ -152,11 +169,13 @@ class MCTSAgent():
         Perform a search for a limited amount of time
         Get the best move and send it
         """
-        self.agent.search(self.get_time_limit())
+        # visits of the tree kept from the previous moves
+        carried_visits = self.agent.carried_visits
+        self.agent.search(self.clock.budget(self.agent.root_state), stop_early=True)
 
         # Performance measures
         num_rollouts, node_count, run_time = self.agent.statistics()
-        print(f'QB Agent: {num_rollouts}, {node_count}, {run_time}')
+        print(f'QB Agent: {num_rollouts}, {node_count}, {run_time}, {carried_visits}')
 
         move = self.agent.best_move()
         # print("Best move suggested: ", move)
@@ -178,7 +197,7 @@ class MCTSAgent():
             if self.test_swap(action):
                 self.s.sendall(bytes("SWAP\n", "utf-8"))
                 # self.colour = self.opp_colour()
-                self.agent = QRAVEEngine(GameState(11))
+                self.agent = QRAVEEngine(GameState(11), profile=self.profile)
                 self.agent.move((action[0], action[1]))
             else:
                 self.choose_move()
@@ -189,18 +208,9 @@ class MCTSAgent():
                 self.s.sendall(bytes(f"{first_move[0]},{first_move[1]}\n", "utf-8"))
             else:
                 self.choose_move()
+        self.clock.end_turn()
         self.turn_count += 1
 
-    def get_time_limit(self):
-        if self.turn_count <= 10:
-            return 15
-        elif self.turn_count <= 30:
-            return 8
-        elif self.turn_count <= 50:
-            return 3
-        else:
-            return 1
-
     def test_swap(self, action) -> bool:
         second_raw_list = [9, 10]
         ninth_raw_list = [0, 1]
@@ -247,5 +257,10 @@ class MCTSAgent():
 
 
 if (__name__ == "__main__"):
-    agent = MCTSAgent()
+    profile = None
+    for argument in argv:
+        # one JSON line per search is appended to the file
+        if argument.startswith("profile="):
+            profile = SearchProfile(open(argument.split("=", 1)[1], "a"))
+    agent = MCTSAgent(ponder="ponder" in argv, profile=profile)
     agent.run()
@@ -1,25 +1,26 @@
 # keep this line for cython directives
 
 from copy import deepcopy
-from libc.math cimport sqrt, log
-from libc.stdlib cimport rand
-from queue import Queue
-from time import time
-from numpy import where
-import numpy as np
-cimport numpy as np
+from os import urandom
+from libc.math cimport sqrt, INFINITY
 import cython
+import numpy as np
 
-from gamestate cimport GameState
-from meta import GameMeta, MCTSMeta
-from operator import itemgetter
+from libc.stdint cimport uint64_t
 
-np.import_array()
-DTYPE = np.int
-ctypedef np.int_t DTYPE_t
+from clock cimport monotonic, tick
+from fastrand cimport Rng, rng_seed, rng_below, derive_seed
+from gamestate cimport GameState, BB_WORDS, MAX_CELLS
+from nodepool cimport NodePool, EXPANDED, TERMINAL, NO_NODE, RAVE_LINEAR
+from meta import GameMeta, MCTSMeta
+from rollout cimport stones_mask
+from rollout import RandomFillRollout
+from batch_rollout import BatchRollout
+from transposition cimport TranspositionTable
+from search_profile cimport (SearchProfile, rollout_length, PHASE_SELECT, PHASE_EXPAND,
+                             PHASE_ROLLOUT, PHASE_BACKUP)
 
 cdef extern from "<math.h>" nogil:
-    float fmaxf(float, float)
     double exp(double)
  
 cdef class RollingStatistic():
@@ -50,14 +51,10 @@ cdef class RollingStatistic():
     cdef void clear(self):
         self.n, self.mean, self.M2 = 0, 0.0, 0.0
 
-@cython.wraparound(False)
-@cython.boundscheck(False)
-cdef cchoice(arr):       
-    return arr[rand() % len(arr)] 
 
 @cython.wraparound(False)
 @cython.boundscheck(False)
-cdef bint expand(Node parent, GameState state):
+cdef bint expand(NodePool pool, int parent, GameState state):
     """
     Generate the children of the passed "parent" node based on the available
     moves in the passed gamestate and add them to the tree.
@@ -65,144 +62,34 @@ cdef bint expand(Node parent, GameState state):
     Returns:
         object:
     """
+    cdef uint64_t empty[BB_WORDS]
 
+    if pool.status[parent] == TERMINAL:
+        return False
     if state.winner() != GameMeta.PLAYERS["none"]:
         # game is over at this node so nothing to expand
+        pool.status[parent] = TERMINAL
         return False
 
-    #for move in state.moves():
-    #    children.append(Node(move, parent))
-    children = [Node(move, parent) for move in state.moves()]
+    state.empty_mask(empty)
+    return pool._expand(parent, empty)
 
-    parent.add_children(children)
-    return True
-
-@cython.boundscheck(False)
-@cython.wraparound(False)
-cdef tuple roll_out(state):
+cdef tuple roll_out(object policy, GameState state, uint64_t * red_bits, uint64_t * blue_bits):
         """
-        Simulate a random game except that we play all known critical
-        cells first, return the winning player and record critical cells at the end.
+        Simulate a random game from the passed state with the rollout policy,
+        return the winning player and the stones each player had played when the
+        game was decided, and write the cells each player owns at the end to
+        the passed bitboards.
 
         """
+        outcome = policy.run(state)
+        players_moves = policy.stones_played()
 
-        cdef:
-            (int, int) move
-            np.ndarray[DTYPE_t, ndim=1] blue_rave_ptsx, blue_rave_ptsy, red_rave_ptsx, red_rave_ptsy
-
-        moves = state.moves()
-        while state.winner() == GameMeta.PLAYERS["none"]:
-            move = cchoice(moves)
-            state.play(move)
-            moves.remove(move)
-
-        players_moves = state.get_rb_played()
+        stones_mask(policy, GameMeta.PLAYERS["red"], state.size, red_bits)
+        stones_mask(policy, GameMeta.PLAYERS["blue"], state.size, blue_bits)
 
-        blue_rave_ptsx, blue_rave_ptsy = where(state.board == GameMeta.PLAYERS["blue"])
-        red_rave_ptsx, red_rave_ptsy = where(state.board == GameMeta.PLAYERS["red"])
-
-        return state.winner(), players_moves, red_rave_ptsx, red_rave_ptsy, blue_rave_ptsx, blue_rave_ptsy
+        return outcome, players_moves
         
-cdef class Node:
-    """
-    A class to represent a node from the Game Tree. It is used for Monte Carlo Tree Search.
-    It contains latest move applied from parent to current node, performance metrics,
-    parent node, children nodes and outcome.
-    ...
-
-    Attributes
-    ----------
-    move : tuple
-        move which lead from parent to current node
-    parent : Node
-        parent node
-    children : dict
-        dictionary of all possible moves from the current node
-    outcome: int
-        if node is a leaf, then outcome is equal to numeric representation
-        of the winner. None otherwise
-    counter_visits: int
-        times this position was visited
-    reward_average: int
-        average reward (wins-losses) from this position
-    rave_counter_visits: int
-        times this move has appeared in a rollout
-    rave_reward_average: int
-        times this move has been critical in a rollout (lead to an outcome)
-
-    Methods
-    -------
-    add_children(children: dict):
-        Add a list of nodes to the children of this node.
-    """
-
-    cdef public:
-        tuple move
-        Node parent
-        dict children
-        int outcome
-        int counter_visits
-        float reward_average
-        int rave_counter_visits
-        float rave_reward_average
-
-    def __init__(self, move: tuple = None, parent: object = None):
-        """
-        Initialize a new node with optional move and parent and initially empty
-        children list and rollout statistics and unspecified outcome.
-
-        Parameters:
-                move (tuple): the move that generated the current node
-                parent (Node): parent node
-        """
-
-        self.move = move
-        self.parent = parent
-        self.children = {}
-        self.outcome = GameMeta.PLAYERS['none']
-
-        # performance metrics
-        self.counter_visits = 0  # times this position was visited
-        self.reward_average = 0  # average reward (wins-losses) from this position
-        self.rave_counter_visits = 0  # times this move has appeared in a rollout
-        self.rave_reward_average = 0  # times this move has been critical in a rollout
-
-    cpdef void add_children(self, list children):
-        """
-        Add a list of nodes to the children of this node.
-        """
-        for child in children:
-            self.children[child.move] = child
-
-    cpdef float value(self, float explore = MCTSMeta.EXPLORATION, float rave_const = MCTSMeta.RAVE_CONST):
-        '''
-        Calculate the evaluation formula applied to the Game Tree
-
-            Parameters:
-                    explore (float): how much the value should favor nodes 
-                                    that have yet to be thoroughly explored 
-                                    versus nodes that seem to have a high win rate
-
-                    rave_const (float): constant to quantify how to balance between UCT and AMAF
-
-            Returns:
-                    (float): node score
-        '''
-        cdef float alpha, UCT, AMAF
-
-        # unless explore is set to zero, maximally favor unexplored nodes
-        if self.counter_visits == 0:
-            return 0 if explore == 0 else GameMeta.INF
-        else:
-            # rave valuation:
-            alpha = fmaxf(0, (rave_const - self.counter_visits) / rave_const)
-            UCT = self.reward_average / self.counter_visits + explore * sqrt(
-                2 * log(self.parent.counter_visits) / self.counter_visits)
-            AMAF = self.rave_reward_average / self.rave_counter_visits if self.rave_counter_visits != 0 else 0
-            v = (1 - alpha) * UCT + alpha * AMAF
-            return (1 - alpha) * UCT + alpha * AMAF
-
-
 cdef class QRAVEEngine():
 
     """
@@ -216,35 +103,62 @@ cdef class QRAVEEngine():
     ----------
     root_state : GameState
         object to store the current game situation
-    root : Node
-        root of the tree search
+    scratch_state : GameState
+        preallocated state reset from root_state for every simulation
+    pool : NodePool
+        arena holding the nodes of the tree
+    root : int
+        handle of the root of the tree search
     node_count : int
         the number of nodes in a tree
-    run_time: int
+    run_time: float
         time taken for each run
     num_rollouts: int
         the number of rollouts for each search
-    exploration: int
+    carried_visits: int
+        visits of the subtree kept by the last move, 0 when the tree
+        was thrown away
+    interrupted: bool
+        set from another thread to end the running search early
+    seed: int
+        base seed of every random stream of the engine, the same seed and
+        iteration budget always grow the same tree
+    explore: float
         specifies how much the value should favor nodes 
         that have yet to be thoroughly explored versus nodes
         that seem to have a high win rate
+    rave_const: float
+        visits after which a node is valued by UCT alone
+    rollout_policy: RandomFillRollout
+        policy used to simulate games from the leaves
+    batch_size: int
+        number of games simulated together from each leaf, more than one
+        switches the simulations to a BatchRollout
+    profile: SearchProfile
+        phase times and depth and length distributions of the last search,
+        None when profiling is off
+    transpositions: TranspositionTable
+        statistics shared between the nodes of one position, None to treat
+        every move order as a distinct position
 
     Methods
     -------
-    search(time_budget: int):
+    search(time_budget: float, stop_early: bool, iterations: int, node_limit: int):
         Search and update the search tree for a
         specified amount of time in seconds.
     select_node():
         Select a node in the tree to preform a single simulation from.
-    expand(parent: Node, state: GameState):
+    expand(parent: int, state: GameState):
         Generate the children of the passed "parent" node based on the available
         moves in the passed gamestate and add them to the tree.
     roll_out(state: GameState):
         Simulate an entirely random game from the passed state and return the winning
         player.
-    backup(node: Node, turn: int, outcome: int):
+    backup(node: int, turn: int, outcome: int):
         Update the node statistics on the path from the passed node to root to reflect
         the outcome of a randomly simulated playout.
+    backprop_batch(node: int, turn: int, outcomes: ndarray):
+        Same as backup for a whole batch of playouts simulated from one leaf.
     best_move():
         Return the best move according to the current tree.
     move(move: tuple):
@@ -256,33 +170,91 @@ cdef class QRAVEEngine():
     statistics():
         Getter for performance metrics
     tree_size():
-        Count nodes in tree by BFS.
+        Count nodes reachable from the root with a full walk, a diagnostic
+        never run by search.
     """
 
     cdef public:
         GameState root_state
-        Node root
+        GameState scratch_state
+        NodePool pool
+        int root
         int node_count
-        int run_time
+        double run_time
         int num_rollouts
+        int carried_visits
+        bint interrupted
+        object seed
 
         float a_const
         float k_const
+        double explore
+        double rave_const
 
         RollingStatistic rs1, rs2
 
-
-    def __init__(self, state: GameState = GameState(11)):
+        object rollout_policy
+        int batch_size
+        object batch_rollout
+        SearchProfile profile
+        TranspositionTable transpositions
+
+    cdef:
+        Rng rng
+        # keys of the positions on the path of the running simulation, the
+        # root first
+        uint64_t root_key
+        uint64_t path_keys[MAX_CELLS + 1]
+        int path_length
+
+    def __init__(self, state: GameState = GameState(11), explore=MCTSMeta.EXPLORATION,
+                 rave_const=MCTSMeta.RAVE_CONST, *, rollout_policy=None, batch_size=1, max_nodes=1 << 21,
+                 seed=None, profile=None, transpositions=None):
+        """
+        Parameters:
+                state (GameState): state to search from
+                explore (float): exploration constant of UCT
+                rave_const (float): visits after which AMAF is ignored
+                rollout_policy (object): object whose run(state) returns the
+                                winner of a simulated game, stones_played()
+                                the stones of each player when it was decided
+                                and points(colour) the cells of a colour at
+                                its end, a RandomFillRollout if omitted
+                batch_size (int): games simulated together from each leaf
+                max_nodes (int): capacity of the node pool, reaching it
+                                 prunes the tree
+                seed (int): base seed of every random stream of the engine,
+                            drawn from the operating system if omitted
+                profile (SearchProfile): profile filled by every search,
+                            None for no profiling
+                transpositions (TranspositionTable): table sharing the
+                            statistics of transposed positions, None to
+                            search without one
+        """
         self.root_state = deepcopy(state)
-        self.root = Node()
+        self.scratch_state = deepcopy(state)
+        self.pool = NodePool(max_nodes)
+        self.root = self.pool.new_root()
         self.run_time = 0
         self.node_count = 0
         self.num_rollouts = 0
+        self.carried_visits = 0
+        self.interrupted = False
 
         self.a_const = MCTSMeta.A_CONST
         self.k_const = MCTSMeta.K_CONST
+        self.explore = explore
+        self.rave_const = rave_const
         self.rs1 = RollingStatistic()
         self.rs2 = RollingStatistic()
+        self.seed = seed if seed is not None else int.from_bytes(urandom(8), "little")
+        rng_seed(&self.rng, derive_seed(self.seed, 0))
+        self.rollout_policy = (rollout_policy if rollout_policy is not None
+                               else RandomFillRollout(derive_seed(self.seed, 1)))
+        self.batch_size = batch_size
+        self.batch_rollout = BatchRollout(state.size, derive_seed(self.seed, 2)) if batch_size > 1 else None
+        self.profile = profile
+        self.transpositions = transpositions
 
     cpdef void set_gamestate(self, object state):
         """
@@ -291,7 +263,10 @@ cdef class QRAVEEngine():
         state.
         """
         self.root_state = deepcopy(state)
-        self.root = Node()
+        self.scratch_state = deepcopy(state)
+        self.pool.clear()
+        self.root = self.pool.new_root()
+        self.carried_visits = 0
 
     cpdef void move(self, tuple move):
         """
@@ -301,18 +276,20 @@ cdef class QRAVEEngine():
         Args:
             move:
         """
-        if move in self.root.children:
-            child = self.root.children[move]
-            child.parent = None
-            self.root = child
-            self.root_state.play(child.move)
+        cdef int child = self.pool._child(self.root, move[0] * self.root_state.size + move[1])
+        self.root_state.play(move)
+        if child != NO_NODE:
+            # keep the subtree of the move and free the rest of the pool at once
+            self.root = self.pool.compact(child)
+            self.carried_visits = self.pool.visits[self.root]
             return
 
         # if for whatever reason the move is not in the children of
         # the root just throw out the tree and start over
-        self.root_state.play(move)
-        self.root = Node()
-    
+        self.pool.clear()
+        self.root = self.pool.new_root()
+        self.carried_visits = 0
+
     @cython.boundscheck(False)
     @cython.wraparound(False)
     cpdef best_move(self):
@@ -321,57 +298,105 @@ cdef class QRAVEEngine():
         Returns:
             best move in terms of the most simulations number unless the game is over
         """
-
-        cdef:
-            list max_nodes
-            int max_value
-            Node bestchild
-            Node n
-            tuple t
+        cdef int bestchild
 
         if self.root_state.winner() != GameMeta.PLAYERS['none']:
             return GameMeta.GAME_OVER
 
         # choose the move of the most simulated node breaking ties randomly
-        max_nodes = [(n.counter_visits, n) for n in self.root.children.values()]
-        max_value = max(max_nodes, key=itemgetter(0))[0]
-        max_nodes = [t[1] for t in max_nodes if t[0] == max_value]
-        #max_value = max(self.root.children.values(), key=lambda n: n.counter_visits).counter_visits
-        #max_nodes = [n for n in self.root.children.values() if n.counter_visits == max_value]
-        bestchild = cchoice(max_nodes)
-        return bestchild.move
+        bestchild = self.pool._most_visited(self.root, &self.rng)
+        if bestchild == NO_NODE:
+            raise IndexError("No move has been searched from the root")
+        return (self.pool.move[bestchild] // self.root_state.size,
+                self.pool.move[bestchild] % self.root_state.size)
     
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    cpdef void search(self, int time_budget):
+    cpdef void search(self, double time_budget=INFINITY, bint stop_early=False,
+                      int iterations=0, int node_limit=0):
         """
-        Search and update the search tree for a specified amount of time in seconds.
+        Search and update the search tree until the first limit is reached:
+        time_budget seconds, iterations simulations or node_limit nodes in the
+        tree, where a zero count is no limit. The clock is only read every
+        CLOCK_CHECK simulations. With stop_early the search also ends once the
+        rest of the time budget can not change the most visited move.
         """
 
         cdef:
-            long start_time
-            int num_rollouts, turn
-            Node node
+            double start_time, elapsed, deadline
+            int num_rollouts, next_check, loops, turn
+            int node
             GameState state
-            int outcome
-            np.ndarray[DTYPE_t, ndim=1] red_rave_ptsx, red_rave_ptsy, blue_rave_ptsx, blue_rave_ptsy
-
-        start_time = time()
+            int outcome, played
+            uint64_t red_bits[BB_WORDS]
+            uint64_t blue_bits[BB_WORDS]
+            SearchProfile profile = self.profile
+            int root_played = self.root_state.red_played + self.root_state.blue_played
+
+        if profile is not None:
+            profile.clear()
+        if self.transpositions is not None:
+            self.transpositions.new_generation()
+            self.root_key = self.transpositions._hash(self.root_state)
+        start_time = monotonic()
+        deadline = start_time + time_budget
         num_rollouts = 0
-
-        # do until we exceed our time budget
-        while time() - start_time < time_budget:
+        loops = 0
+        next_check = MCTSMeta.DECIDED_CHECK
+
+        # do until we reach the first limit
+        while not self.interrupted:
+            if iterations and num_rollouts >= iterations:
+                break
+            if node_limit and self.pool.n_nodes >= node_limit:
+                break
+            if tick(loops, deadline):
+                break
+            loops += 1
+            if stop_early and num_rollouts >= next_check:
+                next_check = num_rollouts + MCTSMeta.DECIDED_CHECK
+                elapsed = monotonic() - start_time
+                if elapsed > 0 and self.pool._decided(
+                        self.root, num_rollouts / elapsed * (time_budget - elapsed)):
+                    break
+            if profile is not None:
+                profile._start()
             node, state = self.select_node()
             turn = state.turn()
-            outcome, players_moves, red_rave_ptsx, red_rave_ptsy, blue_rave_ptsx, blue_rave_ptsy = roll_out(state)
-            self.backprop(node, turn, outcome, players_moves, red_rave_ptsx, red_rave_ptsy, blue_rave_ptsx, blue_rave_ptsy)
+            played = state.red_played + state.blue_played
+            if self.batch_size > 1:
+                outcomes = self.batch_rollout.run(state, self.batch_size)
+                if profile is not None:
+                    profile._lap(PHASE_ROLLOUT)
+                self.backprop_batch(node, turn, outcomes)
+                if self.transpositions is not None:
+                    self.transpositions._share(self.pool, node, self.path_keys, self.path_length)
+                num_rollouts += self.batch_size
+                if profile is not None:
+                    profile._lap(PHASE_BACKUP)
+                    profile._record(played - root_played, state.n_cells - played)
+                continue
+            outcome, players_moves = roll_out(self.rollout_policy, state, red_bits, blue_bits)
+            if profile is not None:
+                profile._lap(PHASE_ROLLOUT)
+                profile._record(played - root_played, rollout_length(
+                    played, state.red_played + state.blue_played, state.n_cells))
+            self.backprop(node, turn, outcome, players_moves, red_bits, blue_bits)
+            if self.transpositions is not None:
+                self.transpositions._share(self.pool, node, self.path_keys, self.path_length)
             num_rollouts += 1
+            if profile is not None:
+                profile._lap(PHASE_BACKUP)
 
-        run_time = time() - start_time
-        node_count = self.tree_size()
+        run_time = monotonic() - start_time
+        # the pool only ever holds the tree of the root
+        node_count = self.pool.n_nodes
         self.run_time = run_time
         self.node_count = node_count
         self.num_rollouts = num_rollouts
+        if profile is not None:
+            profile.report({"engine": type(self).__name__, "ply": root_played, "rollouts": num_rollouts,
+                            "nodes": node_count, "seconds": run_time})
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
@@ -381,50 +406,68 @@ cdef class QRAVEEngine():
         """
 
         cdef:
-            Node node
+            int node, first
             GameState state
-            list n_values
-            float max_value
-            Node n
-            tuple t
+            TranspositionTable table = self.transpositions
+
+        # make room first so the leaf reached below can always be expanded
+        if self.pool.n_nodes + self.root_state.n_cells > self.pool.capacity:
+            self.root = self.pool.prune(self.root)
 
         node = self.root
-        state = deepcopy(self.root_state)
+        # reuse the preallocated scratch state instead of copying the root
+        state = self.scratch_state
+        state.copy_from(self.root_state)
+        if table is not None:
+            self.path_keys[0] = self.root_key
+            self.path_length = 1
 
         # stop if we reach a leaf node
-        while node.children:
-            n_values = [(n.value(), n) for n in node.children.values()]
-            max_value = max(n_values, key=itemgetter(0))[0]
-            n_values = [t[1] for t in n_values if t[0] == max_value]
-
-            node = cchoice(n_values)
-            state.play(node.move)
+        while self.pool.status[node] == EXPANDED:
+            node = self.pool._select(node, self.explore, self.rave_const, RAVE_LINEAR, &self.rng)
+            if table is not None:
+                self.path_length = table._extend(self.path_keys, self.path_length,
+                                                 state.to_play, self.pool.move[node])
+            state.play_index(self.pool.move[node])
 
             # if some child node has not been explored select it before expanding
             # other children
-            if node.counter_visits == 0:
+            if self.pool.visits[node] == 0:
+                # guide it with what other move orders learnt of its position
+                if table is not None:
+                    table._seed(self.pool, node, self.path_keys[self.path_length - 1])
+                if self.profile is not None:
+                    self.profile._lap(PHASE_SELECT)
                 return node, state
 
+        if self.profile is not None:
+            self.profile._lap(PHASE_SELECT)
         # if we reach a leaf node generate its children and return one of them
         # if the node is terminal, just return the terminal node
-        if expand(node, state):
-            node = cchoice(list(node.children.values()))
-            state.play(node.move)
+        if expand(self.pool, node, state):
+            node = self.pool.first_child[node] + rng_below(&self.rng, self.pool.n_children[node])
+            if table is not None:
+                self.path_length = table._extend(self.path_keys, self.path_length,
+                                                 state.to_play, self.pool.move[node])
+                table._seed(self.pool, node, self.path_keys[self.path_length - 1])
+            state.play_index(self.pool.move[node])
+        if self.profile is not None:
+            self.profile._lap(PHASE_EXPAND)
         return node, state
 
     @cython.boundscheck(False)
     @cython.wraparound(False)
-    cdef void backprop(self, Node node, int turn, int outcome, tuple players_moves, np.ndarray[DTYPE_t, ndim=1] red_rave_ptsx, np.ndarray[DTYPE_t, ndim=1] red_rave_ptsy, np.ndarray[DTYPE_t, ndim=1] blue_rave_ptsx, np.ndarray[DTYPE_t, ndim=1] blue_rave_ptsy):
+    cdef void backprop(self, int node, int turn, int outcome, tuple players_moves,
+                       const uint64_t * red_bits, const uint64_t * blue_bits):
         """
         Update the node statistics on the path from the passed node to root to reflect
-        the outcome of a randomly simulated playout.
+        the outcome of a randomly simulated playout. The cells of each colour
+        at the end of the playout are bitboards, so every ancestor takes its
+        AMAF update as one masked add over its children.
         """
         # note that reward is calculated for player who just played
         # at the node and not the next player to play
-        cdef:
-            int index
-            double temp_reward
-            (int, int) point
+        cdef double temp_reward
 
         reward = -1 if outcome == turn else 1
 
@@ -437,29 +480,79 @@ cdef class QRAVEEngine():
             self.rs1.clear()
             self.rs2.clear()
 
-        while node != None:
+        while node != NO_NODE:
             if turn == GameMeta.PLAYERS["red"]:
                 temp_reward = reward + (reward * self.a_const * qb[0])
-                node.rave_reward_average += temp_reward
-                for index in range(red_rave_ptsx.shape[0]):
-                    point = (red_rave_ptsx[index], red_rave_ptsy[index])
-                    if point in node.children:
-                        node.children[point].rave_reward_average += -temp_reward
-                        node.children[point].rave_counter_visits += 1
+                self.pool.rave_reward[node] += temp_reward
+                self.pool._amaf_update(node, red_bits, -temp_reward)
             else:
                 temp_reward = reward + (reward * self.a_const * qb[1])
-                node.rave_reward_average += temp_reward
-                for index in range(blue_rave_ptsx.shape[0]):
-                    point = (blue_rave_ptsx[index], blue_rave_ptsy[index])
-                    if point in node.children:
-                        node.children[point].rave_reward_average += -temp_reward
-                        node.children[point].rave_counter_visits += 1
-
-            node.counter_visits += 1
-            node.reward_average += reward
+                self.pool.rave_reward[node] += temp_reward
+                self.pool._amaf_update(node, blue_bits, -temp_reward)
+
+            self.pool.visits[node] += 1
+            self.pool.reward[node] += reward
             turn = GameMeta.PLAYERS['red'] if turn == GameMeta.PLAYERS['blue'] else GameMeta.PLAYERS['blue']
             reward = -reward
-            node = node.parent
+            node = self.pool.parent[node]
+
+    cdef void backprop_batch(self, int node, int turn, object outcomes):
+        """
+        Update the node statistics on the path from the passed node to root to reflect
+        the outcomes of a batch of playouts simulated from the node. The length
+        statistics take the whole batch before the quality bonuses of its games
+        are computed.
+        """
+        cdef:
+            int child, first
+            RollingStatistic stats
+            int index, sign = 1
+            int n = outcomes.shape[0]
+
+        rewards = np.where(outcomes == turn, -1, 1)
+        players_moves = self.batch_rollout.stones_played()
+        for red_moves, blue_moves in players_moves:
+            self.rs1.update(red_moves)
+            self.rs2.update(blue_moves)
+
+        # temporary rewards of every game for both colours, as in compute_reward
+        bonuses = []
+        for stats, lengths in ((self.rs1, players_moves[:, 0]), (self.rs2, players_moves[:, 1])):
+            deviation = stats.std()
+            lmdb = (stats.mean - lengths) / deviation if deviation != 0 else np.zeros(n)
+            bonuses.append(-1 + (2 / (1 + np.exp(-lmdb * self.k_const))))
+        red_temp = rewards + rewards * self.a_const * bonuses[0]
+        blue_temp = rewards + rewards * self.a_const * bonuses[1]
+
+        if self.num_rollouts == 0:
+            self.rs1.clear()
+            self.rs2.clear()
+
+        red_stones = self.batch_rollout.stones(GameMeta.PLAYERS["red"]).astype(np.int64)
+        blue_stones = self.batch_rollout.stones(GameMeta.PLAYERS["blue"]).astype(np.int64)
+        red_counts, red_amaf = red_stones.sum(axis=0), red_temp @ red_stones
+        blue_counts, blue_amaf = blue_stones.sum(axis=0), blue_temp @ blue_stones
+        red_total, blue_total = red_temp.sum(), blue_temp.sum()
+        total = rewards.sum()
+
+        while node != NO_NODE:
+            if turn == GameMeta.PLAYERS["red"]:
+                temp_total, counts, amaf = red_total, red_counts, red_amaf
+            else:
+                temp_total, counts, amaf = blue_total, blue_counts, blue_amaf
+            self.pool.rave_reward[node] += sign * temp_total
+            if self.pool.status[node] == EXPANDED:
+                first = self.pool.first_child[node]
+                for child in range(first, first + self.pool.n_children[node]):
+                    index = self.pool.move[child]
+                    self.pool.rave_reward[child] += -sign * amaf[index]
+                    self.pool.rave_visits[child] += counts[index]
+
+            self.pool.visits[node] += n
+            self.pool.reward[node] += sign * total
+            turn = GameMeta.PLAYERS['red'] if turn == GameMeta.PLAYERS['blue'] else GameMeta.PLAYERS['blue']
+            sign = -sign
+            node = self.pool.parent[node]
 
     cpdef tuple statistics(self):
         return self.num_rollouts, self.node_count, self.run_time
@@ -487,14 +580,8 @@ cdef class QRAVEEngine():
 
     cpdef int tree_size(self):
         """
-        Count nodes in tree by BFS.
+        Count the nodes reachable from the root with a sweep of the whole
+        pool. Searches take node_count from the size of the pool in constant
+        time, this walk only checks it and must not run during a search.
         """
-        Q = Queue()
-        count = 0
-        Q.put(self.root)
-        while not Q.empty():
-            node = Q.get()
-            count += 1
-            for child in node.children.values():
-                Q.put(child)
-        return count
+        return self.pool._mark(self.root, 0)
@@ -0,0 +1,48 @@
+# keep this line for cython directives
+
+from libc.stdint cimport uint64_t
+from fastrand cimport Rng
+from gamestate cimport GameState, MAX_CELLS, BB_WORDS
+
+
+cdef void cell_mask(uint64_t * bits, int n_cells) noexcept nogil
+cdef bint connects(const uint64_t * bits, int colour, int size,
+                   const int * neighbor_table, int * stack) noexcept nogil
+cdef void points_mask(list points, int size, uint64_t * bits)
+cdef void stones_mask(object policy, int colour, int size, uint64_t * bits)
+
+
+cdef class RandomFillRollout:
+    """
+    Rollout policy that fills every empty cell of a state in random order and
+    decides the winner of the filled board with a single flood fill.
+    """
+    cdef:
+        Rng rng
+        int size
+        int n_cells
+        const int * neighbor_table
+        object _neighbor_owner
+        int first
+        int n_filled
+        int winner
+        int red_start
+        int blue_start
+        int order[MAX_CELLS]
+        uint64_t red_start_bits[BB_WORDS]
+        uint64_t blue_start_bits[BB_WORDS]
+        uint64_t red_bits[BB_WORDS]
+        uint64_t blue_bits[BB_WORDS]
+        int stack[MAX_CELLS]
+
+    cpdef void seed(self, uint64_t seed)
+    cpdef int run(self, GameState state)
+    cdef int _run(self, GameState state) noexcept nogil
+    cdef int _run_bits(self, int size, const int * neighbor_table,
+                       const uint64_t * red_bits, const uint64_t * blue_bits,
+                       int to_play, int red_played, int blue_played) noexcept nogil
+    cdef int _decisive_length(self) noexcept nogil
+    cdef void _join_owned(self, int * parent, const uint64_t * owned, int cell) noexcept nogil
+    cdef const uint64_t * _stones(self, int colour) noexcept nogil
+    cpdef list points(self, int colour)
+    cpdef tuple stones_played(self)
@@ -0,0 +1,312 @@
+# keep this line for cython directives
+
+from os import urandom
+cimport cython
+from libc.stdint cimport uint64_t
+from libc.string cimport memcpy, memset
+from fastrand cimport Rng, rng_seed, rng_below
+from gamestate cimport GameState, MAX_CELLS, BB_WORDS
+from geometry cimport NEIGHBOR_COUNT
+from meta import GameMeta
+
+
+cdef extern from *:
+    int __builtin_ctzll(unsigned long long) nogil
+
+
+cdef int RED = GameMeta.PLAYERS['red']
+cdef int BLUE = GameMeta.PLAYERS['blue']
+
+
+cdef inline bint test_bit(const uint64_t * bits, int index) noexcept nogil:
+    return (bits[index >> 6] >> (index & 63)) & 1
+
+
+cdef inline void set_bit(uint64_t * bits, int index) noexcept nogil:
+    bits[index >> 6] |= (<uint64_t> 1) << (index & 63)
+
+
+cdef inline int find(int * parent, int i) noexcept nogil:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+cdef void cell_mask(uint64_t * bits, int n_cells) noexcept nogil:
+    """
+    Write the bitboard with one bit set for each of the first n_cells cells.
+    """
+    cdef int w, low
+    for w in range(BB_WORDS):
+        low = w * 64
+        if n_cells >= low + 64:
+            bits[w] = ~(<uint64_t> 0)
+        elif n_cells > low:
+            bits[w] = ((<uint64_t> 1) << (n_cells - low)) - 1
+        else:
+            bits[w] = 0
+
+
+cdef void points_mask(list points, int size, uint64_t * bits):
+    """
+    Write the bitboard with one bit set for each (row, column) point.
+    """
+    cdef tuple point
+    memset(bits, 0, BB_WORDS * sizeof(uint64_t))
+    for point in points:
+        set_bit(bits, point[0] * size + point[1])
+
+
+cdef void stones_mask(object policy, int colour, int size, uint64_t * bits):
+    """
+    Write the bitboard of the cells owned by the passed colour at the end of
+    the last playout of a rollout policy. A RandomFillRollout hands over its
+    filled board directly, other policies go through points(colour).
+    """
+    if isinstance(policy, RandomFillRollout):
+        memcpy(bits, (<RandomFillRollout> policy)._stones(colour), BB_WORDS * sizeof(uint64_t))
+    else:
+        points_mask(policy.points(colour), size, bits)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef bint connects(const uint64_t * bits, int colour, int size,
+                   const int * neighbor_table, int * stack) noexcept nogil:
+    """
+    Return whether the stones in bits join the two edges of the passed
+    colour, top and bottom rows for red and first and last columns for blue.
+    The stack needs room for one entry per cell.
+    """
+    cdef:
+        int i, k, n, cell, top = 0
+        uint64_t seen[BB_WORDS]
+
+    memset(seen, 0, sizeof(seen))
+    for i in range(size):
+        cell = i if colour == RED else i * size
+        if test_bit(bits, cell):
+            set_bit(seen, cell)
+            stack[top] = cell
+            top += 1
+
+    while top > 0:
+        top -= 1
+        i = stack[top]
+        if (colour == RED and i >= (size - 1) * size) or (colour == BLUE and i % size == size - 1):
+            return True
+        for k in range(NEIGHBOR_COUNT):
+            n = neighbor_table[i * NEIGHBOR_COUNT + k]
+            if n < 0:
+                break
+            if test_bit(bits, n) and not test_bit(seen, n):
+                set_bit(seen, n)
+                stack[top] = n
+                top += 1
+    return False
+
+
+cdef class RandomFillRollout:
+    """
+    Rollout policy that fills every empty cell of a state in random order and
+    decides the winner of the filled board with a single flood fill.
+
+    In Hex a filled board always has exactly one winner and filling more cells
+    never changes it, so a uniformly random playout that stops at the first
+    connection and a uniformly random fill end with the same winner and do not
+    need a win check per stone. The passed state is never modified, the
+    filled board of the last playout is kept by the policy.
+
+    Methods
+    -------
+    seed(seed: int):
+        Restart the random generator from the passed seed.
+    run(state: GameState):
+        Play one playout from the passed state and return the winner.
+    points(colour: int):
+        Cells owned by the passed colour on the last filled board.
+    stones_played():
+        Red and blue stones on the board when the last playout was decided.
+    """
+
+    def __init__(self, seed=None):
+        """
+        Parameters:
+                seed (int): seed of the random generator, drawn from the
+                            operating system if omitted
+        """
+        if seed is None:
+            seed = int.from_bytes(urandom(8), "little")
+        self.seed(seed)
+        self.size = 0
+        self.n_filled = 0
+        self.winner = GameMeta.PLAYERS['none']
+
+    cpdef void seed(self, uint64_t seed):
+        rng_seed(&self.rng, seed)
+
+    cpdef int run(self, GameState state):
+        """
+        Simulate an entirely random game from the passed state and return the
+        winning player.
+        """
+        return self._run(state)
+
+    cdef int _run(self, GameState state) noexcept nogil:
+        # tables are cached by gamestate for the lifetime of the process
+        return self._run_bits(state.size, state.neighbor_table, state.red_bits, state.blue_bits,
+                              state.to_play, state.red_played, state.blue_played)
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int _run_bits(self, int size, const int * neighbor_table,
+                       const uint64_t * red_bits, const uint64_t * blue_bits,
+                       int to_play, int red_played, int blue_played) noexcept nogil:
+        """
+        Same as run for a position given by its bitboards, so searches that
+        keep their own boards need no GameState per thread.
+        """
+        cdef:
+            int i, j, w, n, cell, colour
+            uint64_t empty[BB_WORDS]
+            uint64_t word
+
+        self.size = size
+        self.n_cells = size * size
+        self.neighbor_table = neighbor_table
+        self.first = to_play
+        self.red_start = red_played
+        self.blue_start = blue_played
+        memcpy(self.red_start_bits, red_bits, sizeof(self.red_bits))
+        memcpy(self.blue_start_bits, blue_bits, sizeof(self.blue_bits))
+        memcpy(self.red_bits, red_bits, sizeof(self.red_bits))
+        memcpy(self.blue_bits, blue_bits, sizeof(self.blue_bits))
+
+        # gather the empty cells
+        cell_mask(empty, self.n_cells)
+        n = 0
+        for w in range(BB_WORDS):
+            word = empty[w] & ~(red_bits[w] | blue_bits[w])
+            while word:
+                j = __builtin_ctzll(word)
+                self.order[n] = w * 64 + j
+                n += 1
+                word &= word - 1
+        self.n_filled = n
+
+        # Fisher-Yates shuffle, then fill alternating from the player to move
+        for i in range(n - 1, 0, -1):
+            j = rng_below(&self.rng, i + 1)
+            cell = self.order[i]
+            self.order[i] = self.order[j]
+            self.order[j] = cell
+        colour = self.first
+        for i in range(n):
+            if colour == RED:
+                set_bit(self.red_bits, self.order[i])
+                colour = BLUE
+            else:
+                set_bit(self.blue_bits, self.order[i])
+                colour = RED
+
+        # a filled board has exactly one winner
+        if connects(self.red_bits, RED, self.size, self.neighbor_table, self.stack):
+            self.winner = RED
+        else:
+            self.winner = BLUE
+        return self.winner
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef int _decisive_length(self) noexcept nogil:
+        """
+        Return how many stones of the fill order were played when the winner
+        of the last playout first connected its edges.
+        """
+        cdef:
+            int i, cell, colour
+            int start = self.n_cells
+            int end = self.n_cells + 1
+            int parent[MAX_CELLS + 2]
+            uint64_t owned[BB_WORDS]
+            const uint64_t * initial
+
+        if self.winner == RED:
+            initial = self.red_start_bits
+        else:
+            initial = self.blue_start_bits
+        memcpy(owned, initial, sizeof(owned))
+        for i in range(self.n_cells + 2):
+            parent[i] = i
+
+        # join the stones the winner owned before the playout, then add the
+        # winner's stones in fill order until both edges are connected
+        for cell in range(self.n_cells):
+            if test_bit(owned, cell):
+                self._join_owned(parent, owned, cell)
+        if find(parent, start) == find(parent, end):
+            return 0
+
+        colour = self.first
+        for i in range(self.n_filled):
+            if colour == self.winner:
+                cell = self.order[i]
+                set_bit(owned, cell)
+                self._join_owned(parent, owned, cell)
+                if find(parent, start) == find(parent, end):
+                    return i + 1
+            colour = BLUE if colour == RED else RED
+        return self.n_filled
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _join_owned(self, int * parent, const uint64_t * owned, int cell) noexcept nogil:
+        """
+        Join an owned cell with its owned neighbors and with the edges of the
+        winner it touches, start being index n_cells and end n_cells + 1.
+        """
+        cdef int k, n, x, y, a, b
+        x = cell // self.size
+        y = cell % self.size
+        if (self.winner == RED and x == 0) or (self.winner == BLUE and y == 0):
+            parent[find(parent, cell)] = find(parent, self.n_cells)
+        if (self.winner == RED and x == self.size - 1) or (self.winner == BLUE and y == self.size - 1):
+            parent[find(parent, cell)] = find(parent, self.n_cells + 1)
+        for k in range(NEIGHBOR_COUNT):
+            n = self.neighbor_table[cell * NEIGHBOR_COUNT + k]
+            if n < 0:
+                break
+            if test_bit(owned, n):
+                a = find(parent, cell)
+                b = find(parent, n)
+                if a != b:
+                    parent[a] = b
+
+    cdef const uint64_t * _stones(self, int colour) noexcept nogil:
+        """
+        Return the bitboard of the passed colour on the last filled board.
+        """
+        if colour == RED:
+            return self.red_bits
+        return self.blue_bits
+
+    cpdef list points(self, int colour):
+        """
+        Return the cells owned by the passed colour on the last filled board.
+        """
+        cdef const uint64_t * bits = self._stones(colour)
+        cdef int i
+        return [(i // self.size, i % self.size) for i in range(self.n_cells) if test_bit(bits, i)]
+
+    cpdef tuple stones_played(self):
+        """
+        Return the number of red and blue stones on the board at the moment the
+        last playout was decided, as a game stopped at the first connection.
+        """
+        cdef int played = self._decisive_length()
+        cdef int first_count = (played + 1) // 2
+        cdef int second_count = played // 2
+        if self.first == RED:
+            return (self.red_start + first_count, self.blue_start + second_count)
+        return (self.red_start + second_count, self.blue_start + first_count)
@@ -0,0 +1,46 @@
+# keep this line for cython directives
+
+from gamestate cimport MAX_CELLS
+
+# phases of a simulation timed by a SearchProfile
+cdef enum:
+    PHASE_SELECT = 0
+    PHASE_EXPAND = 1
+    PHASE_ROLLOUT = 2
+    PHASE_BACKUP = 3
+    PHASE_COUNT = 4
+
+
+cdef class SearchProfile:
+    """
+    Cumulative time of each phase of the simulations of a search and the
+    distributions of their selection depth and rollout length.
+    """
+    cdef public:
+        object log
+
+    cdef:
+        double time[PHASE_COUNT]
+        double mark
+        long simulations
+        long depths[MAX_CELLS + 1]
+        long lengths[MAX_CELLS + 1]
+
+    cdef void _start(self) noexcept nogil
+    cdef void _lap(self, int phase) noexcept nogil
+    cdef void _record(self, int depth, int length) noexcept nogil
+    cpdef void merge(self, SearchProfile other)
+    cpdef void clear(self)
+    cpdef dict summary(self)
+    cpdef void report(self, dict fields)
+
+
+cdef inline int rollout_length(int before, int after, int n_cells) noexcept nogil:
+    """
+    Return the moves played by a rollout from a leaf holding before stones,
+    after being the stones on the leaf state once the rollout returned.
+    Policies that leave the state untouched fill every empty cell.
+    """
+    if after > before:
+        return after - before
+    return n_cells - before
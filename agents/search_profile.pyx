@@ -0,0 +1,152 @@
+# keep this line for cython directives
+
+import json
+from libc.string cimport memset
+
+from clock cimport monotonic
+
+
+PHASES = ("select", "expand", "rollout", "backup")
+
+
+cdef dict distribution(str name, const long * counts, long total):
+    """
+    Return the mean, the maximum and the histogram up to the maximum of the
+    passed counts indexed by value, total being the sum of the counts.
+    """
+    cdef int i, last = 0
+    cdef double weighted = 0
+    for i in range(MAX_CELLS + 1):
+        if counts[i]:
+            last = i
+            weighted += i * counts[i]
+    return {name + "_mean": weighted / total if total else 0,
+            name + "_max": last,
+            name + "s": [counts[i] for i in range(last + 1)]}
+
+
+cdef class SearchProfile:
+    """
+    Instrumentation of a search, switched on by passing a profile to an
+    engine. Each simulation is split into selection, expansion, rollout and
+    backup, the time between consecutive laps is charged to the phase just
+    finished and every simulation records the depth of its leaf and the
+    number of moves its rollout played.
+
+    Engines clear their profile when a search starts, so the numbers always
+    describe the last search, and report it once the search is over, which
+    writes one JSON line per search to the log when there is one.
+    ...
+
+    Attributes
+    ----------
+    log : file
+        text file receiving one JSON line per search, None for no log
+
+    Methods
+    -------
+    merge(other: SearchProfile):
+        Add the numbers of another profile to this one.
+    clear():
+        Forget every recorded simulation.
+    summary():
+        Dictionary of the phase times and of the depth and length
+        distributions.
+    report(fields: dict):
+        Write the summary and the passed fields as a JSON line to the log.
+    """
+
+    def __init__(self, log=None):
+        """
+        Parameters:
+                log (file): text file receiving one JSON line per search,
+                            None for no log
+        """
+        self.log = log
+        self.clear()
+
+    def __reduce__(self):
+        # sent back by the worker processes of root parallelization, the log
+        # stays with the process that opened it
+        return (SearchProfile, (), (list(self.time), self.simulations,
+                                    list(self.depths), list(self.lengths)))
+
+    def __setstate__(self, state):
+        cdef int i
+        times, self.simulations, depths, lengths = state
+        for i in range(PHASE_COUNT):
+            self.time[i] = times[i]
+        for i in range(len(depths)):
+            self.depths[i] = depths[i]
+            self.lengths[i] = lengths[i]
+
+    cdef void _start(self) noexcept nogil:
+        """
+        Start timing a simulation.
+        """
+        self.mark = monotonic()
+
+    cdef void _lap(self, int phase) noexcept nogil:
+        """
+        Charge the time since the last lap to the passed phase.
+        """
+        cdef double now = monotonic()
+        self.time[phase] += now - self.mark
+        self.mark = now
+
+    cdef void _record(self, int depth, int length) noexcept nogil:
+        """
+        Count a finished simulation whose leaf was depth moves below the root
+        and whose rollout played length moves.
+        """
+        self.simulations += 1
+        self.depths[min(max(depth, 0), MAX_CELLS)] += 1
+        self.lengths[min(max(length, 0), MAX_CELLS)] += 1
+
+    cpdef void merge(self, SearchProfile other):
+        """
+        Add the numbers of another profile to this one, used to gather the
+        profiles of several threads or processes.
+        """
+        cdef int i
+        for i in range(PHASE_COUNT):
+            self.time[i] += other.time[i]
+        self.simulations += other.simulations
+        for i in range(MAX_CELLS + 1):
+            self.depths[i] += other.depths[i]
+            self.lengths[i] += other.lengths[i]
+
+    cpdef void clear(self):
+        """
+        Forget every recorded simulation.
+        """
+        memset(self.time, 0, sizeof(self.time))
+        memset(self.depths, 0, sizeof(self.depths))
+        memset(self.lengths, 0, sizeof(self.lengths))
+        self.simulations = 0
+        self.mark = 0
+
+    cpdef dict summary(self):
+        """
+        Return the seconds spent in each phase and, for the selection depth
+        and the rollout length, the mean, the maximum and the histogram as a
+        list of counts indexed by value.
+        """
+        summary = {"simulations": self.simulations}
+        for i in range(PHASE_COUNT):
+            summary[PHASES[i]] = self.time[i]
+        summary.update(distribution("depth", self.depths, self.simulations))
+        summary.update(distribution("length", self.lengths, self.simulations))
+        return summary
+
+    cpdef void report(self, dict fields):
+        """
+        Write the passed fields followed by the summary as one JSON line to
+        the log, nothing is written without a log.
+        """
+        if self.log is None:
+            return
+        line = dict(fields)
+        line.update(self.summary())
+        self.log.write(json.dumps(line) + "\n")
+        self.log.flush()
@@ -0,0 +1,48 @@
+# -----------------------------------------------------------
+# Group 4 - Checks of the transposition table
+# -----------------------------------------------------------
+"""
+Check that searching with a transposition table keeps the visit counts of
+the tree equal to the rollouts that went through each node.
+
+Build the extensions first (python3 setup.py build_ext --inplace) and run
+from this directory:
+
+    python3 -m pytest test_transposition.py
+"""
+import pytest
+
+from gamestate import GameState
+from lgrm_mcts import LGRMCTSEngine
+from quality_rave import QRAVEEngine
+from rave_mcts import RaveMCTSEngine
+from transposition import TranspositionTable
+
+
+def overcounted(pool, root):
+    """
+    Return the nodes of the subtree of root whose children hold more visits
+    in total than the node itself.
+    """
+    nodes = []
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = list(pool.children(node).values())
+        if sum(pool.node_visits(child) for child in children) > pool.node_visits(node):
+            nodes.append(node)
+        stack.extend(children)
+    return nodes
+
+
+@pytest.mark.parametrize("engine", [RaveMCTSEngine, QRAVEEngine, LGRMCTSEngine])
+def test_visits_match_rollouts(engine):
+    table = TranspositionTable(1 << 16, seed=1)
+    agent = engine(GameState(7), seed=1, transpositions=table)
+    for ply in range(3):
+        before = agent.pool.node_visits(agent.root)
+        agent.search(iterations=5000)
+        assert agent.pool.node_visits(agent.root) - before == agent.statistics()[0]
+        assert overcounted(agent.pool, agent.root) == []
+        agent.move(agent.best_move())
+    assert table.hits > 0
@@ -0,0 +1,103 @@
+# keep this line for cython directives
+from time import monotonic
+
+from meta import GameMeta
+
+
+class TimeManager:
+    """
+    Budget the search time of each move from the clock left for the game.
+
+    The referee gives each player GameMeta.MAXIMUM_TIME seconds for the
+    whole game and the time of a move runs from the message announcing the
+    opponent's move to the reply. The remaining clock is split evenly over
+    the moves still expected, which are estimated from the empty cells, so
+    time left unused by a move, for example by a search that stopped early,
+    is spread over the following ones.
+    ...
+
+    Attributes
+    ----------
+    total : float
+        seconds available for the whole game
+    used : float
+        seconds already spent on our moves
+    reserve : float
+        seconds kept back for the protocol and the work around the search
+    fill : float
+        share of the empty cells expected to be played before a game is
+        decided
+    min_moves : int
+        fewest of our moves assumed to remain, so the last moves of a long
+        game still get time
+    min_budget : float
+        shortest search ever asked for
+    turn_start : float
+        monotonic time at which the current turn started, None between turns
+
+    Methods
+    -------
+    start_turn():
+        Start the clock of our turn.
+    end_turn():
+        Stop the clock of our turn and charge it to the game.
+    remaining():
+        Seconds left on the clock.
+    moves_left(state: GameState):
+        Estimate how many moves we still have to play.
+    budget(state: GameState):
+        Seconds to search for the next move.
+    """
+
+    def __init__(self, total=GameMeta.MAXIMUM_TIME, reserve=5, fill=0.5, min_moves=8, min_budget=0.05):
+        """
+        Parameters:
+                total (float): seconds available for the whole game
+                reserve (float): seconds kept back as a safety margin
+                fill (float): share of the empty cells expected to be played
+                min_moves (int): fewest of our moves assumed to remain
+                min_budget (float): shortest search ever asked for
+        """
+        self.total = total
+        self.used = 0
+        self.reserve = reserve
+        self.fill = fill
+        self.min_moves = min_moves
+        self.min_budget = min_budget
+        self.turn_start = None
+
+    def start_turn(self):
+        """
+        Start the clock of our turn, called when a message arrives.
+        """
+        self.turn_start = monotonic()
+
+    def end_turn(self):
+        """
+        Stop the clock of our turn and charge it to the game, called once our
+        reply is sent.
+        """
+        if self.turn_start is not None:
+            self.used += monotonic() - self.turn_start
+            self.turn_start = None
+
+    def remaining(self):
+        """
+        Return the seconds left on the clock, including the current turn.
+        """
+        elapsed = monotonic() - self.turn_start if self.turn_start is not None else 0
+        return self.total - self.used - elapsed
+
+    def moves_left(self, state):
+        """
+        Estimate how many moves we still have to play from the passed state,
+        half of the cells expected to be filled before the game is decided.
+        """
+        empty = state.size * state.size - state.red_played - state.blue_played
+        return max(self.min_moves, self.fill * empty / 2)
+
+    def budget(self, state):
+        """
+        Return the seconds to search for the next move from the passed state.
+        """
+        return max(self.min_budget, (self.remaining() - self.reserve) / self.moves_left(state))
@@ -0,0 +1,249 @@
+# -----------------------------------------------------------
+# Group 4 - Parallel tournaments for hyperparameter sweeps
+# -----------------------------------------------------------
+"""
+Sweep a hyperparameter of an engine by playing every pair of its values
+against each other, many matches at a time. src/play.py plays the same
+grid one referee game after the other; here each match is an Arena game
+inside a worker process, so matches need no port and run in parallel on
+every core.
+
+Build the extensions first (python3 setup.py build_ext --inplace) and run
+from this directory:
+
+    python3 tournament.py [engine=rave] [param=rave_const]
+                          [values=10:310:10] [explore=0.7 ...]
+                          [rounds=1] [swap=never|always|balanced]
+                          [workers=8] [size=11]
+                          [move_time=0.5 | iterations=2000] [seed=1]
+                          [out=tournament.jsonl]
+
+values is a comma separated list or a start:stop:step range and every
+other key=value argument is a fixed keyword argument of the engine. Each
+ordered pair of distinct values is played once per round, so every value
+plays both colours against every other one. swap=balanced plays each of
+those games a second time with the second player swapping the first stone.
+
+Every finished match is appended to out as one JSON line as soon as it
+ends, tagged with a digest of the settings of the sweep: the engine, the
+swept parameter, the fixed arguments, the size, the move time, the
+iterations and the seed. Running the same command again skips the matches
+of the same settings already in out, so an interrupted sweep resumes where
+it stopped, and the final table only counts those matches.
+"""
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import cpu_count
+from os.path import exists
+from random import Random
+from sys import argv, stderr
+
+from arena import Arena
+from gamestate import GameState
+from lgrm_mcts import LGRMCTSEngine
+from naive_mcts import NaiveMCTSEngine
+from quality_rave import QRAVEEngine
+from rave_mcts import RaveMCTSEngine
+from tree_parallel import TreeParallelEngine
+
+# engines built with keyword hyperparameters, root parallelization is left
+# out since it already needs a core per worker
+ENGINES = {
+    "naive": NaiveMCTSEngine,
+    "rave": RaveMCTSEngine,
+    "qrave": QRAVEEngine,
+    "lgrm": LGRMCTSEngine,
+    "tree": TreeParallelEngine,
+}
+
+# options of the tournament itself, every other option goes to the engine
+OPTIONS = ("engine", "param", "values", "rounds", "swap", "workers", "size",
+           "move_time", "iterations", "seed", "out")
+
+
+def parse_value(text):
+    """
+    Return the number written in text, an int when it has no fraction.
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def parse_values(text):
+    """
+    Return the values of a comma separated list or of a start:stop:step
+    range, the stop being excluded like in range().
+    """
+    if ":" in text:
+        start, stop, step = (parse_value(part) for part in text.split(":"))
+        values = []
+        while (step > 0 and start < stop) or (step < 0 and start > stop):
+            values.append(start)
+            start += step
+        return values
+    return [parse_value(value) for value in text.split(",")]
+
+
+def schedule(values, rounds, swap):
+    """
+    Return the matches of a tournament as dictionaries with the index of
+    the value of each player, the round and whether the second player
+    swaps. Every ordered pair of distinct values is played once per round,
+    a value never plays itself.
+    """
+    swaps = {"never": [False], "always": [True], "balanced": [False, True]}[swap]
+    matches = []
+    for round in range(rounds):
+        for first in range(len(values)):
+            for second in range(len(values)):
+                if values[first] == values[second]:
+                    continue
+                for swapped in swaps:
+                    matches.append({"first": first, "second": second, "round": round, "swap": swapped})
+    return matches
+
+
+def settings_digest(settings):
+    """
+    Return a short digest of the settings of a sweep, the same for the same
+    settings whatever the order of the fixed arguments.
+    """
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def match_key(match, values, digest):
+    """
+    Return the key identifying a match in the results file, built from the
+    values themselves so results stay valid when the value list changes,
+    and from the digest of the settings so a sweep with other settings
+    never takes them for its own.
+    """
+    return f"{digest}|{values[match['first']]}|{values[match['second']]}|{match['round']}|{int(match['swap'])}"
+
+
+def stored(path, digest):
+    """
+    Return the lines of the results file played with the settings of
+    digest, a last line cut short by an interruption is ignored.
+    """
+    lines = []
+    if not exists(path):
+        return lines
+    with open(path) as f:
+        for text in f:
+            try:
+                line = json.loads(text)
+            except ValueError:
+                continue
+            if line.get("settings") == digest:
+                lines.append(line)
+    return lines
+
+
+def play_match(engine, param, fixed, first_value, second_value, swap, seed, size, move_time, iterations):
+    """
+    Build both engines with their value of the swept parameter and play
+    one Arena game between them, run inside a worker process.
+    """
+    random = Random(seed)
+    players = []
+    for value in (first_value, second_value):
+        params = dict(fixed)
+        params[param] = value
+        players.append(ENGINES[engine](GameState(size), seed=random.getrandbits(64), **params))
+    arena = Arena(size, move_time=move_time, iterations=iterations)
+    return arena.play(players[0], players[1], swap=(lambda state: True) if swap else None)
+
+
+def main():
+    options = dict(argument.split("=", 1) for argument in argv[1:] if "=" in argument)
+    engine = options.get("engine", "rave")
+    if engine not in ENGINES:
+        print(f"ERROR: Unknown engine {engine}, expected one of {', '.join(ENGINES)}.", file=stderr)
+        return
+    swap = options.get("swap", "never")
+    if swap not in ("never", "always", "balanced"):
+        print(f"ERROR: Unknown swap {swap}, expected never, always or balanced.", file=stderr)
+        return
+    param = options.get("param", "rave_const")
+    # a repeated value would play the same matches under the same keys twice
+    values = list(dict.fromkeys(parse_values(options.get("values", "10:310:10"))))
+    fixed = {key: parse_value(value) for key, value in options.items() if key not in OPTIONS}
+    rounds = int(options.get("rounds", 1))
+    workers = int(options.get("workers", cpu_count()))
+    size = int(options.get("size", 11))
+    move_time = float(options["move_time"]) if "move_time" in options else None
+    iterations = int(options.get("iterations", 0))
+    seed = int(options.get("seed", 1))
+    path = options.get("out", "tournament.jsonl")
+
+    # build one engine here, a bad argument then fails once instead of in
+    # every match
+    try:
+        params = dict(fixed)
+        params[param] = values[0]
+        player = ENGINES[engine](GameState(size), seed=seed, **params)
+    except Exception as e:
+        print(f"ERROR: Can not build {engine} with {param}={values[0]} and {fixed}: {e!r}", file=stderr)
+        return
+    if hasattr(player, "close"):
+        player.close()
+
+    settings = {"engine": engine, "param": param, "fixed": fixed, "size": size,
+                "move_time": move_time, "iterations": iterations, "seed": seed}
+    digest = settings_digest(settings)
+    done = {line["key"] for line in stored(path, digest)}
+    matches = [match for match in schedule(values, rounds, swap)
+               if match_key(match, values, digest) not in done]
+    print(f"{len(done)} matches of these settings already in {path}, {len(matches)} to play "
+          f"on {workers} workers", file=stderr)
+
+    with open(path, "a") as out, ProcessPoolExecutor(workers) as pool:
+        futures = {}
+        for match in matches:
+            key = match_key(match, values, digest)
+            # the seed of a match only depends on its key, so a resumed
+            # sweep plays the same games
+            match_seed = Random(f"{seed}|{key}").getrandbits(64)
+            future = pool.submit(play_match, engine, param, fixed, values[match["first"]],
+                                 values[match["second"]], match["swap"], match_seed, size, move_time,
+                                 iterations)
+            futures[future] = (key, match, match_seed)
+
+        for count, future in enumerate(as_completed(futures), 1):
+            key, match, match_seed = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                # the match is left out of the file and played on resume
+                print(f"{count}/{len(matches)} {key} failed: {e!r}", file=stderr)
+                continue
+            line = {"key": key, "settings": digest, "engine": engine, "param": param, "fixed": fixed,
+                    "size": size, "move_time": move_time, "iterations": iterations,
+                    "first": values[match["first"]], "second": values[match["second"]],
+                    "round": match["round"], "swap": match["swap"], "seed": match_seed}
+            line.update(result)
+            line["winner_value"] = line["first"] if result["winner"] == 1 else line["second"]
+            out.write(json.dumps(line) + "\n")
+            out.flush()
+            print(f"{count}/{len(matches)} {param}={line['first']} vs {param}={line['second']}: "
+                  f"{param}={line['winner_value']} won by {result['end']} in {result['turns']} turns",
+                  file=stderr)
+
+    # wins of every value over the matches of these settings
+    wins = {value: [0, 0] for value in values}
+    for line in stored(path, digest):
+        for value in (line["first"], line["second"]):
+            if value in wins:
+                wins[value][1] += 1
+        if line["winner_value"] in wins:
+            wins[line["winner_value"]][0] += 1
+    for value, (won, played) in sorted(wins.items(), key=lambda item: -item[1][0] / max(item[1][1], 1)):
+        print(f"{param}={value}: won {won} of {played}", file=stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# keep this line for cython directives
+
+from libc.stdint cimport uint64_t
+from gamestate cimport GameState, MAX_CELLS
+from nodepool cimport NodePool
+
+# entries sharing one hash bucket, a new position replaces the least
+# valuable of them
+cdef enum:
+    BUCKET_SIZE = 4
+
+# most virtual visits a node is started from, so what other move orders
+# learnt guides the first selections of a node and then fades out
+cdef enum:
+    PRIOR_VISITS = 8
+
+ctypedef struct Entry:
+    uint64_t key        # Zobrist hash of the position, 0 for an empty slot
+    int visits          # visits of the best sampled node of the position
+    int generation      # search in which the entry was last touched
+    double reward       # reward of that node, for the player who just moved
+
+
+cdef class TranspositionTable:
+    """
+    Bounded hash table of node statistics keyed by the Zobrist hash of a
+    position, shared by the nodes that reach the same stones through
+    different move orders.
+    """
+    cdef readonly:
+        int capacity
+        int generation
+        long probes
+        long hits
+
+    cdef:
+        Entry * entries
+        int n_buckets
+        uint64_t stone_keys[2][MAX_CELLS]
+        uint64_t turn_key
+
+    cdef uint64_t _hash(self, GameState state) noexcept
+    cdef uint64_t _move_key(self, int colour, int cell) noexcept nogil
+    cdef int _extend(self, uint64_t * keys, int length, int colour, int cell) noexcept nogil
+    cdef bint _probe(self, uint64_t key, int * visits, double * reward) noexcept nogil
+    cdef void _store(self, uint64_t key, int visits, double reward) noexcept nogil
+    cdef void _seed(self, NodePool pool, int node, uint64_t key) noexcept nogil
+    cdef void _share(self, NodePool pool, int node, const uint64_t * keys, int length) noexcept nogil
+    cpdef void new_generation(self)
+    cpdef void clear(self)
+    cpdef int used(self)
@@ -0,0 +1,225 @@
+# keep this line for cython directives
+
+from os import urandom
+cimport cython
+from libc.stdlib cimport calloc, free
+from libc.string cimport memset
+
+from fastrand cimport Rng, rng_seed, rng_next
+from gamestate cimport BB_WORDS
+from nodepool cimport NO_NODE
+from meta import GameMeta
+
+cdef extern from *:
+    int __builtin_ctzll(unsigned long long) nogil
+
+cdef int RED = GameMeta.PLAYERS['red']
+cdef int BLUE = GameMeta.PLAYERS['blue']
+
+
+cdef class TranspositionTable:
+    """
+    Transposition table shared by the nodes of a search tree. In Hex the
+    same stones are reached through many move orders and the tree holds one
+    node per order, so a position sampled below one node is learnt again
+    from scratch below every other one.
+
+    Positions are keyed by a Zobrist hash, the xor of a random key per stone
+    and of a key for blue to move, which the engines update with one xor per
+    move while they descend. After every backup an engine stores the
+    statistics of each node of the path, and an entry keeps those of the
+    most visited node of its position. A node visited for the first time
+    gets the mean reward of the entry of its position as a prior worth at
+    most PRIOR_VISITS visits. The prior only steers the selection and is
+    kept apart from the visits of the node, so the counts of the tree still
+    match the rollouts that went through each node and an entry only ever
+    holds visits a node made itself.
+
+    The table has a fixed number of entries grouped in buckets of
+    BUCKET_SIZE. A new position replaces the entry of its bucket that was
+    not touched for the most searches, the least visited one among equals.
+    ...
+
+    Attributes
+    ----------
+    capacity : int
+        number of entries, a power of two
+    generation : int
+        number of the current search, used to age entries
+    probes : int
+        lookups made by the engines
+    hits : int
+        lookups that found their position
+
+    Methods
+    -------
+    new_generation():
+        Start a new search, entries not touched since age.
+    clear():
+        Forget every position.
+    used():
+        Number of entries holding a position.
+    """
+
+    def __cinit__(self, int capacity=1 << 20, seed=None):
+        """
+        Parameters:
+                capacity (int): number of entries, rounded up to a power of
+                                two of at least BUCKET_SIZE
+                seed (int): seed of the Zobrist keys, drawn from the
+                            operating system if omitted
+        """
+        cdef Rng rng
+        cdef int colour, cell
+
+        self.capacity = BUCKET_SIZE
+        while self.capacity < capacity:
+            self.capacity *= 2
+        self.n_buckets = self.capacity // BUCKET_SIZE
+        self.entries = <Entry *> calloc(self.capacity, sizeof(Entry))
+        if self.entries == NULL:
+            raise MemoryError()
+
+        if seed is None:
+            seed = int.from_bytes(urandom(8), "little")
+        rng_seed(&rng, seed)
+        for colour in range(2):
+            for cell in range(MAX_CELLS):
+                self.stone_keys[colour][cell] = rng_next(&rng)
+        self.turn_key = rng_next(&rng)
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    def __dealloc__(self):
+        free(self.entries)
+
+    cdef uint64_t _hash(self, GameState state) noexcept:
+        """
+        Return the key of a position computed from its stones, used once per
+        search for the root.
+        """
+        cdef int w
+        cdef uint64_t key = 0, word
+        for w in range(BB_WORDS):
+            word = state.red_bits[w]
+            while word:
+                key ^= self.stone_keys[0][w * 64 + __builtin_ctzll(word)]
+                word &= word - 1
+            word = state.blue_bits[w]
+            while word:
+                key ^= self.stone_keys[1][w * 64 + __builtin_ctzll(word)]
+                word &= word - 1
+        if state.to_play == BLUE:
+            key ^= self.turn_key
+        return key
+
+    cdef uint64_t _move_key(self, int colour, int cell) noexcept nogil:
+        """
+        Return the key to xor into the key of a position when colour plays
+        cell, which also passes the turn.
+        """
+        return self.stone_keys[0 if colour == RED else 1][cell] ^ self.turn_key
+
+    cdef int _extend(self, uint64_t * keys, int length, int colour, int cell) noexcept nogil:
+        """
+        Append to the keys of a path the key of the position reached when
+        colour plays cell from its last position, return the new length.
+        """
+        keys[length] = keys[length - 1] ^ self._move_key(colour, cell)
+        return length + 1
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef bint _probe(self, uint64_t key, int * visits, double * reward) noexcept nogil:
+        """
+        Look a position up, on a hit write its statistics to visits and
+        reward and return True.
+        """
+        cdef Entry * bucket = self.entries + (key & (self.n_buckets - 1)) * BUCKET_SIZE
+        cdef int i
+        self.probes += 1
+        for i in range(BUCKET_SIZE):
+            if bucket[i].key == key and bucket[i].visits > 0:
+                bucket[i].generation = self.generation
+                visits[0] = bucket[i].visits
+                reward[0] = bucket[i].reward
+                self.hits += 1
+                return True
+        return False
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef void _store(self, uint64_t key, int visits, double reward) noexcept nogil:
+        """
+        Record the statistics of a node of the passed position, they replace
+        those of the entry only if the node has more visits.
+        """
+        cdef Entry * bucket = self.entries + (key & (self.n_buckets - 1)) * BUCKET_SIZE
+        cdef int i, victim = 0
+        for i in range(BUCKET_SIZE):
+            if bucket[i].key == key:
+                if visits > bucket[i].visits:
+                    bucket[i].visits = visits
+                    bucket[i].reward = reward
+                bucket[i].generation = self.generation
+                return
+            if (bucket[i].generation < bucket[victim].generation
+                    or (bucket[i].generation == bucket[victim].generation
+                        and bucket[i].visits < bucket[victim].visits)):
+                victim = i
+        bucket[victim].key = key
+        bucket[victim].visits = visits
+        bucket[victim].reward = reward
+        bucket[victim].generation = self.generation
+
+    cdef void _seed(self, NodePool pool, int node, uint64_t key) noexcept nogil:
+        """
+        Give an unvisited node of the pool the mean reward of the entry of
+        its position as a prior of at most PRIOR_VISITS visits, the node is
+        left untouched if the position is not in the table.
+        """
+        cdef int visits
+        cdef double reward
+        if self._probe(key, &visits, &reward):
+            pool.prior_visits[node] = visits if visits < PRIOR_VISITS else PRIOR_VISITS
+            pool.prior_reward[node] = reward / visits * pool.prior_visits[node]
+
+    cdef void _share(self, NodePool pool, int node, const uint64_t * keys, int length) noexcept nogil:
+        """
+        Store the statistics of every node on the path from the passed node
+        up to the root, keys[i] being the key of the node at depth i and
+        length the depth of the passed node plus one. The root is skipped,
+        it is never selected among siblings.
+        """
+        cdef int depth = length - 1
+        while node != NO_NODE and depth > 0:
+            self._store(keys[depth], pool.visits[node], pool.reward[node])
+            node = pool.parent[node]
+            depth -= 1
+
+    cpdef void new_generation(self):
+        """
+        Start a new search, the entries not touched since become the first
+        to be replaced.
+        """
+        self.generation += 1
+
+    cpdef void clear(self):
+        """
+        Forget every position.
+        """
+        memset(self.entries, 0, self.capacity * sizeof(Entry))
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+
+    cpdef int used(self):
+        """
+        Return the number of entries holding a position.
+        """
+        cdef int i, count = 0
+        for i in range(self.capacity):
+            if self.entries[i].visits > 0:
+                count += 1
+        return count
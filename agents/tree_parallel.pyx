@@ -0,0 +1,417 @@
+# keep this line for cython directives
+
+from copy import deepcopy
+from os import cpu_count, urandom
+from threading import Thread
+cimport cython
+from libc.math cimport INFINITY
+from libc.stdint cimport uint64_t
+from libc.string cimport memcpy
+
+from clock cimport monotonic, CLOCK_CHECK
+from fastrand cimport Rng, rng_seed, rng_below, derive_seed
+from atomic cimport atomic_load_int, atomic_store_int, atomic_add_int, atomic_add_double, atomic_cas_int
+from gamestate cimport GameState, MAX_CELLS, BB_WORDS
+from nodepool cimport NodePool, LEAF, EXPANDED, TERMINAL, NO_NODE, RAVE_MSE
+from rollout cimport RandomFillRollout, cell_mask, connects
+from search_profile cimport SearchProfile, PHASE_SELECT, PHASE_EXPAND, PHASE_ROLLOUT, PHASE_BACKUP
+from meta import GameMeta, MCTSMeta
+
+
+cdef int RED = GameMeta.PLAYERS['red']
+cdef int BLUE = GameMeta.PLAYERS['blue']
+
+
+cdef inline bint test_bit(const uint64_t * bits, int index) noexcept nogil:
+    return (bits[index >> 6] >> (index & 63)) & 1
+
+
+cdef inline void set_bit(uint64_t * bits, int index) noexcept nogil:
+    bits[index >> 6] |= (<uint64_t> 1) << (index & 63)
+
+
+cdef class TreeParallelEngine:
+    """
+    Implementation of tree parallelization in MCTS with RAVE. Several threads
+    descend one shared tree without the gil, so no tree has to be copied or
+    merged between moves.
+
+    The tree lives in a NodePool. Statistics are updated with atomic adds and
+    a node is expanded by the single thread that wins a compare and swap on
+    its status. While a thread is below a node the node carries a virtual
+    loss, it looks visited and lost, which steers the other threads towards
+    different branches.
+    ...
+
+    Attributes
+    ----------
+    root_state : GameState
+        object to store the current game situation
+    root : int
+        handle of the root of the tree search in the pool
+    threads : int
+        number of worker threads used by each search
+    virtual_loss : int
+        visits counted as losses on every node of a path being simulated
+    explore : float
+        specifies how much the value should favor nodes
+        that have yet to be thoroughly explored versus nodes
+        that seem to have a high win rate
+    rave_const : float
+        constant to quantify how to balance between UCT and AMAF
+    node_count : int
+        the number of nodes in the pool
+    run_time: float
+        time taken for each run
+    num_rollouts: int
+        the number of rollouts for each search
+    carried_visits: int
+        visits of the subtree kept by the last move, 0 when the tree
+        was thrown away
+    interrupted: bool
+        set from another thread to end the running search early
+    seed: int
+        base seed of every random stream of the engine, with one thread the
+        same seed and iteration budget always grow the same tree
+    profile: SearchProfile
+        phase times and depth and length distributions of the last search,
+        None when profiling is off. Each thread fills a profile of its own
+        and they are merged once the search is over, so phase times are
+        summed over the threads
+
+    Methods
+    -------
+    search(time_budget: float, stop_early: bool, iterations: int, node_limit: int):
+        Search and update the search tree for a
+        specified amount of time in seconds.
+    best_move():
+        Return the best move according to the current tree.
+    move(move: tuple):
+        Make the passed move and update the tree appropriately.
+    set_gamestate(state: GameState):
+        Set the root_state of the tree to the passed gamestate, this clears all
+        the information stored in the tree since none of it applies to the new
+        state.
+    statistics():
+        Getter for performance metrics
+    tree_size():
+        Count nodes reachable from the root with a full walk, a diagnostic
+        never run by search.
+    """
+
+    cdef public:
+        GameState root_state
+        int root
+        int threads
+        int virtual_loss
+        double explore
+        double rave_const
+        int node_count
+        double run_time
+        int num_rollouts
+        int carried_visits
+        bint interrupted
+        object seed
+        SearchProfile profile
+
+    cdef:
+        NodePool pool
+        list policies
+        list profiles
+        list counts
+        int decided
+        int started
+        int iterations
+        int node_limit
+        Rng rng
+
+    def __init__(self, state: GameState = GameState(11), *, threads=None, virtual_loss=1,
+                 explore=MCTSMeta.EXPLORATION, rave_const=0.00000016, max_nodes=1 << 21, seed=None,
+                 profile=None):
+        """
+        Parameters:
+                state (GameState): state to search from
+                threads (int): worker threads, one per core if omitted
+                virtual_loss (int): losses added to a node while a thread is
+                                    simulating below it
+                explore (float): exploration constant of UCT
+                rave_const (float): constant balancing UCT and AMAF
+                max_nodes (int): capacity of the node pool
+                seed (int): base seed of every random stream of the engine,
+                            drawn from the operating system if omitted
+                profile (SearchProfile): profile filled by every search,
+                            None for no profiling
+        """
+        self.root_state = deepcopy(state)
+        self.threads = threads if threads is not None else (cpu_count() or 1)
+        self.virtual_loss = virtual_loss
+        self.explore = explore
+        self.rave_const = rave_const
+        self.pool = NodePool(max_nodes)
+        self.root = self.pool.new_root()
+        self.seed = seed if seed is not None else int.from_bytes(urandom(8), "little")
+        rng_seed(&self.rng, derive_seed(self.seed, 0))
+        self.policies = [RandomFillRollout(derive_seed(self.seed, 1 + i)) for i in range(self.threads)]
+        self.counts = [0] * self.threads
+        self.profile = profile
+        self.profiles = [SearchProfile() if profile is not None else None for _ in range(self.threads)]
+        self.node_count = 0
+        self.run_time = 0
+        self.num_rollouts = 0
+        self.carried_visits = 0
+        self.interrupted = False
+
+    cpdef void set_gamestate(self, object state):
+        """
+        Set the root_state of the tree to the passed gamestate, this clears all
+        the information stored in the tree since none of it applies to the new
+        state.
+        """
+        self.root_state = deepcopy(state)
+        self.pool.clear()
+        self.root = self.pool.new_root()
+        self.carried_visits = 0
+
+    cpdef void move(self, tuple move):
+        """
+        Make the passed move and update the tree appropriately. It is
+        designed to let the player choose an action manually (which might
+        not be the best action).
+        """
+        cdef int child = self.pool._child(self.root, move[0] * self.root_state.size + move[1])
+        self.root_state.play(move)
+        if child != NO_NODE:
+            # keep the subtree of the move and free the rest of the pool at once
+            self.root = self.pool.compact(child)
+            self.carried_visits = self.pool.visits[self.root]
+            return
+
+        # the move was never expanded so the tree holds nothing about it
+        self.pool.clear()
+        self.root = self.pool.new_root()
+        self.carried_visits = 0
+
+    cpdef best_move(self):
+        """
+        Return the best move according to the current tree.
+        Returns:
+            best move in terms of the most simulations number unless the game is over
+        """
+        cdef int bestchild
+
+        if self.root_state.winner() != GameMeta.PLAYERS['none']:
+            return GameMeta.GAME_OVER
+
+        # choose the move of the most simulated node breaking ties randomly
+        bestchild = self.pool._most_visited(self.root, &self.rng)
+        if bestchild == NO_NODE:
+            raise IndexError("No move has been searched from the root")
+        return (self.pool.move[bestchild] // self.root_state.size,
+                self.pool.move[bestchild] % self.root_state.size)
+
+    def search(self, double time_budget=INFINITY, bint stop_early=False,
+               int iterations=0, int node_limit=0):
+        """
+        Search and update the search tree until the first limit is reached:
+        time_budget seconds, iterations simulations or node_limit nodes in the
+        tree, where a zero count is no limit, using one thread per worker.
+        Each worker only reads the clock every CLOCK_CHECK simulations. With
+        stop_early the search also ends once the rest of the time budget can
+        not change the most visited move.
+        """
+        start_time = monotonic()
+        # the pool can not be compacted while workers hold handles, so make
+        # room before they start
+        if self.pool.n_nodes > self.pool.capacity // 2:
+            self.root = self.pool.prune(self.root)
+        deadline = start_time + time_budget
+        self.decided = False
+        self.started = 0
+        self.iterations = iterations
+        self.node_limit = node_limit
+        check = MCTSMeta.DECIDED_CHECK if stop_early else 0
+        for profile in self.profiles:
+            if profile is not None:
+                profile.clear()
+        workers = [Thread(target=self._worker, args=(i, deadline, check)) for i in range(self.threads)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+
+        self.run_time = monotonic() - start_time
+        self.node_count = self.pool.n_nodes
+        self.num_rollouts = sum(self.counts)
+        if self.profile is not None:
+            self.profile.clear()
+            for profile in self.profiles:
+                self.profile.merge(profile)
+            self.profile.report({"engine": type(self).__name__,
+                                 "ply": self.root_state.red_played + self.root_state.blue_played,
+                                 "rollouts": self.num_rollouts, "nodes": self.node_count,
+                                 "seconds": self.run_time})
+
+    def _worker(self, int index, double deadline, int check):
+        cdef RandomFillRollout policy = self.policies[index]
+        cdef SearchProfile profile = self.profiles[index]
+        cdef int count
+        with nogil:
+            count = self._work(policy, profile, deadline, check)
+        self.counts[index] = count
+
+    cdef int _work(self, RandomFillRollout policy, SearchProfile profile, double deadline,
+                   int check) noexcept nogil:
+        """
+        Run simulations from the root until the first limit of the search is
+        reached and return how many were run. Every check simulations, if
+        check is not zero, the thread also stops every worker once the
+        simulations left at the current rate can not change the most visited
+        move.
+        """
+        cdef:
+            int count = 0
+            int path[MAX_CELLS + 1]
+            uint64_t red[BB_WORDS]
+            uint64_t blue[BB_WORDS]
+            double start = monotonic(), now
+            int base = atomic_load_int(&self.pool.visits[self.root])
+
+        while not atomic_load_int(<int *> &self.interrupted) and not atomic_load_int(&self.decided):
+            if count % CLOCK_CHECK == 0 and monotonic() >= deadline:
+                break
+            if self.iterations and atomic_add_int(&self.started, 1) >= self.iterations:
+                break
+            if self.node_limit and atomic_load_int(&self.pool.n_nodes) >= self.node_limit:
+                break
+            if not self._simulate(policy, profile, path, red, blue):
+                break
+            count += 1
+            if check and count % check == 0:
+                now = monotonic()
+                if now > start and self.pool._decided(
+                        self.root, (atomic_load_int(&self.pool.visits[self.root]) - base)
+                        / (now - start) * (deadline - now)):
+                    atomic_store_int(&self.decided, True)
+        return count
+
+    @cython.boundscheck(False)
+    @cython.wraparound(False)
+    cdef bint _simulate(self, RandomFillRollout policy, SearchProfile profile, int * path,
+                        uint64_t * red, uint64_t * blue) noexcept nogil:
+        """
+        Descend from the root with virtual loss, expand the leaf, roll out
+        and back the result up the path. Return False if the root is terminal.
+        The phases are timed in profile unless it is None.
+        """
+        cdef:
+            int node = self.root, child, depth = 0, status
+            int size = self.root_state.size
+            const int * neighbor_table = self.root_state.neighbor_table
+            int to_play = self.root_state.to_play
+            int red_played = self.root_state.red_played
+            int blue_played = self.root_state.blue_played
+            int vl = self.virtual_loss
+            int outcome, turn, c, first
+            double reward
+            uint64_t empty[BB_WORDS]
+            const uint64_t * owned
+
+        if profile is not None:
+            profile._start()
+        memcpy(red, self.root_state.red_bits, BB_WORDS * sizeof(uint64_t))
+        memcpy(blue, self.root_state.blue_bits, BB_WORDS * sizeof(uint64_t))
+        path[depth] = node
+        depth += 1
+        atomic_add_int(&self.pool.visits[node], vl)
+        atomic_add_double(&self.pool.reward[node], -vl)
+
+        while True:
+            status = atomic_load_int(&self.pool.status[node])
+            if status == LEAF:
+                if profile is not None:
+                    profile._lap(PHASE_SELECT)
+                # only the player who just moved can have won
+                if to_play == RED and connects(blue, BLUE, size, neighbor_table, policy.stack):
+                    atomic_cas_int(&self.pool.status[node], LEAF, TERMINAL)
+                    break
+                if to_play == BLUE and connects(red, RED, size, neighbor_table, policy.stack):
+                    atomic_cas_int(&self.pool.status[node], LEAF, TERMINAL)
+                    break
+                cell_mask(empty, size * size)
+                for c in range(BB_WORDS):
+                    empty[c] &= ~(red[c] | blue[c])
+                if not self.pool._expand(node, empty):
+                    break
+                child = self.pool.first_child[node] + <int> rng_below(&policy.rng, self.pool.n_children[node])
+                if profile is not None:
+                    profile._lap(PHASE_EXPAND)
+            elif status == EXPANDED:
+                child = self.pool._select(node, self.explore, self.rave_const, RAVE_MSE, &policy.rng)
+            else:
+                break
+
+            # play the move of the child and mark it as being simulated
+            if to_play == RED:
+                set_bit(red, self.pool.move[child])
+                red_played += 1
+                to_play = BLUE
+            else:
+                set_bit(blue, self.pool.move[child])
+                blue_played += 1
+                to_play = RED
+            path[depth] = child
+            depth += 1
+            node = child
+            atomic_add_double(&self.pool.reward[node], -vl)
+            # stop at a position nobody visited before
+            if atomic_add_int(&self.pool.visits[node], vl) == 0 or status == LEAF:
+                break
+
+        if depth == 1 and atomic_load_int(&self.pool.status[node]) == TERMINAL:
+            atomic_add_int(&self.pool.visits[node], -vl)
+            atomic_add_double(&self.pool.reward[node], vl)
+            return False
+
+        if profile is not None:
+            profile._lap(PHASE_SELECT)
+        outcome = policy._run_bits(size, neighbor_table, red, blue,
+                                   to_play, red_played, blue_played)
+        if profile is not None:
+            profile._lap(PHASE_ROLLOUT)
+            profile._record(depth - 1, policy.n_filled)
+
+        # note that reward is calculated for player who just played
+        # at the node and not the next player to play
+        turn = to_play
+        while depth > 0:
+            depth -= 1
+            node = path[depth]
+            reward = -1 if outcome == turn else 1
+            atomic_add_int(&self.pool.visits[node], 1 - vl)
+            atomic_add_double(&self.pool.reward[node], reward + vl)
+
+            if atomic_load_int(&self.pool.status[node]) == EXPANDED:
+                if turn == RED:
+                    owned = policy.red_bits
+                else:
+                    owned = policy.blue_bits
+                first = self.pool.first_child[node]
+                for c in range(first, first + self.pool.n_children[node]):
+                    if test_bit(owned, self.pool.move[c]):
+                        atomic_add_int(&self.pool.rave_visits[c], 1)
+                        atomic_add_double(&self.pool.rave_reward[c], -reward)
+            turn = RED if turn == BLUE else BLUE
+        if profile is not None:
+            profile._lap(PHASE_BACKUP)
+        return True
+
+    cpdef tuple statistics(self):
+        return self.num_rollouts, self.node_count, self.run_time
+
+    cpdef int tree_size(self):
+        """
+        Count the nodes reachable from the root with a sweep of the whole
+        pool. Searches take node_count from the size of the pool in constant
+        time, this walk only checks it and must not run during a search.
+        """
+        return self.pool._mark(self.root, 0)
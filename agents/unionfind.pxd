@@ -1,26 +1,52 @@
 # keep this line for cython directives
 
+# virtual nodes of the board edges, stored right after the cells
+cdef enum:
+    EDGE_TOP = 0
+    EDGE_BOTTOM = 1
+    EDGE_LEFT = 2
+    EDGE_RIGHT = 3
+    EDGE_COUNT = 4
+
 
 cdef class UnionFind:
     """
     Notes:
         unionfind data structure specialized for finding hex connections.
         Implementation inspired by UAlberta CMPUT 275 2015 class notes.
+        Union by rank is used without path compression so every join can be
+        rolled back through the history log.
+        Points are the cells of a size x size board addressed by the index
+        row * size + column, followed by one virtual node per board edge.
     Attributes:
-        parent (dict): Each group parent
-        rank (dict): Each group rank
-        groups (dict): Stores the groups and chain of cells
-        ignored (list): The neighborhood of board edges has to be ignored
+        parent (int *): Each group parent
+        rank (int *): Each group rank
+        history (int *): Roots that were attached by each successful join
+        bumped (char *): Whether the matching join increased a rank
     """
     cdef:
+        cdef int size
+        cdef int n_cells
         cdef int n_points
         cdef int * parent
         cdef int * rank
+        cdef int * history
+        cdef char * bumped
+        cdef int n_history
         cdef int _n_sets
         cdef ign1
         cdef ign2
 
-    cdef int _find(self, int i)
+    cdef int _find(self, int i) noexcept nogil
+    cdef bint _join(self, int i, int j) noexcept nogil
+    cdef bint _connected(self, int i, int j) noexcept nogil
+    cdef int _mark(self) noexcept nogil
+    cdef void _rollback(self, int mark) noexcept nogil
+    cdef int edge(self, int side) noexcept nogil
+    cdef (int, int) itot(self, int i)
+    cdef int ttoi(self, (int, int) t) except -1
     cpdef bint join(self, tuple x, tuple y)
     cpdef bint connected(self, tuple x, tuple y)
-    cdef UnionFind _copy(self)
\ No newline at end of file
+    cdef UnionFind _copy(self)
+    cdef void _copy_from(self, UnionFind other) noexcept nogil
+
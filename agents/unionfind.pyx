@@ -5,108 +5,149 @@
 from copy import deepcopy 
 
 cimport cython
-from libc.stdlib cimport malloc, free
-
-
-cdef (int, int) itot(int i):
-    '''
-    Converts an integer to a tuple
-
-        Parameters:
-                i (int): Integer to be converted
-
-        Returns:
-                (tuple): Tuple with the integer
-    '''
-    return (int(i // 13), i % 13)
-
-cdef int ttoi((int, int) t):
-    '''
-    Converts a tuple to an integer
-
-        Parameters:
-                t (tuple): Tuple to be converted
-
-        Returns:
-                (int): Integer with the tuple
-    '''
-    return t[0] * 13 + t[1]
-
+from libc.stdlib cimport malloc, calloc, free
+from libc.string cimport memcpy
 
 
 cdef class UnionFind:
-    def __cinit__(self, n_points=169, init = True):
-        self.n_points = n_points
-        self.parent = <int *> malloc(n_points * sizeof(int))
-        self.rank = <int *> malloc(n_points * sizeof(int))
-        
+    def __cinit__(self, int size=11, init = True):
+        self.size = size
+        self.n_cells = size * size
+        # every cell of the board followed by the four virtual edges
+        self.n_points = self.n_cells + EDGE_COUNT
+        self.parent = <int *> malloc(self.n_points * sizeof(int))
+        self.rank = <int *> calloc(self.n_points, sizeof(int))
+        self.history = <int *> malloc(self.n_points * sizeof(int))
+        self.bumped = <char *> malloc(self.n_points * sizeof(char))
+        self.n_history = 0
+
         cdef int i
         if init:
-            for i in range(n_points):
+            for i in range(self.n_points):
                 self.parent[i] = i
 
     def __dealloc__(self):
         free(self.parent)
         free(self.rank)
+        free(self.history)
+        free(self.bumped)
 
     @cython.wraparound(False)
     @cython.boundscheck(False)
     cdef UnionFind _copy(self):
         cdef UnionFind copy
-        copy = UnionFind(self.n_points, False)
-
-        cdef int i
-        for i in range(self.n_points):
-            copy.parent[i] = self.parent[i]
-            copy.rank[i] = self.rank[i]
+        copy = UnionFind(self.size, False)
+        copy._copy_from(self)
         return copy
+
+    cdef void _copy_from(self, UnionFind other) noexcept nogil:
+        """
+        Overwrite this structure with the contents of another one of the same
+        board size without allocating.
+        """
+        memcpy(self.parent, other.parent, other.n_points * sizeof(int))
+        memcpy(self.rank, other.rank, other.n_points * sizeof(int))
+        memcpy(self.history, other.history, other.n_history * sizeof(int))
+        memcpy(self.bumped, other.bumped, other.n_history * sizeof(char))
+        self.n_history = other.n_history
     
     def __deepcopy__(self, memo):
         return self._copy()
 
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    cdef int _find(self, int i):
-        if self.parent[i] == i:
-            return i
-        else:
-            self.parent[i] = self._find(self.parent[i])
-            return self.parent[i]
+    cdef int _find(self, int i) noexcept nogil:
+        # no path compression, otherwise joins could not be rolled back
+        while self.parent[i] != i:
+            i = self.parent[i]
+        return i
 
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    cpdef bint join(self, tuple i1, tuple j1):
-        cdef int i 
-        cdef int j
-
-        i = ttoi(i1)
-        j = ttoi(j1)
-
+    cdef bint _join(self, int i, int j) noexcept nogil:
+        """
+        Join the groups of two points given by their integer index and log
+        the change so it can be undone by _rollback.
+        """
         cdef int root_i, root_j
         root_i = self._find(i)
         root_j = self._find(j)
-        if root_i != root_j:
-            if self.rank[root_i] < self.rank[root_j]:
-                self.parent[root_i] = root_j
-                return True
-            elif self.rank[root_i] > self.rank[root_j]:
-                self.parent[root_j] = root_i
-                return True
-            else:
-                self.parent[root_i] = root_j
-                self.rank[root_j] += 1
-                return True
-        else:
+        if root_i == root_j:
             return False
 
+        if self.rank[root_i] > self.rank[root_j]:
+            root_i, root_j = root_j, root_i
+        # root_i is attached below root_j
+        self.parent[root_i] = root_j
+        self.history[self.n_history] = root_i
+        if self.rank[root_i] == self.rank[root_j]:
+            self.rank[root_j] += 1
+            self.bumped[self.n_history] = 1
+        else:
+            self.bumped[self.n_history] = 0
+        self.n_history += 1
+        return True
+
     @cython.wraparound(False)
     @cython.boundscheck(False)
-    cpdef bint connected(self, tuple i1, tuple j1):
-        cdef int i 
-        cdef int j
+    cdef bint _connected(self, int i, int j) noexcept nogil:
+        return self._find(i) == self._find(j)
 
-        i = ttoi(i1)
-        j = ttoi(j1)
+    cdef int _mark(self) noexcept nogil:
+        """
+        Return the current length of the history log.
+        """
+        return self.n_history
 
-        return self._find(i) == self._find(j)
+    @cython.wraparound(False)
+    @cython.boundscheck(False)
+    cdef void _rollback(self, int mark) noexcept nogil:
+        """
+        Undo every join made since the log had the passed length.
+        """
+        cdef int root_i
+        while self.n_history > mark:
+            self.n_history -= 1
+            root_i = self.history[self.n_history]
+            if self.bumped[self.n_history]:
+                self.rank[self.parent[root_i]] -= 1
+            self.parent[root_i] = root_i
+
+    cdef int edge(self, int side) noexcept nogil:
+        """
+        Return the index of the virtual node of a board edge, side being one
+        of EDGE_TOP, EDGE_BOTTOM, EDGE_LEFT or EDGE_RIGHT.
+        """
+        return self.n_cells + side
+
+    cdef (int, int) itot(self, int i):
+        '''
+        Converts an integer to a tuple
+
+            Parameters:
+                    i (int): Integer to be converted
+
+            Returns:
+                    (tuple): Tuple with the integer
+        '''
+        return (i // self.size, i % self.size)
+
+    cdef int ttoi(self, (int, int) t) except -1:
+        '''
+        Converts a tuple to an integer
+
+            Parameters:
+                    t (tuple): Tuple to be converted
+
+            Returns:
+                    (int): Integer with the tuple
+        '''
+        if not (0 <= t[0] < self.size and 0 <= t[1] < self.size):
+            raise IndexError("Cell out of the board")
+        return t[0] * self.size + t[1]
 
+    cpdef bint join(self, tuple i1, tuple j1):
+        return self._join(self.ttoi(i1), self.ttoi(j1))
+
+    cpdef bint connected(self, tuple i1, tuple j1):
+        return self._connected(self.ttoi(i1), self.ttoi(j1))
@@ -1,3 +1,8 @@
+from threading import Thread
+
+from meta import GameMeta
+
+
 cpdef tuple extract_last_move_from_board(board):
     '''
     Decides if it is advantageous to swap
@@ -18,3 +23,63 @@ cpdef tuple extract_last_move_from_board(board):
     return (-1, -1)
 
 
+
+
+class Ponderer:
+    """
+    Search on the opponent's clock. While the agent waits for the next
+    protocol message the engine keeps searching from its current root in a
+    background thread, the statistics stay in its tree and the opponent's
+    reply reroots onto them as a normal move.
+    ...
+
+    Attributes
+    ----------
+    time_limit : int
+        upper bound of a single ponder in seconds
+    engine : object
+        engine searching in the background, it must stop searching when
+        its interrupted attribute is set
+    thread : Thread
+        background search, None when not pondering
+
+    Methods
+    -------
+    start(engine):
+        Start searching with the passed engine in the background.
+    stop():
+        Interrupt the background search and wait for it to return.
+    """
+
+    def __init__(self, time_limit=GameMeta.MAXIMUM_TIME):
+        """
+        Parameters:
+                time_limit (int): upper bound of a single ponder in seconds,
+                                  the whole game budget by default
+        """
+        self.time_limit = time_limit
+        self.engine = None
+        self.thread = None
+
+    def start(self, engine):
+        """
+        Start searching with the passed engine in the background.
+        """
+        self.stop()
+        self.engine = engine
+        self.engine.interrupted = False
+        self.thread = Thread(target=self.engine.search, args=(self.time_limit,), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Interrupt the background search and wait for it to return, the engine
+        can be used again afterwards.
+        """
+        if self.thread is None:
+            return
+        self.engine.interrupted = True
+        self.thread.join()
+        self.engine.interrupted = False
+        self.engine = None
+        self.thread = None
@@ -1,5 +1,6 @@
 from Tile import Tile
 from Colour import Colour
+from Geometry import Geometry
 
 
 class Board:
@@ -9,6 +10,7 @@ class Board:
         super().__init__()
 
         self._board_size = board_size
+        self._geometry = Geometry.of(board_size)
 
         self._tiles = []
         for i in range(board_size):
@@ -19,6 +21,16 @@ class Board:
 
         self._winner = None
 
+        # union-find over the tiles followed by one virtual tile per edge,
+        # red joins top with bottom and blue joins left with right
+        tile_count = self._geometry.get_tile_count()
+        self._top = tile_count
+        self._bottom = tile_count + 1
+        self._left = tile_count + 2
+        self._right = tile_count + 3
+        self._parent = list(range(tile_count + 4))
+        self._group_size = [1] * (tile_count + 4)
+
     def from_string(string_input, board_size=11, bnf=True):
         """Loads a board from a string representation. If bnf=True, it will
         load a protocol-formatted string. Otherwise, it will load from a
@@ -42,70 +54,77 @@ class Board:
         return b
 
     def has_ended(self):
-        """Checks if the game has ended. It will attempt to find a red chain
-        from top to bottom or a blue chain from left to right of the board.
+        """Checks if the game has ended. Groups of stones are joined as they
+        are placed, so this only reads the winner found by the last stone.
         """
 
-        # Red
-        # for all top tiles, check if they connect to bottom
-        for idx in range(self._board_size):
-            tile = self._tiles[0][idx]
-            if (not tile.is_visited() and
-                tile.get_colour() == Colour.RED and
-                    self._winner is None):
-                self.DFS_colour(0, idx, Colour.RED)
-        # Blue
-        # for all left tiles, check if they connect to right
-        for idx in range(self._board_size):
-            tile = self._tiles[idx][0]
-            if (not tile.is_visited() and
-                tile.get_colour() == Colour.BLUE and
-                    self._winner is None):
-                self.DFS_colour(idx, 0, Colour.BLUE)
-
-        # un-visit tiles
-        self.clear_tiles()
-
         return self._winner is not None
 
-    def clear_tiles(self):
-        """Clears the visited status from all tiles."""
+    def _find(self, idx):
+        """Returns the representative of the group of a tile, halving the
+        path on the way.
+        """
+
+        parent = self._parent
+        while (parent[idx] != idx):
+            parent[idx] = parent[parent[idx]]
+            idx = parent[idx]
+        return idx
 
-        for line in self._tiles:
-            for tile in line:
-                tile.clear_visit()
+    def _join(self, a, b):
+        """Merges the groups of two tiles, the smaller under the larger."""
 
-    def DFS_colour(self, x, y, colour):
-        """A recursive DFS method that iterates through connected same-colour
-        tiles until it finds a bottom tile (Red) or a right tile (Blue).
+        a = self._find(a)
+        b = self._find(b)
+        if (a == b):
+            return
+        if (self._group_size[a] < self._group_size[b]):
+            a, b = b, a
+        self._parent[b] = a
+        self._group_size[a] += self._group_size[b]
+
+    def _connect(self, x, y, colour):
+        """Joins a newly coloured tile with its edges and with neighbouring
+        tiles of the same colour, then checks if it completed a chain.
         """
 
-        self._tiles[x][y].visit()
-
-        # win conditions
+        idx = self._geometry.index(x, y)
+        edges = self._geometry.edges(idx)
         if (colour == Colour.RED):
-            if (x == self._board_size-1):
-                self._winner = colour
+            if (edges & Geometry.TOP):
+                self._join(self._top, idx)
+            if (edges & Geometry.BOTTOM):
+                self._join(self._bottom, idx)
         elif (colour == Colour.BLUE):
-            if (y == self._board_size-1):
-                self._winner = colour
+            if (edges & Geometry.LEFT):
+                self._join(self._left, idx)
+            if (edges & Geometry.RIGHT):
+                self._join(self._right, idx)
         else:
             return
 
-        # end condition
-        if (self._winner is not None):
-            return
+        for n in self._geometry.neighbours(idx):
+            x_n, y_n = self._geometry.coordinates(n)
+            if (self._tiles[x_n][y_n].get_colour() == colour):
+                self._join(n, idx)
+
+        if (self._winner is None):
+            if (self._find(self._top) == self._find(self._bottom)):
+                self._winner = Colour.RED
+            elif (self._find(self._left) == self._find(self._right)):
+                self._winner = Colour.BLUE
 
-        # visit neighbours
-        for idx in range(Tile.NEIGHBOUR_COUNT):
-            x_n = x + Tile.I_DISPLACEMENTS[idx]
-            y_n = y + Tile.J_DISPLACEMENTS[idx]
-            if (x_n >= 0 and x_n < self._board_size and
-                    y_n >= 0 and y_n < self._board_size):
-                neighbour = self._tiles[x_n][y_n]
-                if (not neighbour.is_visited() and
-                        neighbour.get_colour() == colour):
-                    self.DFS_colour(x_n, y_n, colour)
+    def _reconnect(self):
+        """Rebuilds the groups from scratch, needed only when a tile that
+        already had a colour is changed since groups can not be split.
+        """
+
+        self._parent = list(range(len(self._parent)))
+        self._group_size = [1] * len(self._group_size)
+        self._winner = None
+        for x, line in enumerate(self._tiles):
+            for y, tile in enumerate(line):
+                self._connect(x, y, tile.get_colour())
 
     def print_board(self, bnf=True):
         """Returns the string representation of a board. If bnf=True, the
@@ -140,7 +159,13 @@ class Board:
         return self._tiles
 
     def set_tile_colour(self, x, y, colour):
-        self._tiles[x][y].set_colour(colour)
+        tile = self._tiles[x][y]
+        previous = tile.get_colour()
+        tile.set_colour(colour)
+        if (previous is None):
+            self._connect(x, y, colour)
+        elif (previous != colour):
+            self._reconnect()
 
 
 if (__name__ == "__main__"):
@@ -36,7 +36,8 @@ class Game():
         log=True,
         print_protocol=False,
         kill_bots=True,
-        silent_bots=True
+        silent_bots=True,
+        port=Protocol.PORT
     ):
         self._turn = 1  # current turn count
         self._board = Board(board_size)
@@ -65,6 +66,8 @@ class Game():
         self._players[Colour.BLUE]['run string'] = player2['run string']
         self._players[Colour.BLUE]['hyperparameters'] = player2['hyperparameters']
 
+        # port=0 lets the system pick a free port for this game
+        self._protocol = Protocol(port=port)
         self._kill_bots = kill_bots
         self._silent_bots = silent_bots
 
@@ -202,19 +205,19 @@ class Game():
 
         if (protocol_message != ""):
             if (start):
-                Protocol.send_message(
+                self._protocol.send_message(
                     Colour.RED, f"{protocol_message}R\n",
                     verbose=self._print_protocol
                 )
-                Protocol.send_message(
+                self._protocol.send_message(
                     Colour.BLUE, f"{protocol_message}B\n"
                 )
             else:
-                Protocol.send_message(
+                self._protocol.send_message(
                     Colour.RED, protocol_message,
                     verbose=self._print_protocol
                 )
-                Protocol.send_message(
+                self._protocol.send_message(
                     Colour.BLUE, protocol_message
                 )
 
@@ -231,7 +234,7 @@ class Game():
         time_left = Game.MAXIMUM_TIME - self._players[self._player]['time']
         time_left = max(time_left, 0)
 
-        answer, move_time = Protocol.get_message(
+        answer, move_time = self._protocol.get_message(
             self._player,
             time_left,
             self._print_protocol
@@ -283,7 +286,7 @@ class Game():
         self._has_swapped = True
         self._player = Colour.opposite(self._player)
 
-        Protocol.swap()
+        self._protocol.swap()
 
     def _flip_turn(self, move_time):
         """Increments the statistics of the current player, then
@@ -437,7 +440,7 @@ class Game():
         print(final_message, file=stderr)
 
         # close communications
-        Protocol.close(
+        self._protocol.close(
             kill_children=self._kill_bots,
             verbose=self._print_protocol
         )
@@ -447,9 +450,9 @@ class Game():
         connects to them. If either connection fails, the game
         will not start.
         """
-        Protocol.start()
+        self._protocol.start()
 
-        self._has_connected = Protocol.accept_connection(
+        self._has_connected = self._protocol.accept_connection(
             s1, name1, Game.MAXIMUM_TIME,
             self._silent_bots, self._print_protocol
         )
@@ -457,7 +460,7 @@ class Game():
             self._players[Colour.RED]['time'] = Game.MAXIMUM_TIME
             return
 
-        self._has_connected = Protocol.accept_connection(
+        self._has_connected = self._protocol.accept_connection(
             s2, name2, Game.MAXIMUM_TIME,
             self._silent_bots, self._print_protocol
         )
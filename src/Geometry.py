@@ -0,0 +1,114 @@
+from Tile import Tile
+
+
+class Geometry:
+    """Precomputed neighbour, edge and coordinate tables of one board size.
+
+    Tiles are addressed by the index x * board_size + y. The tables have the
+    same flat layout as the geometry module of the agents: NEIGHBOUR_COUNT
+    entries per tile padded with NO_NEIGHBOUR, and one set of edge flags per
+    tile. Geometries are shared, get them with Geometry.of(board_size).
+    """
+
+    # padding after the real neighbours of a border tile
+    NO_NEIGHBOUR = -1
+
+    # edge flags, one bit per edge of the board a tile lies on
+    TOP = 1
+    BOTTOM = 2
+    LEFT = 4
+    RIGHT = 8
+
+    # geometries already built, one per board size
+    _geometries = {}
+
+    def __init__(self, board_size=11):
+        super().__init__()
+
+        self._board_size = board_size
+        self._tile_count = board_size * board_size
+
+        self._rows = [idx // board_size for idx in range(self._tile_count)]
+        self._columns = [idx % board_size for idx in range(self._tile_count)]
+
+        self._neighbours = []
+        self._edges = []
+        for x in range(board_size):
+            for y in range(board_size):
+                count = 0
+                for idx in range(Tile.NEIGHBOUR_COUNT):
+                    x_n = x + Tile.I_DISPLACEMENTS[idx]
+                    y_n = y + Tile.J_DISPLACEMENTS[idx]
+                    if (x_n >= 0 and x_n < board_size and
+                            y_n >= 0 and y_n < board_size):
+                        self._neighbours.append(x_n * board_size + y_n)
+                        count += 1
+                self._neighbours.extend(
+                    [Geometry.NO_NEIGHBOUR] * (Tile.NEIGHBOUR_COUNT - count))
+
+                edges = 0
+                if (x == 0):
+                    edges |= Geometry.TOP
+                if (x == board_size-1):
+                    edges |= Geometry.BOTTOM
+                if (y == 0):
+                    edges |= Geometry.LEFT
+                if (y == board_size-1):
+                    edges |= Geometry.RIGHT
+                self._edges.append(edges)
+
+        # neighbours of each tile without the padding, for iteration
+        self._neighbour_lists = [
+            tuple(n for n in self._neighbours[
+                idx * Tile.NEIGHBOUR_COUNT:(idx+1) * Tile.NEIGHBOUR_COUNT]
+                if n != Geometry.NO_NEIGHBOUR)
+            for idx in range(self._tile_count)
+        ]
+
+    def of(board_size):
+        """Returns the geometry of a board size, building it on first use."""
+
+        geometry = Geometry._geometries.get(board_size)
+        if (geometry is None):
+            geometry = Geometry(board_size)
+            Geometry._geometries[board_size] = geometry
+        return geometry
+
+    def index(self, x, y):
+        """Returns the index of the tile at the given coordinates."""
+
+        return x * self._board_size + y
+
+    def coordinates(self, idx):
+        """Returns the coordinates of the tile at the given index."""
+
+        return (self._rows[idx], self._columns[idx])
+
+    def neighbours(self, idx):
+        """Returns the indices of the neighbours of a tile."""
+
+        return self._neighbour_lists[idx]
+
+    def edges(self, idx):
+        """Returns the edge flags of a tile."""
+
+        return self._edges[idx]
+
+    def get_size(self):
+        return self._board_size
+
+    def get_tile_count(self):
+        return self._tile_count
+
+    def get_neighbour_table(self):
+        return self._neighbours
+
+    def get_edge_table(self):
+        return self._edges
+
+
+if (__name__ == "__main__"):
+    g = Geometry.of(3)
+    print(g.get_neighbour_table())
+    print(g.get_edge_table())
+    print(g.neighbours(g.index(1, 1)), g.coordinates(5))
@@ -1,3 +1,4 @@
+import os
 import socket
 import subprocess
 from sys import platform, stdout
@@ -7,30 +8,45 @@ import shlex
 
 
 class Protocol():
-    """Static class that handles protocol communication between engine and
-    agents. Uses a TCP socket.
+    """Handles protocol communication between engine and agents of one
+    game. Uses a TCP socket.
+
+    Each game has its own Protocol, so one process can host several games
+    at once. With port=0 the server binds an ephemeral port chosen by the
+    system; agents learn the port from the HEX_PORT environment variable,
+    and a run string may also pass it on the command line with {port}.
     """
 
     HOST = "127.0.0.1"
     PORT = 1234
-    s = None
-    sockets = {Colour.RED: {}, Colour.BLUE: {}}
+    # environment variable telling the agents the port of their game
+    PORT_VARIABLE = "HEX_PORT"
+
+    def __init__(self, host=HOST, port=PORT):
+        super().__init__()
 
-    @staticmethod
-    def start():
+        self.host = host
+        self.port = port
+        self.s = None
+        self.sockets = {Colour.RED: {}, Colour.BLUE: {}}
+
+    def start(self):
         """Sets up a TCP server. The socket reuse address option is
         enabled because Linux does not close sockets immediately on
         application exit. This would cause issues with successive
-        matches.
+        matches. Returns the port, which is only known after binding when
+        an ephemeral port was asked for.
         """
 
-        Protocol.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        Protocol.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        Protocol.s.bind((Protocol.HOST, Protocol.PORT))
-        Protocol.s.listen()
+        self.s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.s.bind((self.host, self.port))
+        self.s.listen()
+        self.port = self.s.getsockname()[1]
+        return self.port
 
-    @staticmethod
     def accept_connection(
+        self,
         run_s,
         name,
         timeout_ns=30*10**9,
@@ -42,14 +58,19 @@ class Protocol():
         was made, False otherwise.
         """
 
+        # tell the agent where to connect
+        run_s = run_s.replace("{port}", str(self.port))
+        env = dict(os.environ)
+        env[Protocol.PORT_VARIABLE] = str(self.port)
+
         # separate run_s into a list of arguments to be used in a linux shell
         if (platform != "win32"):
             run_s = shlex.split(run_s)
 
         # determine the colour of the new agent
-        if len(Protocol.sockets[Colour.RED].keys()) == 0:
+        if len(self.sockets[Colour.RED].keys()) == 0:
             colour = Colour.RED
-        elif len(Protocol.sockets[Colour.BLUE].keys()) == 0:
+        elif len(self.sockets[Colour.BLUE].keys()) == 0:
             colour = Colour.BLUE
         else:
             raise ValueError("Too many agents specified.")
@@ -61,13 +82,15 @@ class Protocol():
             output = subprocess.DEVNULL
 
         # start the agent
-        t = subprocess.Popen(run_s, stdout=output, stderr=output, shell=False)
+        t = subprocess.Popen(
+            run_s, stdout=output, stderr=output, shell=False, env=env
+        )
 
         # wait for a connection
         try:
-            Protocol.s.settimeout(timeout_ns/10**9)
-            conn, addr = Protocol.s.accept()
-            Protocol.s.settimeout(socket.getdefaulttimeout())
+            self.s.settimeout(timeout_ns/10**9)
+            conn, addr = self.s.accept()
+            self.s.settimeout(socket.getdefaulttimeout())
             if verbose:
                 print(f"Connected {name} at {addr}")
         except socket.timeout:
@@ -76,44 +99,43 @@ class Protocol():
                 print(f"{name} never connected.")
 
         # set up associated arguments
-        Protocol.sockets[colour]['name'] = name
-        Protocol.sockets[colour]['thread'] = t
-        Protocol.sockets[colour]['conn'] = conn
-        Protocol.sockets[colour]['addr'] = addr
+        self.sockets[colour]['name'] = name
+        self.sockets[colour]['thread'] = t
+        self.sockets[colour]['conn'] = conn
+        self.sockets[colour]['addr'] = addr
 
         return conn is not None
 
-    @staticmethod
-    def get_message(colour, timeout_ns=30*10**9, verbose=False):
+    def get_message(self, colour, timeout_ns=30*10**9, verbose=False):
         """Waits for a message from the given colour agent for the specified
         length of time. Returns the text and the associated wait time.
         """
 
         try:
-            Protocol.sockets[colour]['conn'].settimeout(timeout_ns/10**9)
+            self.sockets[colour]['conn'].settimeout(timeout_ns/10**9)
             move_time = time_ns()
-            data = Protocol.sockets[colour]['conn'].recv(1024)
+            data = self.sockets[colour]['conn'].recv(1024)
             move_time = time_ns() - move_time
-            Protocol.sockets[colour]['conn'].settimeout(
+            self.sockets[colour]['conn'].settimeout(
                 socket.getdefaulttimeout()
             )
 
         except socket.timeout:
             if verbose:
                 print(
-                    f"{Protocol.sockets[colour]['name']} timed out. " +
+                    f"{self.sockets[colour]['name']} timed out. " +
                     "Nothing received."
                 )
             return ("NO MESSAGE", -1)
         except ConnectionResetError:
             if verbose:
                 print(
-                    f"{Protocol.sockets[colour]['name']} disconnected early.")
+                    f"{self.sockets[colour]['name']} disconnected early.")
             return ("NO MESSAGE", -1)
         except Exception:
             if verbose:
                 print(
-                    f"{Protocol.sockets[colour]['name']} socket " +
+                    f"{self.sockets[colour]['name']} socket " +
                     "ended unexpectedly."
                 )
             return ("NO MESSAGE", -1)
@@ -121,18 +143,17 @@ class Protocol():
         if verbose:
             print(
                 f"Received {data.decode('utf-8').strip()} from " +
-                f"{Protocol.sockets[colour]['name']} in " +
+                f"{self.sockets[colour]['name']} in " +
                 f"~{int(move_time/10**4)/10**5}s."
             )
 
         return (data.decode("utf-8"), move_time)
 
-    @staticmethod
-    def send_message(colour, message, verbose=False):
+    def send_message(self, colour, message, verbose=False):
         """Sends the specified message to the specified colour agent."""
 
         try:
-            Protocol.sockets[colour]['conn'].sendall(bytes(message, "utf-8"))
+            self.sockets[colour]['conn'].sendall(bytes(message, "utf-8"))
             if verbose:
                 print("Sent", message, end="")
 
@@ -140,18 +161,16 @@ class Protocol():
             if verbose:
                 print(
                     f"Failed to send {message.strip()} to " +
-                    f"{Protocol.sockets[colour]['name']}."
+                    f"{self.sockets[colour]['name']}."
                 )
 
-    @staticmethod
-    def swap():
+    def swap(self):
         """Switches the colours of the two agents."""
 
-        Protocol.sockets[Colour.RED], Protocol.sockets[Colour.BLUE] = \
-            Protocol.sockets[Colour.BLUE], Protocol.sockets[Colour.RED]
+        self.sockets[Colour.RED], self.sockets[Colour.BLUE] = \
+            self.sockets[Colour.BLUE], self.sockets[Colour.RED]
 
-    @staticmethod
-    def close(kill_children=True, verbose=True):
+    def close(self, kill_children=True, verbose=True):
         """Closes the connection. If kill_children=True, it will also forcibly
         terminate the agents. Otherwise, it will block the thread until they
         have terminated on their own.
@@ -159,7 +178,7 @@ class Protocol():
 
         # close sockets and agents
         for colour in Colour:
-            x = Protocol.sockets[colour]
+            x = self.sockets[colour]
             if (len(x.keys()) == 0):
                 continue
 
@@ -186,11 +205,11 @@ class Protocol():
                     print(
                         f"{x['name']} connection was already closed.")
             
-            Protocol.sockets[colour] = {}
+            self.sockets[colour] = {}
 
         # close server
         try:
-            Protocol.s.close()
+            self.s.close()
         except AttributeError:
             if (verbose):
                 print("Socket was not open.")
@@ -203,14 +222,15 @@ if __name__ == "__main__":
         "python agents/NaiveAgent.py"
     ]
 
-    Protocol.start()
+    protocol = Protocol(port=0)
+    protocol.start()
 
-    Protocol.accept_connection(commands[2], verbose=True)
-    Protocol.accept_connection(commands[2], verbose=True)
-    Protocol.send_message(Colour.RED, "START;2;R", verbose=True)
-    Protocol.get_message(Colour.RED, verbose=True)
-    Protocol.send_message(Colour.BLUE, "START;2;B", verbose=True)
-    Protocol.send_message(Colour.RED, "END", verbose=True)
-    Protocol.send_message(Colour.BLUE, "END", verbose=True)
+    protocol.accept_connection(commands[2], "Naive1", verbose=True)
+    protocol.accept_connection(commands[2], "Naive2", verbose=True)
+    protocol.send_message(Colour.RED, "START;2;R", verbose=True)
+    protocol.get_message(Colour.RED, verbose=True)
+    protocol.send_message(Colour.BLUE, "START;2;B", verbose=True)
+    protocol.send_message(Colour.RED, "END", verbose=True)
+    protocol.send_message(Colour.BLUE, "END", verbose=True)
 
-    Protocol.close()
+    protocol.close()
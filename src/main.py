@@ -7,6 +7,7 @@ from sys import argv, platform
 from os.path import realpath, sep
 
 from Game import Game
+from Protocol import Protocol
 
 
 def main():
@@ -19,6 +20,7 @@ def main():
     double = ("-d" in argv or "-double" in argv)
 
     board_size = 11
+    port = Protocol.PORT
     agents = []
 
     for argument in argv:
@@ -35,6 +37,17 @@ def main():
                     "format. Aborted."
                 )
                 return
+        if (argument.startswith("port=")):
+            try:
+                port = int(argument.split("=")[1])
+                if (port < 0 or port > 65535):
+                    raise Exception("Port out of range.")
+            except Exception as e:
+                print(
+                    "ERROR: Port argument is not in valid",
+                    "format. Aborted."
+                )
+                return
 
     if (len(agents) > 2):
         print("ERROR: Too many agents specified. Aborted.")
@@ -102,7 +115,8 @@ def main():
         log=log,
         print_protocol=print_protocol,
         kill_bots=kill_bots,
-        silent_bots=silent_bots
+        silent_bots=silent_bots,
+        port=port
     )
     g.run()
 